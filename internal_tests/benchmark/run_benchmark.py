@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+
+'''
+Program Name: run_benchmark.py
+Contact(s): George McCabe
+Abstract: Measures the time METplus itself spends running a use case,
+          with stub MET executables that finish immediately
+History Log:  Initial version
+Usage: run_benchmark.py [-s scenario] [-n sizes] [-l leads] [-t storms]
+                        [-c conf] [-w work_dir] [-o report.json] [-k] [-v]
+Parameters: see usage()
+Input Files: synthetic data generated under the work directory
+Output Files: JSON report, if -o is given
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import sys
+import csv
+import json
+import time
+import getopt
+import shutil
+import datetime
+import tempfile
+import subprocess
+
+'''!@namespace run_benchmark
+@brief Orchestration benchmark for master_metplus.
+
+Builds a MET_BUILD_BASE whose tools are all links to stub_met.sh, which
+writes a one line file for each output and exits, and a synthetic input
+tree for one of the use cases:
+
+  qpf               PcpCombine, RegridDataPlane, GridStat: PHPT model
+                    files and hourly QPE observations
+  feature_relative  TcPairs, ExtractTiles, SeriesByLead: adeck/bdeck
+                    track files and GFS forecast and analysis files
+
+master_metplus.py runs the use case conf with TRACE and USAGE_REPORT
+turned on, and the trace is totalled by wrapper and by task.  Time in
+command spans is the cost of starting the stubs; the rest of a wrapper's
+time, when none of its commands is running, is spent in METplus itself:
+walking directories, filling templates, reading config values.
+
+The size of a run is its number of init times.  Given several sizes, the
+benchmark runs each one and flags a wrapper whose METplus time per
+command grows by more than the -g factor from the smallest size to the
+largest, which is how quadratic behaviour shows up.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+METPLUS_BASE = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+
+'''!@var STUB_TOOLS
+Tools linked to stub_met.sh.  The MET tools go in MET_BUILD_BASE/bin,
+the others are set in the [exe] section.'''
+STUB_TOOLS = ['tc_pairs', 'tc_stat', 'regrid_data_plane', 'series_analysis',
+              'plot_data_plane', 'pcp_combine', 'grid_stat']
+STUB_EXES = {'WGRIB2': 'wgrib2', 'NCAP2_EXE': 'ncap2',
+             'NCDUMP_EXE': 'ncdump', 'CONVERT_EXE': 'convert'}
+SYSTEM_EXES = {'RM_EXE': 'rm', 'CUT_EXE': 'cut', 'TR_EXE': 'tr',
+               'EGREP_EXE': 'egrep'}
+
+# spans that hold the work of one wrapper
+WRAPPER_CATEGORIES = ('process', 'task')
+
+
+def usage():
+    print('''
+Usage: run_benchmark.py [options]
+    -s|--scenario <name>    qpf or feature_relative (default qpf)
+    -n|--sizes <n,n,...>    number of init times to run, one run per size
+                            (default 4).  feature_relative rounds up to
+                            whole days of 4 init times.
+    -l|--leads <n>          number of forecast leads (default 6)
+    -t|--storms <n>         storms per init time, feature_relative only
+                            (default 2)
+    -c|--config <file>      extra conf file for every run, e.g. to set
+                            LOOP_METHOD or USE_TASK_FARM (repeatable)
+    -p|--python <exe>       python that runs master_metplus.py
+                            (default: this python)
+    -g|--growth <factor>    flag a wrapper whose METplus time per command
+                            grows by more than this from the smallest size
+                            to the largest (default 2.0)
+    -w|--work-dir <dir>     where to build the data and run (default: a
+                            new temporary directory)
+    -o|--output <file>      write the report as JSON
+    -k|--keep               keep the work directory
+    -v|--verbose            also print the time of every task
+    -h|--help               display this usage statement
+''')
+
+
+def _which(name):
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        exe = os.path.join(path, name)
+        if os.path.isfile(exe) and os.access(exe, os.X_OK):
+            return exe
+    return name
+
+
+def _touch(path, lines=None):
+    """!Creates an input file and its directory
+        @param path the file to create
+        @param lines contents of the file, default one line with its name"""
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(path, 'w') as input_file:
+        input_file.writelines(lines or [os.path.basename(path) + '\n'])
+
+
+def make_met_build_base(met_dir):
+    """!Creates met_dir/bin with a link to stub_met.sh for every tool
+        @param met_dir the directory to use as MET_BUILD_BASE
+        @returns dict of [exe] settings for the stubs and system tools"""
+    bin_dir = os.path.join(met_dir, 'bin')
+    os.makedirs(bin_dir)
+    os.makedirs(os.path.join(met_dir, 'share', 'met'))
+    stub = os.path.join(BENCHMARK_DIR, 'stub_met.sh')
+    for tool in STUB_TOOLS + list(STUB_EXES.values()):
+        os.symlink(stub, os.path.join(bin_dir, tool))
+    exes = dict((key, os.path.join(bin_dir, tool))
+                for key, tool in STUB_EXES.items())
+    exes.update((key, _which(tool)) for key, tool in SYSTEM_EXES.items())
+    return exes
+
+
+def make_qpf_data(data_dir, output_dir, init_times, leads):
+    """!Writes PHPT model files and hourly QPE files that cover every valid
+        time of the run
+        @returns (conf settings, environment settings)"""
+    lead_hours = range(6, 6 + leads)
+    model_dir = os.path.join(data_dir, 'PHPT')
+    qpe_dir = os.path.join(data_dir, 'QPE_Data')
+    qpe_native_dir = os.path.join(data_dir, 'QPE_Data', 'netcdf')
+    valid_times = set()
+    for init in init_times:
+        for lead in lead_hours:
+            _touch(os.path.join(model_dir, init.strftime('%Y%m%d'),
+                                init.strftime('%Y%m%d_i%H') +
+                                '_f%03d_HRRRTLE_PHPT.grb2' % lead))
+            for hour in range(6):
+                valid_times.add(init + datetime.timedelta(hours=lead - hour))
+    for valid in valid_times:
+        name = valid.strftime('qpe_%Y%m%d%H')
+        _touch(os.path.join(qpe_dir, name + '.grd'))
+        # the converted file, so GempakToCF is not needed
+        _touch(os.path.join(qpe_native_dir, name + '.nc'))
+    grid = os.path.join(data_dir, 'grid.nc')
+    _touch(grid)
+
+    settings = {
+        'config': {
+            'LOOP_METHOD': 'times',
+            'INIT_TIME_FMT': '%Y%m%d%H',
+            'INIT_BEG': init_times[0].strftime('%Y%m%d%H'),
+            'INIT_END': init_times[-1].strftime('%Y%m%d%H'),
+            'INIT_INC': '3600',
+            'LEAD_SEQ': ', '.join(str(lead) for lead in lead_hours),
+            'FCST_VARS': 'APCP',
+            'APCP_ACCUM': '06',
+            'APCP_OBTYPE': 'QPE',
+            'MODEL_TYPE': 'PHPT',
+            'PHPT_INPUT_DIR': model_dir,
+            'PHPT_BUCKET_DIR': os.path.join(output_dir, 'PHPT', 'bucket'),
+            'PHPT_FORECASTS': ', '.join(str(lead) for lead in
+                                        range(0, lead_hours[-1] + 1)),
+            'QPE_INPUT_DIR': qpe_dir,
+            'QPE_NATIVE_DIR': qpe_native_dir,
+            'QPE_ACCUM': '1',
+            'QPE_1_FIELD_NAME': 'P01M_NONE',
+            'VERIFICATION_GRID': grid,
+            'CONFIG_DIR': data_dir,
+            'MET_CONFIG_GSP': os.path.join(data_dir, 'GridStatConfig_PROB'),
+            'MET_CONFIG_GSM': os.path.join(data_dir, 'GridStatConfig_MEAN'),
+        },
+    }
+    return settings, {}
+
+
+def make_feature_relative_data(data_dir, init_times, leads, storms):
+    """!Writes adeck and bdeck files for every storm and init time, and
+        GFS forecast and analysis files for every init time and lead
+        @returns (conf settings, environment settings)"""
+    lead_hours = range(0, 6 * leads, 6)
+    track_dir = os.path.join(data_dir, 'track_data')
+    model_dir = os.path.join(data_dir, 'model_data')
+    for init in init_times:
+        ymdh = init.strftime('%Y%m%d%H')
+        for storm in range(1, storms + 1):
+            for prefix in ('amlq', 'bmlq'):
+                deck = os.path.join(track_dir, init.strftime('%Y%m'),
+                                    '%s%s.gfso.%04d' % (prefix, ymdh, storm))
+                _touch(deck, ['ML, %04d, %s, 03, GFSO, %03d, 450N, '
+                              '1200W, -99\n' % (storm, ymdh, lead)
+                              for lead in lead_hours])
+        for lead in lead_hours:
+            valid = init + datetime.timedelta(hours=lead)
+            _touch(os.path.join(model_dir, init.strftime('%Y%m%d'),
+                                init.strftime('gfs_4_%Y%m%d_%H00_') +
+                                '%03d.grb2' % lead))
+            _touch(os.path.join(model_dir, valid.strftime('%Y%m%d'),
+                                valid.strftime('gfs_4_%Y%m%d_%H00_000.grb2')))
+
+    days = (init_times[-1] - init_times[0]).days
+    settings = {
+        'dir': {
+            'TRACK_DATA_DIR': track_dir,
+            'MODEL_DATA_DIR': model_dir,
+            'TRACK_DATA_SUBDIR_MOD': '{OUTPUT_BASE}/track_data_atcf',
+        },
+        'config': {
+            'LOOP_METHOD': 'processes',
+            'PROCESS_LIST': 'TcPairs, ExtractTiles, SeriesByLead',
+            'INIT_TIME_FMT': '%Y%m%d',
+            'INIT_BEG': init_times[0].strftime('%Y%m%d'),
+            'INIT_END': (init_times[0] +
+                         datetime.timedelta(days=days)).strftime('%Y%m%d'),
+            'INIT_INC': '21600',
+            'INIT_HOUR_END': '18',
+            'VAR_LIST': 'TMP/P850, HGT/P500',
+            'STAT_LIST': 'TOTAL, FBAR',
+            'EXTRACT_TILES_FILTER_OPTS': '-basin ML',
+            'SERIES_ANALYSIS_FILTER_OPTS': '',
+            'FHR_BEG': '0',
+            'FHR_END': str(lead_hours[-1]),
+            'FHR_INC': '6',
+            'FHR_GROUP_BEG': '',
+            'FHR_GROUP_END': '',
+            'FHR_GROUP_LABELS': '',
+        },
+    }
+    # tc_pairs writes a track point for each of these leads
+    env = {'METPLUS_BENCH_LEADS': ' '.join(str(lead)
+                                           for lead in lead_hours)}
+    return settings, env
+
+
+'''!@var SCENARIOS
+Use case conf file and init time spacing of each scenario'''
+SCENARIOS = {
+    'qpf': ('use_cases/qpf/qpf.conf', datetime.datetime(2017, 5, 10), 1),
+    'feature_relative': ('use_cases/feature_relative/feature_relative.conf',
+                         datetime.datetime(2014, 12, 14), 6),
+}
+
+
+def get_init_times(scenario, size):
+    """!Returns the init times of a run with size init times"""
+    start, hours = SCENARIOS[scenario][1:]
+    if scenario == 'feature_relative':
+        # whole days from 00 to 18Z
+        size = 4 * ((size + 3) // 4)
+    return [start + datetime.timedelta(hours=hours * index)
+            for index in range(size)]
+
+
+def write_conf(filename, sections):
+    """!Writes a conf file from a dict of section -> {option: value}"""
+    with open(filename, 'w') as conf_file:
+        for section in sorted(sections):
+            conf_file.write('[' + section + ']\n')
+            for option in sorted(sections[section]):
+                conf_file.write('%s = %s\n' %
+                                (option, sections[section][option]))
+            conf_file.write('\n')
+
+
+def setup_run(scenario, work_dir, size, leads, storms):
+    """!Creates the stubs, the input data and the benchmark conf file for
+        one run
+        @returns (conf file, environment settings, init times)"""
+    data_dir = os.path.join(work_dir, 'data')
+    output_dir = os.path.join(work_dir, 'output')
+    exes = make_met_build_base(os.path.join(work_dir, 'met'))
+    init_times = get_init_times(scenario, size)
+    if scenario == 'qpf':
+        settings, env = make_qpf_data(data_dir, output_dir, init_times, leads)
+    else:
+        settings, env = make_feature_relative_data(data_dir, init_times,
+                                                   leads, storms)
+    settings.setdefault('dir', {}).update({
+        'METPLUS_BASE': METPLUS_BASE,
+        'PARM_BASE': '{METPLUS_BASE}/parm',
+        'OUTPUT_BASE': output_dir,
+        'PROJ_DIR': data_dir,
+        'MET_BUILD_BASE': os.path.join(work_dir, 'met'),
+        'TMP_DIR': os.path.join(work_dir, 'tmp'),
+    })
+    settings['exe'] = exes
+    settings['config'].update({
+        'TRACE': 'True',
+        'TRACE_FILE': '{LOG_DIR}/metplus_trace.json',
+        'USAGE_REPORT': 'True',
+        'USAGE_REPORT_FILE': '{LOG_DIR}/metplus_usage.csv',
+        'TIMING_STATS_FILE': '',
+    })
+    conf = os.path.join(work_dir, 'benchmark.conf')
+    write_conf(conf, settings)
+    return conf, env, init_times
+
+
+def run_metplus(python, conf_files, env, log_file):
+    """!Runs master_metplus.py with the given conf files
+        @returns (exit status, wall seconds)"""
+    cmd = [python, os.path.join(METPLUS_BASE, 'ush', 'master_metplus.py')]
+    for conf in conf_files:
+        cmd += ['-c', conf]
+    run_env = dict(os.environ)
+    run_env.update(env)
+    start = time.time()
+    with open(log_file, 'w') as log:
+        status = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT,
+                                 env=run_env)
+    return status, time.time() - start
+
+
+def _attribute(record, name):
+    """!Returns one attribute of a span from the trace CSV.  Only used for
+        wrapper spans, which have no command line that could contain the
+        separators."""
+    for part in record['attributes'].split(';'):
+        if part.startswith(name + '='):
+            return part[len(name) + 1:]
+    return ''
+
+
+def _owner(record, spans):
+    """!Returns the wrapper span a span ran in, and whether the span is
+        inside another command span"""
+    nested = False
+    parent = spans.get(record['parent_id'])
+    while parent is not None:
+        if parent['category'] == 'command':
+            nested = True
+        if parent['category'] in WRAPPER_CATEGORIES:
+            return parent, nested
+        parent = spans.get(parent['parent_id'])
+    return None, nested
+
+
+def _new_totals():
+    return {'seconds': 0.0, 'commands': 0, 'command_seconds': 0.0,
+            'busy_seconds': 0.0}
+
+
+def _union_seconds(intervals):
+    """!Returns the time covered by at least one of the (start, end)
+        intervals, so commands that ran at the same time count once"""
+    total = 0.0
+    covered_to = None
+    for start, end in sorted(intervals):
+        if covered_to is not None and start < covered_to:
+            if end > covered_to:
+                total += end - covered_to
+                covered_to = end
+            continue
+        total += end - start
+        covered_to = end
+    return total
+
+
+def summarize_trace(csv_file):
+    """!Totals the spans of a trace CSV by wrapper and by task
+        @returns (wrapper totals, list of task totals)"""
+    with open(csv_file) as trace_file:
+        records = list(csv.DictReader(trace_file))
+    spans = dict((record['span_id'], record) for record in records)
+    wrappers = {}
+    tasks = {}
+    for record in records:
+        if record['category'] not in WRAPPER_CATEGORIES:
+            continue
+        seconds = float(record['seconds'])
+        wrappers.setdefault(record['name'], _new_totals())['seconds'] += \
+            seconds
+        task = _new_totals()
+        task.update({'wrapper': record['name'], 'seconds': seconds,
+                     'init_time': _attribute(record, 'init_time'),
+                     'start': float(record['start'])})
+        tasks[record['span_id']] = task
+
+    # (start, end) of the commands of each task
+    intervals = dict((span_id, []) for span_id in tasks)
+    for record in records:
+        if record['category'] != 'command':
+            continue
+        owner, nested = _owner(record, spans)
+        if owner is None or nested:
+            continue
+        seconds = float(record['seconds'])
+        for totals in (wrappers[owner['name']], tasks[owner['span_id']]):
+            totals['commands'] += 1
+            totals['command_seconds'] += seconds
+        start = float(record['start'])
+        intervals[owner['span_id']].append((start, start + seconds))
+
+    # with MAX_COMMANDS > 1 or the task farm, commands overlap, so the
+    # METplus time is the time no command of the task was running
+    for span_id, task in tasks.items():
+        task['busy_seconds'] = _union_seconds(intervals[span_id])
+        wrappers[task['wrapper']]['busy_seconds'] += task['busy_seconds']
+    for totals in list(wrappers.values()) + list(tasks.values()):
+        totals['metplus_seconds'] = totals['seconds'] - \
+            totals['busy_seconds']
+    task_list = sorted(tasks.values(), key=lambda task: task.pop('start'))
+    return wrappers, task_list
+
+
+def print_wrappers(wrappers):
+    print('  %-16s %9s %9s %11s %9s %12s' %
+          ('wrapper', 'seconds', 'commands', 'cmd_seconds', 'metplus',
+           'metplus/cmd'))
+    for name in sorted(wrappers):
+        totals = wrappers[name]
+        print('  %-16s %9.3f %9d %11.3f %9.3f %12s' %
+              (name, totals['seconds'], totals['commands'],
+               totals['command_seconds'], totals['metplus_seconds'],
+               _per_command(totals)))
+
+
+def print_tasks(tasks):
+    print('  %-16s %-14s %9s %9s %9s' %
+          ('wrapper', 'init_time', 'seconds', 'commands', 'metplus'))
+    for task in tasks:
+        print('  %-16s %-14s %9.3f %9d %9.3f' %
+              (task['wrapper'], task['init_time'] or '-', task['seconds'],
+               task['commands'], task['metplus_seconds']))
+
+
+def _per_command(totals):
+    if not totals['commands']:
+        return '-'
+    return '%.4f' % (totals['metplus_seconds'] / totals['commands'])
+
+
+def check_growth(runs, growth):
+    """!Compares the METplus time per command of each wrapper in the
+        smallest and largest runs
+        @returns list of (wrapper, smallest, largest) that grew by more
+        than the growth factor"""
+    if len(runs) < 2:
+        return []
+    first = runs[0]['wrappers']
+    last = runs[-1]['wrappers']
+    flagged = []
+    for name in sorted(set(first) & set(last)):
+        if not first[name]['commands'] or not last[name]['commands']:
+            continue
+        small = first[name]['metplus_seconds'] / first[name]['commands']
+        large = last[name]['metplus_seconds'] / last[name]['commands']
+        if small > 0 and large / small > growth:
+            flagged.append((name, small, large))
+    return flagged
+
+
+def main():
+    short_opts = 's:n:l:t:c:p:g:w:o:kvh'
+    long_opts = ['scenario=', 'sizes=', 'leads=', 'storms=', 'config=',
+                 'python=', 'growth=', 'work-dir=', 'output=', 'keep',
+                 'verbose', 'help']
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        return 2
+
+    scenario = 'qpf'
+    sizes = [4]
+    leads = 6
+    storms = 2
+    extra_confs = []
+    python = sys.executable
+    growth = 2.0
+    work_dir = None
+    output = None
+    keep = False
+    verbose = False
+    for k, v in opts:
+        if k in ('-s', '--scenario'):
+            scenario = v
+        elif k in ('-n', '--sizes'):
+            sizes = sorted(int(size) for size in v.split(','))
+        elif k in ('-l', '--leads'):
+            leads = int(v)
+        elif k in ('-t', '--storms'):
+            storms = int(v)
+        elif k in ('-c', '--config'):
+            extra_confs.append(os.path.abspath(v))
+        elif k in ('-p', '--python'):
+            python = v
+        elif k in ('-g', '--growth'):
+            growth = float(v)
+        elif k in ('-w', '--work-dir'):
+            work_dir = os.path.abspath(v)
+        elif k in ('-o', '--output'):
+            output = os.path.abspath(v)
+        elif k in ('-k', '--keep'):
+            keep = True
+        elif k in ('-v', '--verbose'):
+            verbose = True
+        elif k in ('-h', '--help'):
+            usage()
+            return 0
+    if scenario not in SCENARIOS:
+        print('Unknown scenario ' + scenario + ', use one of: ' +
+              ', '.join(sorted(SCENARIOS)))
+        return 2
+
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='metplus_benchmark.')
+    elif not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    use_case_conf = os.path.join(METPLUS_BASE, 'parm',
+                                 SCENARIOS[scenario][0])
+
+    runs = []
+    failed = False
+    try:
+        for size in sizes:
+            run_dir = os.path.join(work_dir, '%s.%d' % (scenario, size))
+            if os.path.exists(run_dir):
+                shutil.rmtree(run_dir)
+            os.makedirs(run_dir)
+            conf, env, init_times = setup_run(scenario, run_dir, size,
+                                              leads, storms)
+            log_file = os.path.join(run_dir, 'master_metplus.out')
+            status, wall = run_metplus(python,
+                                       [use_case_conf, conf] + extra_confs,
+                                       env, log_file)
+            print('%s: %d init times, %d leads: %.3f seconds, exit status %d'
+                  % (scenario, len(init_times), leads, wall, status))
+            trace_csv = os.path.join(run_dir, 'output', 'logs',
+                                     'metplus_trace.csv')
+            if status != 0 or not os.path.exists(trace_csv):
+                print('  master_metplus failed, see ' + log_file)
+                failed = True
+                keep = True
+                continue
+            wrappers, tasks = summarize_trace(trace_csv)
+            print_wrappers(wrappers)
+            if verbose:
+                print_tasks(tasks)
+            runs.append({'size': size,
+                         'init_times': len(init_times),
+                         'leads': leads,
+                         'storms': storms if scenario != 'qpf' else 0,
+                         'exit_status': status,
+                         'wall_seconds': wall,
+                         'wrappers': wrappers,
+                         'tasks': tasks})
+
+        flagged = check_growth(runs, growth)
+        for name, small, large in flagged:
+            print('%s: METplus time per command grew from %.4f to %.4f '
+                  'seconds between %d and %d init times' %
+                  (name, small, large, runs[0]['init_times'],
+                   runs[-1]['init_times']))
+        if output is not None:
+            with open(output, 'w') as report_file:
+                json.dump({'scenario': scenario,
+                           'created': time.strftime('%Y%m%d%H%M%S',
+                                                    time.gmtime()),
+                           'growth_limit': growth,
+                           'flagged': [name for name, _, _ in flagged],
+                           'runs': runs},
+                          report_file, indent=1, sort_keys=True)
+            print('Wrote report to ' + output)
+    finally:
+        if keep:
+            print('Work directory: ' + work_dir)
+        else:
+            shutil.rmtree(work_dir)
+
+    if failed or flagged:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
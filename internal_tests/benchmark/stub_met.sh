@@ -0,0 +1,143 @@
+#!/bin/sh
+#
+# Program Name: stub_met.sh
+# Contact(s): George McCabe
+# Abstract: Stand-in for the MET tools and the NCO, wgrib2 and convert
+#           utilities used by the orchestration benchmark
+# History Log:  Initial version
+# Usage: Linked once per tool name by run_benchmark.py.  The tool to
+#        imitate is the name the script was called by.
+# Parameters: the arguments METplus passes to the real tool
+# Input Files: tc_pairs reads nothing, tc_stat reads the .tcst files
+#              under -lookin
+# Output Files: a one line file wherever the real tool would write,
+#               except the .tcst files, the tc_stat dump file and the
+#               ncdump output, which hold the few values METplus parses
+#
+# Every stub finishes immediately, so the time a benchmark run takes is
+# the time METplus spends walking directories, expanding templates,
+# reading config values and starting processes.
+
+tool=`basename "$0"`
+
+# Creates the directory of each file and the file.  The file is not
+# empty, since prune_empty removes empty files.
+touch_output () {
+    for out in "$@"; do
+        mkdir -p "`dirname "$out"`"
+        echo "$tool" > "$out"
+    done
+}
+
+# Prints the value of an option, e.g. "option_value -out $@"
+option_value () {
+    name=$1
+    shift
+    while [ $# -gt 0 ]; do
+        if [ "$1" = "$name" ]; then
+            echo "$2"
+            return
+        fi
+        shift
+    done
+}
+
+# Prints the Nth argument that is not an option or an option value.
+# Every option is assumed to take one value.
+positional () {
+    n=$1
+    shift
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            -*) shift ;;
+            *) n=`expr $n - 1`
+               if [ $n -eq 0 ]; then
+                   echo "$1"
+                   return
+               fi ;;
+        esac
+        shift
+    done
+}
+
+# Prints the last argument
+last_arg () {
+    for arg in "$@"; do
+        last=$arg
+    done
+    echo "$last"
+}
+
+case "$tool" in
+    pcp_combine|convert|ncap2)
+        touch_output "`last_arg "$@"`"
+        ;;
+    regrid_data_plane)
+        touch_output "`positional 3 "$@"`"
+        ;;
+    plot_data_plane)
+        touch_output "`positional 2 "$@"`"
+        ;;
+    series_analysis)
+        touch_output "`option_value -out "$@"`"
+        ;;
+    grid_stat)
+        outdir=`option_value -outdir "$@"`
+        touch_output "$outdir/grid_stat_${MODEL}_${FCST_VAR}_${ACCUM}_$$.stat"
+        ;;
+    wgrib2)
+        if [ -n "`option_value -new_grid "$@"`" ]; then
+            touch_output "`last_arg "$@"`"
+        else
+            # inventory for the egrep between the two wgrib2 calls
+            echo "1:0:d=2000010100:"
+        fi
+        ;;
+    ncdump)
+        # the min, max and series count files made by ncap2 are parsed
+        # for these lines
+        echo " min = 0 ;"
+        echo " max = 1 ;"
+        ;;
+    tc_pairs)
+        # one track point per lead in METPLUS_BENCH_LEADS for the storm
+        # and init time in the adeck file name, amlqYYYYMMDDHH.gfso.NNNN
+        out=`option_value -out "$@"`.tcst
+        adeck=`basename "\`option_value -adeck "$@"\`"`
+        init=`echo "$adeck" | cut -c5-14`
+        storm=ML`echo "$init" | cut -c5-6``echo "$adeck" | sed 's/.*\.//'`
+        mkdir -p "`dirname "$out"`"
+        echo "VERSION AMODEL BMODEL STORM_ID BASIN CYCLONE STORM_NAME" \
+             "INIT LEAD VALID LINE_TYPE ALAT ALON BLAT BLON" > "$out"
+        for lead in ${METPLUS_BENCH_LEADS:-0}; do
+            ymd=`echo "$init" | cut -c1-8`
+            hh=`echo "$init" | cut -c9-10`
+            valid=`date -u -d "$ymd $hh:00 $lead hours" +%Y%m%d_%H0000`
+            printf "V6.0 GFSO BEST %s ML %s NA %s_%s0000 %02d0000 %s" \
+                   "$storm" "`echo "$adeck" | sed 's/.*\.//'`" "$ymd" \
+                   "$hh" "$lead" "$valid" >> "$out"
+            echo " TCMPR 45.0 -120.0 45.5 -120.5" >> "$out"
+        done
+        ;;
+    tc_stat)
+        # rows of the pairs under -lookin for the -init_inc time
+        lookin=`option_value -lookin "$@"`
+        init=`option_value -init_inc "$@"`
+        out=`option_value -dump_row "$@"`
+        mkdir -p "`dirname "$out"`"
+        files=`find "$lookin" -name '*.tcst' | sort`
+        if [ -z "$files" ]; then
+            : > "$out"
+        else
+            awk -v init="$init" \
+                'FNR == 1 { if (NR == 1) print; next }
+                 init == "" || index($8, init) == 1 { print }' \
+                $files > "$out"
+        fi
+        ;;
+    *)
+        echo "stub_met.sh: no stub for $tool" >&2
+        exit 1
+        ;;
+esac
+exit 0
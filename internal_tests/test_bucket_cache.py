@@ -0,0 +1,100 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from bucket_cache import BucketCache
+
+
+class TestBucketCache(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.infile = os.path.join(self.top, 'in.nc')
+        with open(self.infile, 'w') as file_handle:
+            file_handle.write('input')
+        self.cache = BucketCache(os.path.join(self.top, 'cache.json'), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def write_bucket(self, name, args=('-add', '-name APCP_06')):
+        entry = self.cache.make_entry(list(args), [(self.infile, '6')],
+                                      [], os.path.join(self.top, name))
+        with open(entry.output, 'w') as file_handle:
+            file_handle.write('bucket ' + name)
+        self.cache.record(entry)
+        return entry
+
+    def test_reuse_links_bucket(self):
+        self.write_bucket('a.nc')
+        entry = self.cache.make_entry(['-add', '-name APCP_06'],
+                                      [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'b.nc'))
+        self.assertTrue(self.cache.reuse(entry))
+        with open(entry.output) as file_handle:
+            self.assertEqual(file_handle.read(), 'bucket a.nc')
+
+    def test_different_command_or_input(self):
+        self.write_bucket('a.nc')
+        entry = self.cache.make_entry(['-add', '-name APCP_24'],
+                                      [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'b.nc'))
+        self.assertFalse(self.cache.reuse(entry))
+        with open(self.infile, 'a') as file_handle:
+            file_handle.write(' changed')
+        entry = self.cache.make_entry(['-add', '-name APCP_06'],
+                                      [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'b.nc'))
+        self.assertFalse(self.cache.reuse(entry))
+
+    def test_changed_bucket_is_not_reused(self):
+        first = self.write_bucket('a.nc')
+        with open(first.output, 'a') as file_handle:
+            file_handle.write(' changed')
+        entry = self.cache.make_entry(['-add', '-name APCP_06'],
+                                      [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'b.nc'))
+        self.assertFalse(self.cache.reuse(entry))
+
+    def test_size_limit(self):
+        self.write_bucket('a.nc', ['-name A'])
+        self.write_bucket('b.nc', ['-name B'])
+        self.write_bucket('c.nc', ['-name C'])
+        entry = self.cache.make_entry(['-name A'], [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'd.nc'))
+        self.assertFalse(self.cache.reuse(entry))
+        entry = self.cache.make_entry(['-name C'], [(self.infile, '6')], [],
+                                      os.path.join(self.top, 'd.nc'))
+        self.assertTrue(self.cache.reuse(entry))
+
+    def test_threads(self):
+        # record runs in CommandExecutor callback threads
+        cache = BucketCache(os.path.join(self.top, 'threads.json'), 1000)
+        errors = []
+
+        def record(thread):
+            try:
+                for index in range(50):
+                    entry = cache.make_entry(
+                        ['-name ' + str(thread) + '_' + str(index)],
+                        [(self.infile, '6')], [], self.infile)
+                    cache.record(entry)
+            except (IOError, OSError) as err:
+                errors.append(err)
+        threads = [threading.Thread(target=record, args=(thread,))
+                   for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache._update(lambda entries: list(entries))),
+                         200)
+
+
+if __name__ == '__main__':
+    unittest.main()
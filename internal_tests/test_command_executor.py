@@ -0,0 +1,136 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from command_executor import CommandExecutor
+from command_builder import CommandBuilder
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class FakeConfig(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getbool(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+    def getint(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+    def getstr(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+
+class TestCommandExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.logger = logging.getLogger('test_command_executor')
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        shutil.rmtree(self.top)
+
+    def test_at_most_max_commands(self):
+        log = os.path.join(self.top, 'running.log')
+        executor = CommandExecutor(2, self.logger)
+        for _ in range(5):
+            executor.submit('echo start >> ' + log + '; sleep 0.3; '
+                            'echo end >> ' + log, os.environ)
+        self.assertEqual(executor.join(), [])
+        running = 0
+        most = 0
+        with open(log) as log_file:
+            for line in log_file:
+                running += 1 if line.strip() == 'start' else -1
+                most = max(most, running)
+        self.assertEqual(most, 2)
+
+    def test_output_is_logged_together(self):
+        executor = CommandExecutor(2, self.logger)
+        env = dict(os.environ)
+        job = executor.submit('echo one; echo $WORD >&2', env)
+        # the job keeps the environment it was submitted with
+        env['WORD'] = 'changed'
+        executor.join()
+        self.assertEqual(job.output, 'one\n\n')
+        env['WORD'] = 'two'
+        job = executor.submit('echo one; echo $WORD >&2', env)
+        executor.join()
+        self.assertEqual(job.output, 'one\ntwo\n')
+        messages = [record.getMessage() for record in self.handler.records]
+        self.assertTrue(any(message.endswith(': echo one; echo $WORD >&2'
+                                             '\none\ntwo')
+                            for message in messages))
+
+    def test_failed_jobs(self):
+        executor = CommandExecutor(3, self.logger)
+        succeeded = []
+        executor.submit('true', os.environ, succeeded.append)
+        executor.submit('exit 3', os.environ, succeeded.append)
+        executor.submit('false', os.environ, succeeded.append)
+        failed = executor.join()
+        self.assertEqual(sorted(job.cmd for job in failed),
+                         ['exit 3', 'false'])
+        self.assertEqual(sorted(job.returncode for job in failed), [1, 3])
+        self.assertEqual([job.cmd for job in succeeded], ['true'])
+        # join only reports the jobs since the last join
+        self.assertEqual(executor.join(), [])
+
+    def test_failing_on_success(self):
+        executor = CommandExecutor(1, self.logger)
+
+        def on_success(job):
+            raise ValueError('bad output')
+        executor.submit('true', os.environ, on_success)
+        self.assertEqual(executor.join(), [])
+        self.assertTrue(any(record.levelno == logging.WARNING
+                            for record in self.handler.records))
+
+
+class FailingBuilder(CommandBuilder):
+    """Fails the command of every other init time"""
+    def __init__(self, p, logger):
+        super(FailingBuilder, self).__init__(p, logger)
+        self.app_name = 'test'
+        self.commands = []
+
+    def get_command(self):
+        return self.commands[-1]
+
+    def run_at_time(self, init_time):
+        self.commands.append('exit %d # %s' % (int(init_time[-2:]) % 2,
+                                               init_time))
+        self.build()
+
+
+class TestRunAllTimes(unittest.TestCase):
+
+    def test_failed_commands_are_returned(self):
+        p = FakeConfig({'MAX_COMMANDS': 2, 'INIT_TIME_FMT': '%Y%m%d%H',
+                        'INIT_BEG': '2017051000', 'INIT_END': '2017051002',
+                        'INIT_INC': 3600})
+        logger = logging.getLogger('test_run_all_times')
+        logger.addHandler(logging.NullHandler())
+        builder = FailingBuilder(p, logger)
+        self.assertEqual(builder.run_all_times(), ['exit 1 # 20170510_01'])
+        self.assertEqual(len(builder.commands), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+from command_plan import TimingStats, CommandPlan
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'benchmark'))
+import run_benchmark
+
+
+class TestTimingStats(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.filename = os.path.join(self.top, 'stats', 'timing.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def test_estimate_before_save(self):
+        stats = TimingStats(self.filename)
+        self.assertTrue(stats.estimate('grid_stat') is None)
+        stats.add('grid_stat', 2.0)
+        stats.add('grid_stat', 4.0)
+        self.assertEqual(stats.estimate('grid_stat'), 3.0)
+
+    def test_saves_are_merged(self):
+        # two runs that read the file before either saved
+        first = TimingStats(self.filename)
+        second = TimingStats(self.filename)
+        first.add('grid_stat', 2.0)
+        first.add('pcp_combine', 1.0)
+        second.add('grid_stat', 6.0)
+        first.save()
+        second.save()
+        # saving again without new runs changes nothing
+        second.save()
+        with open(self.filename) as stats_file:
+            self.assertEqual(json.load(stats_file)['apps'],
+                             {'grid_stat': [2, 8.0], 'pcp_combine': [1, 1.0]})
+        self.assertEqual(second.estimate('grid_stat'), 4.0)
+        self.assertEqual(TimingStats(self.filename).estimate('pcp_combine'),
+                         1.0)
+
+    def test_no_file(self):
+        stats = TimingStats('')
+        stats.add('grid_stat', 1.0)
+        stats.save()
+        self.assertEqual(stats.estimate('grid_stat'), 1.0)
+
+
+class TestCommandPlan(unittest.TestCase):
+
+    def test_summary(self):
+        stats = TimingStats('')
+        stats.add('grid_stat', 3.0)
+        plan = CommandPlan(stats)
+        plan.set_context('GridStat', '2017051000')
+        plan.add('grid_stat', 'grid_stat a', ['a'], ['b'])
+        plan.add('grid_stat', 'grid_stat c', ['c'], ['d'], up_to_date=True)
+        plan.set_context('PcpCombine', '2017051000')
+        plan.add('pcp_combine', 'pcp_combine e', ['e'], ['f'])
+        self.assertEqual(plan.summary(), {
+            'commands': 3,
+            'estimated_seconds': 3.0,
+            'apps': {'grid_stat': {'commands': 2, 'up_to_date': 1,
+                                   'unestimated': 0,
+                                   'estimated_seconds': 3.0},
+                     'pcp_combine': {'commands': 1, 'up_to_date': 0,
+                                     'unestimated': 1,
+                                     'estimated_seconds': 0.0}}})
+        self.assertEqual(plan.commands[2]['process'], 'PcpCombine')
+        self.assertEqual(plan.commands[1]['estimated_seconds'], 0.0)
+
+
+class TestPlanRun(unittest.TestCase):
+    """Runs master_metplus.py --plan on the benchmark's stub setup with
+    every tool replaced by a script that logs its use"""
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.calls = os.path.join(self.top, 'calls.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def logging_tool(self, path):
+        if os.path.lexists(path):
+            os.remove(path)
+        with open(path, 'w') as tool:
+            tool.write('#!/bin/sh\necho "$0 $*" >> ' + self.calls + '\n')
+        os.chmod(path, 0o755)
+        return path
+
+    def run_plan(self, scenario):
+        work_dir = os.path.join(self.top, scenario)
+        os.makedirs(work_dir)
+        conf, env, _ = run_benchmark.setup_run(scenario, work_dir, 2, 2, 2)
+        bin_dir = os.path.join(work_dir, 'met', 'bin')
+        exes = {}
+        for tool in run_benchmark.STUB_TOOLS:
+            self.logging_tool(os.path.join(bin_dir, tool))
+        for key, tool in list(run_benchmark.STUB_EXES.items()) + \
+                list(run_benchmark.SYSTEM_EXES.items()):
+            exes[key] = self.logging_tool(os.path.join(bin_dir, tool))
+        tools_conf = os.path.join(work_dir, 'tools.conf')
+        run_benchmark.write_conf(tools_conf, {'exe': exes})
+        plan_file = os.path.join(work_dir, 'plan.json')
+        use_case = os.path.join(run_benchmark.METPLUS_BASE, 'parm',
+                                run_benchmark.SCENARIOS[scenario][0])
+        run_env = dict(os.environ)
+        run_env.update(env)
+        with open(os.path.join(work_dir, 'master_metplus.out'), 'w') as log:
+            status = subprocess.call(
+                [sys.executable,
+                 os.path.join(run_benchmark.METPLUS_BASE, 'ush',
+                              'master_metplus.py'),
+                 '-c', use_case, '-c', conf, '-c', tools_conf,
+                 '--plan', plan_file],
+                stdout=log, stderr=subprocess.STDOUT, env=run_env)
+        self.assertEqual(status, 0)
+        self.assertFalse(os.path.exists(self.calls))
+        with open(plan_file) as plan_handle:
+            return json.load(plan_handle)
+
+    def test_qpf(self):
+        plan = self.run_plan('qpf')
+        self.assertEqual(plan['unplanned'], [])
+        self.assertEqual(sorted(plan['summary']['apps']),
+                         ['grid_stat', 'pcp_combine', 'regrid_data_plane'])
+
+    def test_feature_relative(self):
+        plan = self.run_plan('feature_relative')
+        self.assertEqual([process['process']
+                          for process in plan['unplanned']],
+                         ['TcPairs', 'ExtractTiles', 'SeriesByLead'])
+        self.assertEqual(plan['commands'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import produtil.config
+import config_snapshot
+
+CONF = """
+[dir]
+OUTPUT_BASE = /tmp/out
+TILE_DIR = {OUTPUT_BASE}/tiles
+[config]
+LEAD_SEQ = 0, 6, 12
+HOME_DIR = {ENV[HOME]}
+[filename_templates]
+FCST_TEMPLATE = {init?fmt=%Y%m%d}/{init?fmt=%Y%m%d%H}_f{lead?fmt=%HHH}.grb2
+"""
+
+
+class TestConfigSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.conf_file = os.path.join(self.top, 'metplus_final.conf')
+        self.snapshot = config_snapshot.snapshot_path(self.conf_file)
+        conf = produtil.config.from_string(CONF)
+        with open(self.conf_file, 'w') as file_handle:
+            conf.write(file_handle)
+        config_snapshot.write_snapshot(conf, self.snapshot, [self.conf_file])
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def test_same_as_conf_file(self):
+        expected = produtil.config.from_file(self.conf_file)
+        conf = config_snapshot.read_snapshot(self.snapshot,
+                                             produtil.config.ProdConfig())
+        self.assertEqual(sorted(conf.sections()),
+                         sorted(expected.sections()))
+        for section in expected.sections():
+            for option in expected.keys(section):
+                self.assertEqual(conf.getraw(section, option),
+                                 expected.getraw(section, option))
+        self.assertEqual(conf.getdir('TILE_DIR'), '/tmp/out/tiles')
+        self.assertEqual(conf.getstr('config', 'HOME_DIR'),
+                         os.environ['HOME'])
+
+    def test_values_are_not_expanded_again(self):
+        conf = config_snapshot.read_snapshot(self.snapshot,
+                                             produtil.config.ProdConfig())
+        conf.getdir('TILE_DIR')
+        conf.getstr('config', 'LEAD_SEQ')
+        self.assertEqual(conf.interp_cache_stats()['misses'], 0)
+
+    def test_changed_conf_file(self):
+        with open(self.conf_file, 'a') as file_handle:
+            file_handle.write('\n[extra]\nA = 1\n')
+        self.assertTrue(config_snapshot.read_snapshot(
+            self.snapshot, produtil.config.ProdConfig()) is None)
+
+    def test_other_format_version(self):
+        with open(self.snapshot) as file_handle:
+            snapshot = json.load(file_handle)
+        snapshot['format_version'] = config_snapshot.FORMAT_VERSION + 1
+        with open(self.snapshot, 'w') as file_handle:
+            json.dump(snapshot, file_handle)
+        self.assertTrue(config_snapshot.read_snapshot(
+            self.snapshot, produtil.config.ProdConfig()) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
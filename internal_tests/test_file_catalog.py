@@ -0,0 +1,89 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import file_catalog
+from file_catalog import FileCatalog
+
+
+class TestFileCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        for path in ['a/ANLY_TILE_F000_x.nc', 'a/FCST_TILE_F000_x.nc',
+                     'a/b/ANLY_TILE_F006_x.nc', 'notes.txt']:
+            self.touch(path)
+        self.age(self.top)
+        self.catalog = FileCatalog()
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def touch(self, path):
+        path = os.path.join(self.top, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as file_handle:
+            file_handle.write('x')
+
+    def age(self, top):
+        # older than RACY_SECONDS, so listings of the tree are reused
+        old = time.time() - 10 * file_catalog.RACY_SECONDS
+        for root, _, _ in os.walk(top):
+            os.utime(root, (old, old))
+
+    def test_regex_and_prefix(self):
+        self.assertEqual(self.catalog.files(self.top, '.*TILE_F000'),
+                         [os.path.join(self.top, 'a', name) for name in
+                          ['ANLY_TILE_F000_x.nc', 'FCST_TILE_F000_x.nc']])
+        self.assertEqual(self.catalog.files(self.top, prefix='ANLY'),
+                         [os.path.join(self.top, 'a', 'ANLY_TILE_F000_x.nc'),
+                          os.path.join(self.top, 'a', 'b',
+                                       'ANLY_TILE_F006_x.nc')])
+        self.assertEqual(self.catalog.dirs(self.top),
+                         [os.path.join(self.top, 'a'),
+                          os.path.join(self.top, 'a', 'b')])
+        self.assertEqual(self.catalog.files(os.path.join(self.top, 'none')),
+                         [])
+
+    def test_changed_directory_is_listed_again(self):
+        self.assertEqual(len(self.catalog.files(self.top, '.*nc$')), 3)
+        self.touch('a/b/FCST_TILE_F006_x.nc')
+        self.assertEqual(len(self.catalog.files(self.top, '.*nc$')), 4)
+
+    def test_unchanged_directory_is_reused(self):
+        self.catalog.files(self.top)
+        listings = dict(self.catalog._listings)
+        self.catalog.files(self.top)
+        for path, listing in self.catalog._listings.items():
+            self.assertTrue(listing is listings[path])
+
+    def test_invalidate(self):
+        self.catalog.files(self.top)
+        self.catalog.invalidate(os.path.join(self.top, 'a'))
+        self.assertEqual(sorted(self.catalog._listings),
+                         [os.path.normpath(self.top)])
+
+    def test_get_stat(self):
+        stat = self.catalog.get_stat(os.path.join(self.top, 'notes.txt'))
+        self.assertEqual(stat.st_size, 1)
+        self.assertTrue(
+            self.catalog.get_stat(os.path.join(self.top, 'none')) is None)
+
+    def test_existing(self):
+        paths = [os.path.join(self.top, *parts) for parts in
+                 [('notes.txt',), ('a', 'b'), ('a', 'none.nc'),
+                  ('none', 'none.nc')]]
+        self.assertEqual(self.catalog.existing(paths), set(paths[:2]))
+
+    def test_shared_in_process(self):
+        self.assertTrue(file_catalog.get_file_catalog() is
+                        file_catalog.get_file_catalog())
+
+
+if __name__ == '__main__':
+    unittest.main()
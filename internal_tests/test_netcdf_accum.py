@@ -0,0 +1,163 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+import netcdf_accum
+
+# the attributes of the output field that must match pcp_combine's
+TIME_ATTRS = ['level', 'accum_time', 'accum_time_sec', 'init_time',
+              'init_time_ut', 'valid_time', 'valid_time_ut']
+
+FIELD = 'name="P01M_NONE"; level="(0,*,*)";'
+
+
+def find_pcp_combine():
+    """Returns pcp_combine from MET_BUILD_BASE, or from the PATH if
+    MET_BUILD_BASE is not set, or None"""
+    if 'MET_BUILD_BASE' in os.environ:
+        dirs = [os.path.join(os.environ['MET_BUILD_BASE'], 'bin')]
+    else:
+        dirs = os.environ.get('PATH', '').split(os.pathsep)
+    for bin_dir in dirs:
+        path = os.path.join(bin_dir, 'pcp_combine')
+        if os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def write_input(path, values, valid_ut):
+    """Writes an hourly precipitation field the way the QPE inputs of
+    the qpf use case look after GempakToCF: CF coordinates and a
+    P01M_NONE field on (time, lat, lon), with the MET time attributes"""
+    from netCDF4 import Dataset
+    dataset = Dataset(path, 'w')
+    dataset.Conventions = 'CF-1.6'
+    dataset.createDimension('time', 1)
+    dataset.createDimension('lat', 2)
+    dataset.createDimension('lon', 3)
+    times = dataset.createVariable('time', 'f8', ('time',))
+    times.units = 'seconds since 1970-01-01 00:00:00'
+    times.standard_name = 'time'
+    times[:] = [valid_ut]
+    lat = dataset.createVariable('lat', 'f4', ('lat',))
+    lat.units = 'degrees_north'
+    lat[:] = [40, 41]
+    lon = dataset.createVariable('lon', 'f4', ('lon',))
+    lon.units = 'degrees_east'
+    lon[:] = [-105, -104, -103]
+    var = dataset.createVariable('P01M_NONE', 'f4',
+                                 ('time', 'lat', 'lon'),
+                                 fill_value=-9999.0)
+    var.units = 'mm'
+    var.accum_time_sec = 3600
+    var.init_time_ut = str(valid_ut)
+    var.valid_time_ut = str(valid_ut)
+    var[0, :, :] = values
+    dataset.close()
+    return path
+
+
+class TestParseField(unittest.TestCase):
+
+    def test_netcdf_field(self):
+        self.assertEqual(netcdf_accum.parse_field(
+            '\'name="P01M_NONE"; level="(0,*,*)";\''), ('P01M_NONE', 0))
+        self.assertEqual(netcdf_accum.parse_field(
+            '\'name="APCP"; level="(5,*,*)";\' '), ('APCP', 5))
+
+    def test_other_field(self):
+        self.assertTrue(netcdf_accum.parse_field('06') is None)
+        self.assertTrue(netcdf_accum.parse_field(
+            '\'name="APCP"; level="A06";\'') is None)
+
+
+@unittest.skipUnless(netcdf_accum.available(), 'needs numpy and netCDF4')
+class TestAddFields(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def write_input(self, name, values, valid_ut=1494381600):
+        return write_input(os.path.join(self.top, name), values, valid_ut)
+
+    def test_sum(self):
+        from netCDF4 import Dataset
+        inputs = [(self.write_input('a.nc', [[1, 2, 3], [4, 5, -9999]]),
+                   'P01M_NONE', 0),
+                  (self.write_input('b.nc', [[1, 1, 1], [1, 1, 1]],
+                                    1494378000),
+                   'P01M_NONE', 0)]
+        out_path = os.path.join(self.top, 'out.nc')
+        netcdf_accum.add_fields(inputs, out_path, 'APCP_02')
+        dataset = Dataset(out_path)
+        result = dataset.variables['APCP_02']
+        self.assertEqual(result.dimensions, ('lat', 'lon'))
+        self.assertEqual(result.accum_time_sec, 7200)
+        self.assertEqual(result.level, 'A2')
+        self.assertEqual(result[:].filled().tolist(),
+                         [[2, 3, 4], [5, 6, -9999]])
+        self.assertEqual(dataset.variables['lat'][:].tolist(), [40, 41])
+        self.assertEqual(result.init_time, '20170510_010000')
+        self.assertEqual(result.init_time_ut, '1494378000')
+        self.assertEqual(result.valid_time, '20170510_020000')
+        self.assertEqual(result.valid_time_ut, '1494381600')
+        dataset.close()
+
+
+@unittest.skipUnless(netcdf_accum.available() and find_pcp_combine(),
+                     'needs numpy, netCDF4 and MET pcp_combine')
+class TestAgainstPcpCombine(unittest.TestCase):
+    """Compares add_fields with pcp_combine -add run on the same inputs
+    with the command line PcpCombineWrapper builds"""
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def test_same_output(self):
+        import numpy
+        from netCDF4 import Dataset
+        paths = [write_input(os.path.join(self.top, 'qpe_2017051002.nc'),
+                             [[1.5, 2, 3], [4, 5, -9999]], 1494381600),
+                 write_input(os.path.join(self.top, 'qpe_2017051001.nc'),
+                             [[0.25, 1, 0], [-9999, 1, 1]], 1494378000)]
+        engine_path = os.path.join(self.top, 'engine.nc')
+        met_path = os.path.join(self.top, 'met.nc')
+        netcdf_accum.add_fields([(path, 'P01M_NONE', 0) for path in paths],
+                                engine_path, 'APCP_02')
+        cmd = [find_pcp_combine(), '-add', '-name', 'APCP_02']
+        for path in paths:
+            cmd += [path, "'" + FIELD + "'"]
+        self.assertEqual(subprocess.call(' '.join(cmd + [met_path]),
+                                         shell=True), 0)
+
+        engine = Dataset(engine_path)
+        met = Dataset(met_path)
+        try:
+            self.assertTrue('APCP_02' in met.variables)
+            expected = met.variables['APCP_02']
+            result = engine.variables['APCP_02']
+            self.assertEqual(result.shape, expected.shape)
+            self.assertTrue(numpy.allclose(
+                numpy.ma.filled(result[:], -9999.0),
+                numpy.ma.filled(expected[:], -9999.0)))
+            for attr in TIME_ATTRS:
+                if attr in expected.ncattrs():
+                    self.assertEqual(str(result.getncattr(attr)),
+                                     str(expected.getncattr(attr)), attr)
+        finally:
+            engine.close()
+            met.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
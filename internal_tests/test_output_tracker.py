@@ -0,0 +1,66 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+import output_tracker
+from output_tracker import OutputTracker
+
+
+class TestOutputTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.tracker = OutputTracker()
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def path(self, *parts):
+        return os.path.join(self.top, *parts)
+
+    def make(self, path, text=''):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as file_handle:
+            file_handle.write(text)
+
+    def test_prune_tracked(self):
+        self.tracker.add(self.path('a', 'b'))
+        self.tracker.add(self.path('c'))
+        self.make(self.path('a', 'b', 'empty.nc'))
+        self.make(self.path('c', 'tile.nc'), 'x')
+        # not created by the run, so left alone
+        self.make(self.path('d', 'empty.nc'))
+
+        self.tracker.prune(self.top)
+
+        # a/b is empty once its file is removed, and then a is empty
+        self.assertFalse(os.path.exists(self.path('a')))
+        self.assertTrue(os.path.exists(self.path('c', 'tile.nc')))
+        self.assertTrue(os.path.exists(self.path('d', 'empty.nc')))
+        self.assertTrue(os.path.isdir(self.top))
+        self.assertEqual(self.tracker.tracked(self.top), [self.path('c')])
+
+    def test_prune_only_below_top(self):
+        self.tracker.add(self.path('a'))
+        self.tracker.add(self.path('b'))
+        os.makedirs(self.path('a'))
+        os.makedirs(self.path('b'))
+        self.tracker.prune(self.path('a'))
+        self.assertTrue(os.path.isdir(self.path('a')))
+        self.tracker.prune(self.top)
+        self.assertEqual(os.listdir(self.top), [])
+
+    def test_prune_tree(self):
+        self.make(self.path('a', 'b', 'c', 'empty.nc'))
+        self.make(self.path('d', 'tile.nc'), 'x')
+        output_tracker.prune_tree(self.top)
+        self.assertEqual(os.listdir(self.top), ['d'])
+        self.assertEqual(os.listdir(self.path('d')), ['tile.nc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
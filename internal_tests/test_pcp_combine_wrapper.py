@@ -0,0 +1,34 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import unittest
+from pcp_combine_wrapper import plan_accumulation
+
+
+class TestPlanAccumulation(unittest.TestCase):
+
+    def test_hourly_files(self):
+        available = dict((offset, [1]) for offset in range(6))
+        self.assertEqual(plan_accumulation(6, available),
+                         [(offset, 1) for offset in range(6)])
+
+    def test_largest_buckets_first(self):
+        available = dict((offset, [1]) for offset in range(24))
+        available[0] = [1, 6, 24]
+        available[6] = [1, 6]
+        self.assertEqual(plan_accumulation(24, available), [(0, 24)])
+        self.assertEqual(plan_accumulation(12, available), [(0, 6), (6, 6)])
+
+    def test_fewest_when_largest_first_fails(self):
+        # taking the 4 hour file first leaves hours 4 and 5 uncovered
+        available = {0: [4, 3], 3: [3], 4: [1]}
+        self.assertEqual(plan_accumulation(6, available), [(0, 3), (3, 3)])
+
+    def test_no_cover(self):
+        self.assertTrue(plan_accumulation(6, {0: [1], 1: [1], 3: [3]})
+                        is None)
+        self.assertTrue(plan_accumulation(3, {0: [6]}) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
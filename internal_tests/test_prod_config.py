@@ -0,0 +1,71 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import unittest
+from ConfigParser import NoOptionError
+import produtil.config
+
+CONF = """
+[dir]
+OUTPUT_BASE = /tmp/out
+[config]
+FCST_TILE_PREFIX = FCST_TILE_F
+TILE_DIR = {OUTPUT_BASE}/tiles
+HOME_DIR = {ENV[TEST_PROD_CONFIG_HOME]}
+"""
+
+
+class TestInterpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = produtil.config.from_string(CONF)
+
+    def test_hits(self):
+        self.assertEqual(self.conf.getstr('config', 'TILE_DIR'),
+                         '/tmp/out/tiles')
+        self.assertEqual(self.conf.getstr('config', 'TILE_DIR'),
+                         '/tmp/out/tiles')
+        stats = self.conf.interp_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_set_and_read_clear_the_cache(self):
+        self.conf.getstr('config', 'TILE_DIR')
+        self.conf.set('dir', 'OUTPUT_BASE', '/tmp/other')
+        self.assertEqual(self.conf.getstr('config', 'TILE_DIR'),
+                         '/tmp/other/tiles')
+        self.conf.readstr("[config]\nTILE_DIR = {OUTPUT_BASE}/new\n")
+        self.assertEqual(self.conf.getstr('config', 'TILE_DIR'),
+                         '/tmp/other/new')
+
+    def test_missing_option(self):
+        for _ in range(2):
+            self.assertEqual(self.conf.getint('config', 'NONE', 3), 3)
+            self.assertRaises(NoOptionError, self.conf.getstr, 'config',
+                              'NONE')
+        self.assertEqual(self.conf.interp_cache_stats()['misses'], 1)
+
+    def test_environment_is_not_cached(self):
+        os.environ['TEST_PROD_CONFIG_HOME'] = '/home/a'
+        self.assertEqual(self.conf.getstr('config', 'HOME_DIR'), '/home/a')
+        os.environ['TEST_PROD_CONFIG_HOME'] = '/home/b'
+        self.assertEqual(self.conf.getstr('config', 'HOME_DIR'), '/home/b')
+        del os.environ['TEST_PROD_CONFIG_HOME']
+
+    def test_morevars(self):
+        self.assertEqual(
+            self.conf.getstr('config', 'TILE_DIR',
+                             morevars={'OUTPUT_BASE': '/tmp/more'}),
+            '/tmp/more/tiles')
+        self.assertEqual(self.conf.getstr('config', 'TILE_DIR'),
+                         '/tmp/out/tiles')
+
+    def test_size_limit(self):
+        self.conf._interp_cache_size = 2
+        for name in ['FCST_TILE_PREFIX', 'TILE_DIR', 'OUTPUT_BASE']:
+            self.conf.getstr('config', name)
+        self.assertEqual(self.conf.interp_cache_stats()['size'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
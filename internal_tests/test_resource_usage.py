@@ -0,0 +1,150 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+from produtil.run import batchexe
+import resource_usage
+from resource_usage import UsageReport, USAGE_FIELDS
+
+
+class FakeConfig(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getbool(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+    def getstr(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+
+def busy_child():
+    """Starts a child that touches 64 MB and spends CPU time"""
+    return subprocess.Popen(
+        [sys.executable, '-c',
+         'x = bytearray(64 * 1024 * 1024)\n'
+         'for i in range(0, len(x), 4096): x[i] = 1\n'
+         'sum(range(3000000))'])
+
+
+class TestWaitWithUsage(unittest.TestCase):
+
+    def test_usage_of_the_child(self):
+        status, usage = resource_usage.wait_with_usage(busy_child())
+        self.assertEqual(status, 0)
+        self.assertTrue(usage.ru_utime > 0)
+        # ru_maxrss is in kilobytes on Linux
+        self.assertTrue(usage.ru_maxrss > 64 * 1024)
+
+    def test_exit_status(self):
+        process = subprocess.Popen('exit 3', shell=True)
+        self.assertEqual(resource_usage.wait_with_usage(process)[0], 3)
+        self.assertEqual(process.returncode, 3)
+        process = subprocess.Popen(['sleep', '10'])
+        process.kill()
+        self.assertEqual(resource_usage.wait_with_usage(process)[0], -9)
+
+
+class TestUsageReport(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.filename = os.path.join(self.top, 'logs', 'usage.csv')
+        self.report = UsageReport(self.filename)
+
+    def tearDown(self):
+        resource_usage.set_context()
+        shutil.rmtree(self.top)
+
+    def test_tool_name(self):
+        self.assertEqual(resource_usage.tool_name(
+            "export NAME='TMP'; /met/bin/regrid_data_plane a b"),
+            'regrid_data_plane')
+        self.assertEqual(resource_usage.tool_name('/met/bin/grid_stat a'),
+                         'grid_stat')
+
+    def test_rows(self):
+        status, usage = resource_usage.wait_with_usage(busy_child())
+        resource_usage.set_context('GridStat', '20170510_00')
+        self.report.add('/met/bin/grid_stat a b', status, 1.5, usage)
+        self.report.add('/met/bin/pcp_combine -add c', 1, 0.25, usage,
+                        wrapper='PcpCombine', init_time='20170510_01')
+        self.report.save()
+        # a second save appends without another header
+        self.report.add('/met/bin/grid_stat d', 0, 1.0, usage)
+        self.report.save()
+        with open(self.filename) as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], USAGE_FIELDS)
+        self.assertEqual(len(rows), 4)
+        records = self.report.read()
+        self.assertEqual([(record['wrapper'], record['tool'],
+                           record['init_time'], record['exit_status'],
+                           record['wall_seconds']) for record in records],
+                         [('GridStat', 'grid_stat', '20170510_00', '0',
+                           '1.500'),
+                          ('PcpCombine', 'pcp_combine', '20170510_01', '1',
+                           '0.250'),
+                          ('GridStat', 'grid_stat', '20170510_00', '0',
+                           '1.000')])
+        self.assertTrue(float(records[0]['user_seconds']) > 0)
+        self.assertTrue(int(records[0]['max_rss_kb']) > 64 * 1024)
+        self.assertEqual(records[1]['cmd'], '/met/bin/pcp_combine -add c')
+
+    def test_summary(self):
+        _, usage = resource_usage.wait_with_usage(
+            subprocess.Popen(['true']))
+        for wrapper, cmd, init_time, status, seconds in [
+                ('GridStat', 'grid_stat a', '20170510_00', 0, 1.0),
+                ('GridStat', 'grid_stat b', '20170510_00', 1, 2.0),
+                ('GridStat', 'grid_stat c', '20170510_01', 0, 4.0),
+                ('PcpCombine', 'pcp_combine d', '20170510_00', 0, 8.0)]:
+            self.report.add(cmd, status, seconds, usage, wrapper=wrapper,
+                            init_time=init_time)
+        self.report.save()
+        json_file = self.report.write_summary()
+        self.assertEqual(json_file, os.path.join(self.top, 'logs',
+                                                 'usage.json'))
+        with open(json_file) as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(summary['tools']['grid_stat']['commands'], 3)
+        self.assertEqual(summary['tools']['grid_stat']['failed'], 1)
+        self.assertEqual(summary['tools']['grid_stat']['wall_seconds'], 7.0)
+        self.assertEqual(summary['tools']['pcp_combine']['wall_seconds'],
+                         8.0)
+        self.assertEqual([(group['wrapper'], group['tool'],
+                           group['init_time'], group['commands'],
+                           group['wall_seconds'])
+                          for group in summary['groups']],
+                         [('GridStat', 'grid_stat', '20170510_00', 2, 3.0),
+                          ('GridStat', 'grid_stat', '20170510_01', 1, 4.0),
+                          ('PcpCombine', 'pcp_combine', '20170510_00', 1,
+                           8.0)])
+
+    def test_run_is_recorded(self):
+        report = resource_usage.start_report(FakeConfig(
+            {'USAGE_REPORT': True, 'USAGE_REPORT_FILE': self.filename}))
+        try:
+            resource_usage.set_context('ExtractTiles', '20141214_00')
+            self.assertEqual(resource_usage.run(
+                batchexe('sh')['-c', 'exit 2']), 2)
+        finally:
+            resource_usage.start_report(FakeConfig({}))
+        report.save()
+        records = report.read()
+        self.assertEqual([(record['wrapper'], record['tool'],
+                           record['init_time'], record['exit_status'],
+                           record['cmd']) for record in records],
+                         [('ExtractTiles', 'exit', '20141214_00', '2',
+                           'exit 2')])
+
+
+if __name__ == '__main__':
+    unittest.main()
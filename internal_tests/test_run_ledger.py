@@ -0,0 +1,51 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+from run_ledger import RunLedger
+
+
+class TestRunLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.outdir = os.path.join(self.top, 'grid_stat')
+        os.makedirs(self.outdir)
+        self.write('other.stat')
+        self.ledger = RunLedger(os.path.join(self.top, 'ledger.sqlite3'))
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def write(self, name):
+        with open(os.path.join(self.outdir, name), 'w') as file_handle:
+            file_handle.write(name)
+
+    def run_command(self):
+        entry = self.ledger.make_entry('grid_stat a b', [], [],
+                                       [self.outdir])
+        self.write('grid_stat_06.stat')
+        self.ledger.record(entry)
+
+    def entry(self):
+        return self.ledger.make_entry('grid_stat a b', [], [], [self.outdir])
+
+    def test_output_directory(self):
+        self.run_command()
+        self.assertTrue(self.ledger.is_current(self.entry()))
+        # files other commands write to the directory do not matter
+        os.remove(os.path.join(self.outdir, 'other.stat'))
+        self.assertTrue(self.ledger.is_current(self.entry()))
+        os.remove(os.path.join(self.outdir, 'grid_stat_06.stat'))
+        self.assertFalse(self.ledger.is_current(self.entry()))
+
+    def test_nothing_written(self):
+        self.ledger.record(self.entry())
+        self.assertFalse(self.ledger.is_current(self.entry()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import datetime
+import logging
+import unittest
+import string_template_substitution as sts
+from string_template_substitution import StringSub, compile_template
+
+PHPT_TEMPLATE = "{init?fmt=%Y%m%d}/{init?fmt=%Y%m%d}_i{init?fmt=%H}_" \
+                "f{lead?fmt=%HHH}_HRRRTLE_PHPT.grb2"
+
+
+class TestCompiledTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_string_template_substitution')
+
+    def test_typed_values(self):
+        tmpl = compile_template(PHPT_TEMPLATE)
+        self.assertEqual(
+            tmpl.render(init=datetime.datetime(2017, 5, 9, 12),
+                        lead=datetime.timedelta(hours=6)),
+            "20170509/20170509_i12_f006_HRRRTLE_PHPT.grb2")
+        self.assertEqual(tmpl.render(init="2017050912", lead=6 * 3600),
+                         "20170509/20170509_i12_f006_HRRRTLE_PHPT.grb2")
+
+    def test_compiled_once(self):
+        self.assertTrue(compile_template(PHPT_TEMPLATE) is
+                        compile_template(PHPT_TEMPLATE))
+
+    def test_same_as_string_sub(self):
+        cases = [
+            ("{valid?fmt=%Y%m%d}/ST2ml{valid?fmt=%Y%m%d%H}_A{accum?fmt=%HH}h",
+             dict(valid="2017050918", accum="06"),
+             "20170509/ST2ml2017050918_A06h"),
+            ("{valid?fmt=%Y%m%d%H}/ruc_{lead?fmt=%HH}_A{accum?fmt=%HH}h.nc",
+             dict(init="2017050912", lead="030", accum="01"),
+             "2017051018/ruc_30_A01h.nc"),
+            ("{init?fmt=%Y%m%d%H}/x_{lead?fmt=%HH%MMSS}",
+             dict(valid="201705091830", lead="0130"),
+             "2017050917/x_013000"),
+            ("{init?fmt=%Y%m%d%H}/x_{lead?fmt=%HHH}_{lead}_{valid}",
+             dict(init="2017050912", valid="2017050918"),
+             "2017050912/x_006_060000_2017050918"),
+            ("x_{lead?fmt=%HHH}", dict(init="2017050918", valid="2017050912"),
+             "x_-006"),
+            ("{model}_{level}_{level?fmt=abc}.nc",
+             dict(model="gfs", level="P500"),
+             "gfs_P500_{level?fmt=abc}.nc"),
+        ]
+        for tmpl, values, expected in cases:
+            self.assertEqual(
+                StringSub(self.logger, tmpl, **values).doStringSub(),
+                expected)
+            self.assertEqual(compile_template(tmpl).render(**values),
+                             expected)
+
+    def test_render_many(self):
+        tmpl = compile_template(PHPT_TEMPLATE)
+        inits = [datetime.datetime(2017, 5, 9, 12),
+                 datetime.datetime(2017, 5, 9, 6)]
+        leads = ["06", "12"]
+        expected = [tmpl.render(init=init, lead=lead)
+                    for init, lead in zip(inits, leads)]
+        self.assertEqual(tmpl.render_many(init=inits, lead=leads), expected)
+        self.assertEqual(
+            tmpl.render_many(init="2017050912", lead=leads),
+            ["20170509/20170509_i12_f006_HRRRTLE_PHPT.grb2",
+             "20170509/20170509_i12_f012_HRRRTLE_PHPT.grb2"])
+        self.assertRaises(ValueError, tmpl.render_many, init=inits,
+                          lead=["06"])
+
+    def test_render_many_product(self):
+        tmpl = compile_template("{valid?fmt=%Y%m%d%H}_A{accum?fmt=%HH}h")
+        self.assertEqual(
+            tmpl.render_many(product=True,
+                             valid=["2017050912", "2017050913"],
+                             accum=[3600, 7200]),
+            ["2017050912_A01h", "2017050912_A02h",
+             "2017050913_A01h", "2017050913_A02h"])
+        # valid computed from init and lead on integers
+        tmpl = compile_template("{valid?fmt=%Y%m%d%H}")
+        self.assertEqual(
+            tmpl.render_many(init="2017050923",
+                             lead=[datetime.timedelta(hours=1), "02"]),
+            ["2017051000", "2017051001"])
+
+    def test_parse(self):
+        tmpl = compile_template(PHPT_TEMPLATE)
+        self.assertEqual(
+            tmpl.parse("20170509/20170509_i12_f006_HRRRTLE_PHPT.grb2"),
+            {'init': datetime.datetime(2017, 5, 9, 12), 'lead': 6 * 3600})
+        # the date is written twice and must be the same both times
+        self.assertTrue(
+            tmpl.parse("20170509/20170510_i12_f006_HRRRTLE_PHPT.grb2") is None)
+        self.assertTrue(tmpl.parse("20170509/notes.txt") is None)
+        self.assertTrue(
+            tmpl.parse("20171309/20171309_i12_f006_HRRRTLE_PHPT.grb2") is None)
+
+        tmpl = compile_template("{model}_{valid?fmt=%Y%m%d%H}_"
+                                "A{accum?fmt=%HH%MMSS}_{level}.nc")
+        self.assertEqual(
+            tmpl.parse("gfs_2017050918_A013000_P500.nc"),
+            {'model': 'gfs', 'valid': datetime.datetime(2017, 5, 9, 18),
+             'accum': 90 * 60, 'level': 'P500'})
+
+    def test_parse_what_render_writes(self):
+        tmpl = compile_template("{init?fmt=%Y%j%H}_{lead?fmt=%HH}_{init}")
+        path = tmpl.render(init="20170509120000", lead=120 * 3600)
+        self.assertEqual(path, "201712912_120_20170509120000")
+        self.assertEqual(tmpl.parse(path),
+                         {'init': datetime.datetime(2017, 5, 9, 12),
+                          'lead': 120 * 3600})
+        self.assertEqual(
+            sts.resolve_times(None, tmpl.parse(path))['valid'],
+            datetime.datetime(2017, 5, 14, 12))
+
+    def test_parse_many(self):
+        tmpl = compile_template("{valid?fmt=%Y%m%d%H}_A{accum?fmt=%HH}h")
+        self.assertEqual(
+            [path for path, _ in tmpl.parse_many(
+                ["2017050912_A01h", "README", "2017050913_A06h"])],
+            ["2017050912_A01h", "2017050913_A06h"])
+
+    def test_string_extract(self):
+        extract = sts.StringExtract(
+            self.logger, PHPT_TEMPLATE,
+            "20170509/20170509_i12_f030_HRRRTLE_PHPT.grb2")
+        extract.parseTemplate()
+        self.assertEqual(extract.getInitTime("%Y%m%d%H"), "2017050912")
+        self.assertEqual(extract.getValidTime("%Y%m%d%H"), "")
+        self.assertEqual(extract.leadHour, 30)
+        self.assertEqual(extract.accumHour, -1)
+        extract = sts.StringExtract(self.logger, PHPT_TEMPLATE, "notes.txt")
+        extract.parseTemplate()
+        self.assertEqual(extract.leadHour, -1)
+
+    def test_format_hours(self):
+        self.assertEqual(sts.format_hours(None, 90 * 60, 2, True), "013000")
+        self.assertEqual(sts.format_hours(None, 120 * 3600, 2, False),
+                         "120")
+        self.assertEqual(sts.format_hours(None, -6 * 3600, 3, False), "-006")
+
+
+if __name__ == '__main__':
+    unittest.main()
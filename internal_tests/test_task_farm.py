@@ -0,0 +1,73 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import logging
+import unittest
+import task_farm
+from command_builder import CommandBuilder
+from command_plan import CommandPlan
+
+
+class FakeConfig(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getbool(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+    def getint(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+
+class TestTaskFarm(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_task_farm')
+        # always test the local pool, even where mpiexec is installed
+        self.can_run_mpi = task_farm.produtil.mpi_impl.can_run_mpi
+        task_farm.produtil.mpi_impl.can_run_mpi = lambda: False
+
+    def tearDown(self):
+        task_farm.produtil.mpi_impl.can_run_mpi = self.can_run_mpi
+
+    def test_make_task_line(self):
+        line = task_farm.make_task_line('echo $NAME', {'NAME': "it's",
+                                                       'LEVEL': 'Z2'})
+        self.assertEqual(line, "export LEVEL='Z2'; export NAME='it'\\''s'; "
+                               "echo $NAME")
+        self.assertEqual(task_farm.make_task_line('echo'), 'echo')
+
+    def test_disabled_runs_now(self):
+        farm = task_farm.TaskFarm(FakeConfig({}), self.logger)
+        self.assertEqual(farm.add('exit 3'), 3)
+        self.assertEqual(farm.tasks, [])
+
+    def test_local_pool(self):
+        farm = task_farm.TaskFarm(FakeConfig({'USE_TASK_FARM': True,
+                                              'TASK_FARM_WORKERS': 2}),
+                                  self.logger)
+        farm.add('true', {'NAME': 'TMP'})
+        farm.add('true', {'NAME': 'TMP'})
+        farm.add('false')
+        self.assertEqual(len(farm.tasks), 2)
+        self.assertEqual(farm.run(), ['false'])
+        self.assertEqual(farm.tasks, [])
+
+    def test_plan(self):
+        plan = CommandPlan()
+        CommandBuilder.plan = plan
+        try:
+            for enabled in (False, True):
+                farm = task_farm.TaskFarm(
+                    FakeConfig({'USE_TASK_FARM': enabled}), self.logger)
+                self.assertTrue(farm.add('exit 3', {'NAME': 'TMP'}) is None)
+                self.assertEqual(farm.run(), [])
+        finally:
+            CommandBuilder.plan = None
+        self.assertEqual([command['app'] for command in plan.commands],
+                         ['exit', 'exit'])
+        self.assertEqual(plan.commands[0]['cmd'], "export NAME='TMP'; exit 3")
+
+
+if __name__ == '__main__':
+    unittest.main()
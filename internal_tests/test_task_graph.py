@@ -0,0 +1,86 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import unittest
+import threading
+import task_graph
+from task_graph import TaskGraph, TaskNode
+
+
+class FakeWrapper(object):
+    def __init__(self, inputs=None, outputs=None):
+        self.inputs = inputs
+        self.outputs = outputs if outputs is not None else []
+
+    def run_at_time(self, init_time):
+        pass
+
+    def get_task_inputs(self, init_time):
+        if self.inputs is None:
+            return None
+        return [(key, init_time) for key in self.inputs]
+
+    def get_task_outputs(self, init_time):
+        return [(key, init_time) for key in self.outputs]
+
+
+class AllTimesWrapper(object):
+    def run_all_times(self):
+        pass
+
+
+class TestTaskGraph(unittest.TestCase):
+
+    def test_default_pipeline_per_time(self):
+        wrappers = {'A': FakeWrapper(), 'B': FakeWrapper()}
+        graph = task_graph.build_task_graph(['A', 'B'], ['t1', 't2'],
+                                            wrappers.get)
+        a1, a2, b1, b2 = graph.nodes
+        self.assertEqual(b1.depends_on, set([a1]))
+        self.assertEqual(b2.depends_on, set([a2]))
+        self.assertEqual(a2.depends_on, set())
+
+    def test_declared_products(self):
+        wrappers = {'A': FakeWrapper([], ['x']),
+                    'B': FakeWrapper([], ['y']),
+                    'C': FakeWrapper(['x'], [])}
+        graph = task_graph.build_task_graph(['A', 'B', 'C'], ['t1'],
+                                            wrappers.get)
+        a1, b1, c1 = graph.nodes
+        # C reads what A writes, and does not wait for B
+        self.assertEqual(c1.depends_on, set([a1]))
+        self.assertEqual(b1.depends_on, set())
+
+    def test_all_times_is_a_barrier(self):
+        wrappers = {'A': FakeWrapper(), 'B': AllTimesWrapper(),
+                    'C': FakeWrapper([], [])}
+        graph = task_graph.build_task_graph(['A', 'B', 'C'], ['t1', 't2'],
+                                            wrappers.get)
+        a1, a2, b, c1, c2 = graph.nodes
+        self.assertEqual(b.depends_on, set([a1, a2]))
+        self.assertEqual(c1.depends_on, set([b]))
+        self.assertEqual(c2.depends_on, set([b]))
+
+    def test_run_order_and_failure(self):
+        graph = TaskGraph()
+        first = graph.add_node(TaskNode('A', 't1', [], ['x']))
+        second = graph.add_node(TaskNode('B', 't1', ['x'], []))
+        broken = graph.add_node(TaskNode('A', 't2', [], ['y']))
+        after_broken = graph.add_node(TaskNode('B', 't2', ['y'], []))
+        finished = []
+        lock = threading.Lock()
+
+        def run_node(node):
+            if node is broken:
+                raise RuntimeError("failed on purpose")
+            with lock:
+                finished.append(node)
+
+        failed = graph.run(run_node, max_workers=3)
+        self.assertEqual(set(failed), set([broken, after_broken]))
+        self.assertEqual(after_broken.state, task_graph.SKIPPED)
+        self.assertTrue(finished.index(first) < finished.index(second))
+
+
+if __name__ == '__main__':
+    unittest.main()
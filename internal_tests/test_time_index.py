@@ -0,0 +1,136 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import time
+import datetime
+import shutil
+import tempfile
+import threading
+import unittest
+import time_index
+from time_index import TemplateTimeIndex
+
+PHPT_TEMPLATE = "{init?fmt=%Y%m%d}/{init?fmt=%Y%m%d}_i{init?fmt=%H}_" \
+                "f{lead?fmt=%HHH}_HRRRTLE_PHPT.grb2"
+
+
+class TestTemplateTimeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        for init, lead in [("20170509_i12", 6), ("20170509_i12", 12),
+                           ("20170509_i18", 0), ("20170510_i00", 3)]:
+            self.touch("{}/{}_f{:03d}_HRRRTLE_PHPT.grb2".format(
+                init[0:8], init, lead))
+        self.touch("20170509/notes.txt")
+        self.touch("notes.txt")
+        self.index = TemplateTimeIndex(self.top, PHPT_TEMPLATE)
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def touch(self, path):
+        path = os.path.join(self.top, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as file_handle:
+            file_handle.write('x')
+
+    def path(self, name):
+        return os.path.join(self.top, name[0:8], name)
+
+    def test_lowest_lead_at_valid(self):
+        self.assertEqual(self.index.lowest_lead_at_valid("2017050918"),
+                         self.path("20170509_i18_f000_HRRRTLE_PHPT.grb2"))
+        self.assertEqual(
+            self.index.paths_at_valid(datetime.datetime(2017, 5, 9, 18)),
+            [self.path("20170509_i18_f000_HRRRTLE_PHPT.grb2"),
+             self.path("20170509_i12_f006_HRRRTLE_PHPT.grb2")])
+        self.assertTrue(self.index.lowest_lead_at_valid("2017050917") is None)
+
+    def test_lowest_lead_at_valid_with_leads(self):
+        self.assertEqual(
+            self.index.lowest_lead_at_valid("2017050918", [6 * 3600, "12"]),
+            self.path("20170509_i12_f006_HRRRTLE_PHPT.grb2"))
+        self.assertTrue(
+            self.index.lowest_lead_at_valid("2017050918", ["03"]) is None)
+
+    def test_find(self):
+        self.assertEqual(self.index.find("2017050912", 12 * 3600),
+                         self.path("20170509_i12_f012_HRRRTLE_PHPT.grb2"))
+        self.assertTrue(self.index.find("2017050912", "03") is None)
+        self.assertEqual(len(self.index.paths_at_init("2017050912")), 2)
+
+    def test_closest_before(self):
+        self.assertEqual(self.index.closest_before("2017051003"),
+                         self.path("20170509_i12_f012_HRRRTLE_PHPT.grb2"))
+        self.assertEqual(self.index.closest_before("2017051004"),
+                         self.path("20170510_i00_f003_HRRRTLE_PHPT.grb2"))
+        self.assertTrue(self.index.closest_before("2017050918") is None)
+        self.assertTrue(
+            self.index.closest_before("2017051004", "2017051004") is None)
+
+    def test_new_files_are_found(self):
+        self.index.miss_refresh_seconds = 0
+        self.assertTrue(self.index.find("2017051100", "01") is None)
+        self.touch("20170511/20170511_i00_f001_HRRRTLE_PHPT.grb2")
+        self.assertEqual(self.index.find("2017051100", "01"),
+                         self.path("20170511_i00_f001_HRRRTLE_PHPT.grb2"))
+
+    def test_lookups_do_not_walk_again(self):
+        walks = []
+        refresh = self.index.refresh
+        self.index.refresh = lambda: walks.append(1) or refresh()
+        for _ in range(3):
+            self.assertTrue(self.index.find("2017050912", "06") is not None)
+        self.assertEqual(len(walks), 1)
+        # a miss walks again only if the index is old enough
+        self.assertTrue(self.index.find("2017051100", "01") is None)
+        self.assertEqual(len(walks), 1)
+
+    def test_unchanged_dirs_are_not_parsed(self):
+        parsed = []
+        parse_dir = self.index._parse_dir
+        self.index._parse_dir = \
+            lambda root, names: parsed.append(root) or parse_dir(root, names)
+        # the catalog lists a directory again if it changed just before
+        # it was listed
+        for root, _, _ in os.walk(self.top):
+            os.utime(root, (time.time() - 60, time.time() - 60))
+        self.index.refresh()
+        self.assertEqual(len(parsed), 2)
+        self.index.refresh()
+        self.assertEqual(len(parsed), 2)
+
+    def test_lookups_while_refreshing(self):
+        # under LOOP_METHOD = graph other tasks refresh the shared index
+        wrong = []
+        done = threading.Event()
+
+        def look_up():
+            while not done.is_set():
+                path = self.index.lowest_lead_at_valid("2017050918")
+                if path != self.path("20170509_i18_f000_HRRRTLE_PHPT.grb2"):
+                    wrong.append(path)
+        threads = [threading.Thread(target=look_up) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            for hour in range(100):
+                self.touch("20170508/20170508_i00_f%03d_HRRRTLE_PHPT.grb2" %
+                           hour)
+                self.index.refresh()
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(wrong, [])
+
+    def test_shared_in_process(self):
+        self.assertTrue(time_index.get_time_index(self.top, PHPT_TEMPLATE) is
+                        time_index.get_time_index(self.top, PHPT_TEMPLATE))
+
+
+if __name__ == '__main__':
+    unittest.main()
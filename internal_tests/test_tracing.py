@@ -0,0 +1,157 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import csv
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import tracing
+
+
+class FakeConfig(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getbool(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+    def getstr(self, sec, opt, default=None):
+        return self.values.get(opt, default)
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.filename = os.path.join(self.top, 'logs', 'trace.json')
+        self.config = FakeConfig({'TRACE': True,
+                                  'TRACE_FILE': self.filename})
+        self.tracer = tracing.start_tracing(self.config)
+
+    def tearDown(self):
+        tracing.start_tracing(FakeConfig({}))
+        shutil.rmtree(self.top)
+
+    def run_worker(self):
+        """Records a span in a child process, as a parallel_times worker
+        does, and returns its pid"""
+        pid = os.fork()
+        if pid == 0:
+            try:
+                tracer = tracing.start_tracing(self.config, new=False)
+                with tracing.span('GridStat', 'task',
+                                  init_time='20170510_01'):
+                    pass
+                tracer.save()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+    def test_off(self):
+        tracing.start_tracing(FakeConfig({}))
+        self.assertTrue(tracing.get_tracer() is None)
+        with tracing.span('GridStat', 'task') as span:
+            span.set(exit_status=0)
+        self.assertTrue(tracing.current_span() is None)
+
+    def test_export(self):
+        with tracing.span('GridStat', 'process', process='GridStat') as outer:
+            with tracing.span('GridStat', 'task',
+                              init_time='20170510_00') as task:
+                self.assertTrue(tracing.current_span() is task)
+                with tracing.span('grid_stat', 'command',
+                                  cmd='grid_stat a b') as command:
+                    time.sleep(0.01)
+                    command.set(exit_status=0)
+
+                # work handed to another thread passes its parent
+                def run_command():
+                    with tracing.span('regrid_data_plane', 'command',
+                                      parent=task, cmd='regrid_data_plane'):
+                        pass
+                thread = threading.Thread(target=run_command)
+                thread.start()
+                thread.join()
+        self.assertTrue(tracing.current_span() is None)
+        worker_pid = self.run_worker()
+        json_file, csv_file = self.tracer.export()
+        self.assertEqual(json_file, self.filename)
+        self.assertEqual(csv_file, os.path.join(self.top, 'logs',
+                                                'trace.csv'))
+        # the part files are merged and removed
+        self.assertEqual([name for name in os.listdir(os.path.dirname(
+            self.filename)) if name.endswith('.part')], [])
+
+        with open(json_file) as trace_file:
+            events = json.load(trace_file)['traceEvents']
+        names = dict((event['pid'], event['args']['name'])
+                     for event in events if event['ph'] == 'M')
+        self.assertEqual(names, {os.getpid(): 'master_metplus (%d)' %
+                                 os.getpid(),
+                                 worker_pid: 'worker (%d)' % worker_pid})
+        spans = [event for event in events if event['ph'] == 'X']
+        self.assertEqual([(event['name'], event['cat']) for event in spans],
+                         [('GridStat', 'process'), ('GridStat', 'task'),
+                          ('grid_stat', 'command'),
+                          ('regrid_data_plane', 'command'),
+                          ('GridStat', 'task')])
+        process, task_event, command_event, thread_event, worker = spans
+        for event in spans:
+            self.assertTrue(isinstance(event['ts'], int))
+            self.assertTrue(isinstance(event['dur'], int))
+        self.assertTrue(command_event['dur'] >= 10000)
+        self.assertTrue(process['ts'] <= task_event['ts'] <=
+                        command_event['ts'])
+        self.assertTrue(process['ts'] + process['dur'] >=
+                        command_event['ts'] + command_event['dur'])
+        self.assertEqual(command_event['args'],
+                         {'process': 'GridStat', 'init_time': '20170510_00',
+                          'cmd': 'grid_stat a b', 'exit_status': 0})
+        self.assertEqual(thread_event['args'],
+                         {'process': 'GridStat', 'init_time': '20170510_00',
+                          'cmd': 'regrid_data_plane'})
+        self.assertNotEqual(thread_event['tid'], command_event['tid'])
+        self.assertEqual(worker['pid'], worker_pid)
+        self.assertEqual(worker['args'], {'init_time': '20170510_01'})
+
+        with open(csv_file) as csv_handle:
+            rows = list(csv.reader(csv_handle))
+        self.assertEqual(rows[0], tracing.CSV_FIELDS)
+        records = [dict(zip(rows[0], row)) for row in rows[1:]]
+        self.assertEqual(len(records), 5)
+        by_name = dict((record['name'] + ' ' + record['category'], record)
+                       for record in records[:4])
+        self.assertEqual(by_name['GridStat process']['parent_id'], '')
+        self.assertEqual(by_name['GridStat task']['parent_id'],
+                         by_name['GridStat process']['span_id'])
+        self.assertEqual(by_name['grid_stat command']['parent_id'],
+                         by_name['GridStat task']['span_id'])
+        self.assertEqual(by_name['regrid_data_plane command']['parent_id'],
+                         by_name['GridStat task']['span_id'])
+        self.assertEqual(by_name['grid_stat command']['attributes'],
+                         'cmd=grid_stat a b;exit_status=0;'
+                         'init_time=20170510_00;process=GridStat')
+        command_record = by_name['grid_stat command']
+        self.assertAlmostEqual(float(command_record['seconds']),
+                               float(command_record['end']) -
+                               float(command_record['start']), places=5)
+
+    def test_error_is_recorded(self):
+        try:
+            with tracing.span('GridStat', 'task'):
+                raise ValueError('failed')
+        except ValueError:
+            pass
+        self.assertTrue(tracing.current_span() is None)
+        self.tracer.save()
+        self.assertEqual(self.tracer.read()[0]['attributes'],
+                         {'error': 'ValueError'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+import tree_walker
+
+
+class TestTreeWalker(unittest.TestCase):
+
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        for init in ['20141214_00', '20141214_06', '20141215_00']:
+            for storm in ['ML1201', 'ML1202']:
+                path = os.path.join(self.top, init, storm)
+                os.makedirs(path)
+                for name in ['FCST_TILE_F000.nc', 'ANLY_TILE_F000.nc']:
+                    with open(os.path.join(path, name), 'w') as tile:
+                        tile.write('x')
+        os.symlink(os.path.join(self.top, '20141214_00'),
+                   os.path.join(self.top, 'link'))
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def expected(self):
+        results = []
+        for root, dirs, files in os.walk(self.top):
+            dirs.sort()
+            results.append((root, dirs, sorted(files)))
+        return results
+
+    def test_same_as_os_walk(self):
+        for workers in [1, 4]:
+            self.assertEqual(list(tree_walker.walk(self.top, workers)),
+                             self.expected())
+
+    def test_unordered(self):
+        results = list(tree_walker.walk(self.top, 4, ordered=False))
+        self.assertEqual(sorted(results), sorted(self.expected()))
+
+    def test_prune_dirnames(self):
+        roots = []
+        for root, dirs, _ in tree_walker.walk(self.top, 4):
+            roots.append(root)
+            if root == self.top:
+                dirs[:] = ['20141215_00']
+        self.assertEqual(roots, [self.top,
+                                 os.path.join(self.top, '20141215_00'),
+                                 os.path.join(self.top, '20141215_00',
+                                              'ML1201'),
+                                 os.path.join(self.top, '20141215_00',
+                                              'ML1202')])
+
+    def test_pruned_dirs_are_not_read(self):
+        read = []
+
+        def scan(path):
+            read.append(path)
+            return tree_walker.scan_dir(path)
+        for root, dirs, _ in tree_walker.walk(self.top, 4, scan=scan):
+            if root == self.top:
+                dirs[:] = ['20141215_00']
+            elif root != os.path.join(self.top, '20141215_00'):
+                dirs[:] = []
+        self.assertEqual(sorted(read),
+                         [self.top, os.path.join(self.top, '20141215_00'),
+                          os.path.join(self.top, '20141215_00', 'ML1201'),
+                          os.path.join(self.top, '20141215_00', 'ML1202')])
+
+    def test_missing_top(self):
+        self.assertEqual(
+            list(tree_walker.walk(os.path.join(self.top, 'none'), 4)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+/*
+ * Program Name: GempakToCFBatch.java
+ * Contact(s): George McCabe
+ * Abstract: Runs GempakToCF on a list of files in one JVM
+ * History Log:  Initial version
+ * Usage: java -classpath <GEMPAKTOCF_CLASSPATH> GempakToCFBatch <list file>
+ *            <tag>
+ *        With Java 11 or later the source file can be run directly:
+ *        java -classpath <GEMPAKTOCF_CLASSPATH> GempakToCFBatch.java <list>
+ *            <tag>
+ * Parameters: list file, one GEMPAK file and the NetCDF file to write per
+ *             line, separated by a tab
+ *             tag, added to the temporary file names.  It must differ
+ *             between drivers running at the same time.
+ * Input Files: the GEMPAK files in the list
+ * Output Files: the NetCDF files in the list
+ * Condition codes: 0 for success, 1 if any file failed, 2 for bad usage
+ */
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileReader;
+import java.io.IOException;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+
+/**
+ * Calls GempakToCF.main for each pair in the list file, so the JVM starts
+ * once for the whole list instead of once per file.  GempakToCF is looked
+ * up at run time, so this file compiles without it on the classpath.
+ * Each file is written under a temporary name that includes the tag and
+ * renamed when it is complete, so readers never see a partial file and
+ * drivers converting the same file do not write to the same temporary
+ * file.  Files that already exist are skipped, and a failed file does not
+ * stop the rest.
+ */
+public class GempakToCFBatch {
+
+    public static void main(String[] args)
+        throws IOException, ReflectiveOperationException {
+        if (args.length != 2) {
+            System.err.println("Usage: GempakToCFBatch <list file> <tag>");
+            System.exit(2);
+        }
+        Method convert = Class.forName("GempakToCF")
+            .getMethod("main", String[].class);
+        int failed = 0;
+        BufferedReader reader = new BufferedReader(new FileReader(args[0]));
+        try {
+            String line;
+            while ((line = reader.readLine()) != null) {
+                String[] pair = line.split("\t");
+                if (pair.length != 2) {
+                    continue;
+                }
+                File outFile = new File(pair[1]);
+                if (outFile.isFile()) {
+                    continue;
+                }
+                File tmpFile = tmpFile(outFile, args[1]);
+                System.out.println("GempakToCF " + pair[0] + " " + pair[1]);
+                try {
+                    convert.invoke(null,
+                        (Object) new String[] {pair[0], tmpFile.getPath()});
+                } catch (InvocationTargetException e) {
+                    System.err.println("ERROR: GempakToCF failed for " +
+                                       pair[0] + ": " + e.getCause());
+                    tmpFile.delete();
+                    failed++;
+                    continue;
+                }
+                // another driver may have written outFile meanwhile, the
+                // rename replaces it with the same data
+                if (!tmpFile.isFile() || !tmpFile.renameTo(outFile)) {
+                    System.err.println("ERROR: GempakToCF did not write " +
+                                       pair[1]);
+                    failed++;
+                }
+            }
+        } finally {
+            reader.close();
+        }
+        System.exit(failed == 0 ? 0 : 1);
+    }
+
+    /** Keeps the extension, GempakToCF uses it to pick the format */
+    private static File tmpFile(File outFile, String tag) {
+        String name = outFile.getName();
+        int dot = name.lastIndexOf('.');
+        if (dot < 0) {
+            return new File(outFile.getParentFile(), name + ".tmp" + tag);
+        }
+        return new File(outFile.getParentFile(), name.substring(0, dot) +
+                        ".tmp" + tag + name.substring(dot));
+    }
+}
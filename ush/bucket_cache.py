@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+'''
+Program Name: bucket_cache.py
+Contact(s): George McCabe
+Abstract: Reuses pcp_combine outputs built from the same inputs
+History Log:  Initial version
+Usage: Used by PcpCombineWrapper.build when USE_BUCKET_CACHE = True
+Parameters: None
+Input Files: N/A
+Output Files: BUCKET_CACHE_FILE (JSON index of bucket files)
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import produtil.locking
+
+'''!@namespace bucket_cache
+@brief Content-addressed index of the accumulation buckets pcp_combine
+wrote.
+
+PcpCombineWrapper builds an observation bucket for every lead, variable,
+accumulation and observation type, and GridStatWrapper builds a model
+bucket for HREF_MEAN and NATIONAL_BLEND for each of them too.  The
+accumulation windows of nearby init times overlap, so the same 6 and 24
+hour sums are computed many times.  The run ledger only skips a command
+whose output path is the same.
+
+A BucketEntry digests everything that decides what pcp_combine writes:
+its arguments other than the output path, the input files in order
+with their field addons, the environment settings of the wrapper, and
+the size and modification time of each input file.  BUCKET_CACHE_FILE
+maps each digest to the bucket written for it, with the size and
+modification time the bucket had when the command finished.  If a
+bucket with the same digest is still unchanged, it is hard linked to
+the new output path, or copied where links are not possible, and
+pcp_combine is not run.  The index is shared by every process of the
+run through a lock file, which only excludes other processes, so the
+threads of a process also take a lock per index file.  The index keeps
+the BUCKET_CACHE_SIZE most recently used entries.  Evicting an entry
+only forgets it; the bucket files stay.
+'''
+
+# one BucketCache per (process id, index file)
+_caches = {}
+_caches_lock = threading.Lock()
+
+# one threading.Lock per index file, held with its lock file
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+def get_bucket_cache(p, logger):
+    """!Returns the BucketCache for this run, or None if USE_BUCKET_CACHE
+        is False.  Wrappers in the same process share one BucketCache.
+        @param p the config instance
+        @param logger a logging.Logger for log messages"""
+    if not p.getbool('config', 'USE_BUCKET_CACHE', False):
+        return None
+    filename = p.getstr('config', 'BUCKET_CACHE_FILE')
+    key = (os.getpid(), filename)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = BucketCache(filename,
+                                       p.getint('config', 'BUCKET_CACHE_SIZE',
+                                                1000),
+                                       logger)
+        return _caches[key]
+
+
+def _file_state(path):
+    """!Returns [size, mtime] of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+class BucketEntry(object):
+    """!The digest of one pcp_combine command, and the path it writes"""
+    def __init__(self, args, inputs, env_items, output):
+        self.output = output
+        states = [[path, addon, _file_state(path)] for path, addon in inputs]
+        # inputs that are missing, or still being written by queued
+        # commands, cannot be digested
+        self.valid = all(state is not None for _, _, state in states)
+        command = json.dumps({'args': list(args),
+                              'inputs': states,
+                              'env': sorted(env_items)}, sort_keys=True)
+        self.digest = hashlib.sha1(command.encode('utf-8')).hexdigest()
+
+
+class BucketCache(object):
+    """!The index of bucket files by the digest of their command"""
+    def __init__(self, filename, size, logger=None):
+        self.filename = filename
+        self.size = size
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+
+    def _update(self, change):
+        """!Reads the index, applies change to it and writes it back,
+            under the lock file
+            @param change function that takes the entries dict, changes
+            it in place and returns a result
+            @returns the result of change"""
+        parent = os.path.dirname(self.filename)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with _index_locks_lock:
+            index_lock = _index_locks.setdefault(
+                os.path.abspath(self.filename), threading.Lock())
+        with index_lock, \
+                produtil.locking.LockFile(self.filename + '.lock',
+                                          max_tries=300, sleep_time=0.1):
+            try:
+                with open(self.filename) as index_file:
+                    entries = json.load(index_file)
+            except (IOError, OSError, ValueError):
+                entries = {}
+            result = change(entries)
+            if len(entries) > self.size:
+                by_use = sorted(entries, key=lambda key: entries[key]['used'])
+                for key in by_use[:len(entries) - self.size]:
+                    del entries[key]
+            handle, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.filename) + '.',
+                suffix='.tmp', dir=parent or os.curdir)
+            with os.fdopen(handle, 'w') as index_file:
+                json.dump(entries, index_file, separators=(',', ':'))
+            os.rename(tmp_path, self.filename)
+        return result
+
+    def make_entry(self, args, inputs, env_items, output):
+        """!Creates the BucketEntry for a pcp_combine command
+            @param args arguments of the command, without the output path
+            @param inputs list of (path, field addon) in command order
+            @param env_items list of (name, value) environment settings
+            @param output the bucket file the command writes"""
+        return BucketEntry(args, inputs, env_items, output)
+
+    def reuse(self, entry):
+        """!Puts the bucket of an identical earlier command at the output
+            path of entry, if there is one
+            @returns True if the output is in place and the command does
+            not need to run"""
+        if not entry.valid:
+            return False
+
+        def lookup(entries):
+            cached = entries.get(entry.digest)
+            if cached is None or _file_state(cached['path']) != \
+                    cached['state']:
+                entries.pop(entry.digest, None)
+                return None
+            cached['used'] = time.time()
+            return cached['path']
+
+        path = self._update(lookup)
+        if path is None:
+            self.misses += 1
+            return False
+        if os.path.abspath(path) != os.path.abspath(entry.output):
+            try:
+                if os.path.lexists(entry.output):
+                    os.remove(entry.output)
+                try:
+                    os.link(path, entry.output)
+                except OSError:
+                    shutil.copy2(path, entry.output)
+            except (IOError, OSError) as err:
+                if self.logger is not None:
+                    self.logger.warning("Could not reuse bucket " + path +
+                                        ": " + str(err))
+                self.misses += 1
+                return False
+        self.hits += 1
+        if self.logger is not None:
+            self.logger.info("REUSING bucket " + path + " for " +
+                             entry.output)
+        return True
+
+    def prepare(self, entry):
+        """!Removes a hard linked output before the command writes it, so
+            the other names of the old bucket keep their contents"""
+        try:
+            if os.stat(entry.output).st_nlink > 1:
+                os.remove(entry.output)
+        except OSError:
+            pass
+
+    def record(self, entry):
+        """!Records the bucket a command wrote"""
+        if not entry.valid:
+            return
+        state = _file_state(entry.output)
+        if state is None:
+            return
+
+        def add(entries):
+            entries[entry.digest] = {'path': os.path.abspath(entry.output),
+                                     'state': state,
+                                     'used': time.time()}
+        self._update(add)
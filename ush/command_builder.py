@@ -23,6 +23,11 @@ import datetime
 import calendar
 import string_template_substitution as sts
 import met_util as util
+from command_executor import CommandExecutor
+import run_ledger
+import command_plan
+import resource_usage
+import tracing
 
 from abc import ABCMeta
 
@@ -30,6 +35,15 @@ from abc import ABCMeta
 class CommandBuilder:
     __metaclass__ = ABCMeta
 
+    # set to a command_plan.CommandPlan to collect commands without
+    # running them (master_metplus.py --plan)
+    plan = None
+
+    # True if run_at_time starts every command through build() or a
+    # TaskFarm, so master_metplus.py --plan can call it without running
+    # anything
+    plans_commands = False
+
     def __init__(self, p, logger):
         '''Retrieve parameters from corresponding param file'''
         self.p = p
@@ -38,6 +52,17 @@ class CommandBuilder:
         self.app_name = None
         self.app_path = None
         self.env = os.environ.copy()        
+        # names of the environment variables set with add_env_var
+        self.env_vars_set = set()
+        self.failed_commands = []
+        self.ledger = run_ledger.get_ledger(p, logger)
+        self.timing_stats = command_plan.get_timing_stats(p)
+        # with MAX_COMMANDS > 1, build() queues commands and flush() waits
+        max_commands = self.p.getint('config', 'MAX_COMMANDS', 1)
+        if max_commands > 1:
+            self.executor = CommandExecutor(max_commands, self.logger)
+        else:
+            self.executor = None
         self.clear()
 
     def clear(self):
@@ -84,6 +109,7 @@ class CommandBuilder:
 
     def add_env_var(self, key,  name):
         self.env[key] = name
+        self.env_vars_set.add(key)
 
     def get_env(self):
         return self.env
@@ -142,18 +168,145 @@ class CommandBuilder:
         cmd += os.path.join(self.outdir, self.outfile)
         return cmd
 
-    def build(self):
-        '''Build and run command'''
+    def get_input_paths(self):
+        '''Paths of the files the command reads, for the run ledger.
+        Input entries may have field information appended after the
+        filename, so only the first word is used.'''
+        paths = [f.split()[0] for f in self.infiles if f.strip() != ""]
+        if self.param != "":
+            paths.append(self.param)
+        return paths
+
+    def get_output_paths(self):
+        '''Paths of the files the command writes, for the run ledger'''
+        if self.outfile == "":
+            return []
+        return [self.get_output_path()]
+
+    def get_ledger_env(self):
+        '''Environment settings that affect the command, for the run
+        ledger'''
+        keys = set(self.env_vars_set)
+        keys.add('MET_BASE')
+        return [(k, self.env[k]) for k in sorted(keys) if k in self.env]
+
+    def build(self, on_success=None):
+        '''Build and run command.  If MAX_COMMANDS is greater than 1 the
+        command is queued with a snapshot of the environment and runs in
+        the background; call flush() before using its output.  If
+        CommandBuilder.plan is set, the command is only added to the plan.
+        on_success, if given, is called with no arguments once the
+        command has finished without error.  If get_in_process_job
+        returns a function, it is called here instead of running the
+        command, with the same bookkeeping.'''
         cmd = self.get_command()
         if cmd is None:
             return
-        (self.logger).info("RUNNING: " + cmd)
-        print("RUNNING: " + cmd)         
-        process = subprocess.Popen(cmd, env=self.env, shell=True)
-        process.wait()
+        app_name = self.app_name
+        if app_name is None:
+            app_name = os.path.basename(cmd.split()[0])
+        entry = None
+        up_to_date = False
+        if self.ledger is not None:
+            entry = self.ledger.make_entry(cmd, self.get_ledger_env(),
+                                           self.get_input_paths(),
+                                           self.get_output_paths())
+            up_to_date = self.ledger.is_current(entry)
+        if self.plan is not None:
+            self.plan.add(app_name, cmd, self.get_input_paths(),
+                          self.get_output_paths(), up_to_date)
+            return 0
+        if up_to_date:
+            (self.logger).info("SKIPPING, outputs are up to date: " + cmd)
+            return 0
+
+        def finished(seconds):
+            self.timing_stats.add(app_name, seconds)
+            if entry is not None:
+                self.ledger.record(entry)
+            if on_success is not None:
+                on_success()
+
+        in_process_job = self.get_in_process_job()
+        if self.executor is not None and in_process_job is None:
+            print("QUEUED: " + cmd)
+            self.executor.submit(cmd, self.env,
+                                 lambda job: finished(job.seconds))
+            return
+        if in_process_job is None:
+            (self.logger).info("RUNNING: " + cmd)
+            print("RUNNING: " + cmd)
+        else:
+            (self.logger).info("RUNNING in process: " + cmd)
+        start = time.time()
+        before = None
+        with tracing.span(app_name, 'command', cmd=cmd) as span:
+            if in_process_job is None:
+                process = subprocess.Popen(cmd, env=self.env, shell=True)
+                ret, usage = resource_usage.wait_with_usage(process)
+            else:
+                before = resource_usage.thread_usage()
+                ret = self.run_in_process_job(in_process_job, cmd)
+                usage = resource_usage.thread_usage()
+            span.set(exit_status=ret)
+        report = resource_usage.get_report()
+        if report is not None:
+            report.add(cmd, ret, time.time() - start, usage, before)
+        if ret != 0:
+            (self.logger).error("ERROR: Command exited with status " +
+                                str(ret) + ": " + cmd)
+            self.failed_commands.append(cmd)
+        else:
+            finished(time.time() - start)
+        return ret
 #        self.clear()
 
+    def get_in_process_job(self):
+        '''Return a function that build() calls with no arguments instead
+        of running the command from get_command, or None to run the
+        command.  The function does the same work in this process and
+        raises IOError, OSError, RuntimeError, KeyError or ValueError if
+        it fails.'''
+        return None
+
+    def run_in_process_job(self, job, cmd):
+        '''Call a function from get_in_process_job.  Returns 0 on success,
+        1 on failure.'''
+        try:
+            job()
+        except (IOError, OSError, RuntimeError, KeyError, ValueError) as e:
+            (self.logger).error("ERROR: In-process " + self.app_name +
+                                " failed: " + str(e) + ": " + cmd)
+            return 1
+        return 0
+
+    def flush(self):
+        '''Wait for all commands queued by build() to finish.  Returns
+        the commands that failed since the last flush.'''
+        if self.executor is not None:
+            for job in self.executor.join():
+                self.failed_commands.append(job.cmd)
+        failed = self.failed_commands
+        self.failed_commands = []
+        return failed
+
+    def get_task_inputs(self, init_time):
+        '''Return the products run_at_time(init_time) reads, as hashable
+        keys that match the keys other wrappers return from
+        get_task_outputs.  Used by the LOOP_METHOD = graph scheduler.
+        None means the inputs are unknown, so the task waits for the
+        previous process in PROCESS_LIST at the same init time.'''
+        return None
+
+    def get_task_outputs(self, init_time):
+        '''Return the products run_at_time(init_time) writes, as keys
+        that other wrappers can list in get_task_inputs'''
+        return []
+
     def run_all_times(self):
+        '''Call run_at_time for every init time from INIT_BEG to INIT_END.
+        Returns the commands that failed.  Wrappers that override this
+        may return None.'''
         time_format = self.p.getstr('config', 'INIT_TIME_FMT')
         start_t = self.p.getstr('config', 'INIT_BEG')
         end_t = self.p.getstr('config', 'INIT_END')
@@ -166,7 +319,14 @@ class CommandBuilder:
         init_time = calendar.timegm(time.strptime(start_t, time_format))
         end_time = calendar.timegm(time.strptime(end_t, time_format))
 
+        # the usage report groups the commands by init time
+        wrapper = resource_usage.get_context()[0]
+        failed = []
         while init_time <= end_time:
             run_time = time.strftime("%Y%m%d_%H", time.gmtime(init_time))
+            resource_usage.set_context(wrapper, run_time)
             self.run_at_time(run_time)
+            failed.extend(self.flush())
             init_time += time_interval
+        resource_usage.set_context(wrapper)
+        return failed
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+'''
+Program Name: command_executor.py
+Contact(s): George McCabe
+Abstract: Runs the commands queued by CommandBuilder.build concurrently
+History Log:  Initial version
+Usage: Created by CommandBuilder when MAX_COMMANDS is greater than 1
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import subprocess
+import threading
+import time
+import resource_usage
+import tracing
+
+'''!@namespace command_executor
+@brief Runs shell commands in background threads, at most max_commands
+at a time.
+
+Python 2 has no asyncio, so each queued command gets a thread that waits
+on a bounded semaphore before starting its subprocess.  The threads only
+wait on subprocess output, so the GIL is not a bottleneck.  The output
+of each command is captured and written to the log as one block when
+the command finishes, so output from concurrent commands does not
+interleave.  join() waits for every queued command and returns the ones
+that failed.
+'''
+
+
+class CommandJob(object):
+    """!One command queued in a CommandExecutor"""
+    def __init__(self, cmd, env, on_success=None):
+        self.cmd = cmd
+        self.env = env
+        self.on_success = on_success
+        self.returncode = None
+        self.output = ""
+        self.seconds = 0.0
+        self.usage = None
+        # wrapper and init time for the usage report
+        self.context = resource_usage.get_context()
+        self.span_parent = tracing.current_span()
+        self.thread = None
+
+    @property
+    def failed(self):
+        return self.returncode != 0
+
+
+class CommandExecutor(object):
+    """!Runs shell commands concurrently, at most max_commands at once"""
+    def __init__(self, max_commands, logger):
+        self.max_commands = max(1, int(max_commands))
+        self.logger = logger
+        self._semaphore = threading.BoundedSemaphore(self.max_commands)
+        self._lock = threading.Lock()
+        self._jobs = []
+
+    def submit(self, cmd, env, on_success=None):
+        """!Queues a command.  It starts as soon as fewer than
+            max_commands commands are running.
+            @param cmd shell command to run
+            @param env environment for the command.  It is copied, so the
+            caller can keep changing its own copy.
+            @param on_success optional function called with the CommandJob
+            from the worker thread if the command exits with status 0
+            @returns the CommandJob"""
+        job = CommandJob(cmd, dict(env), on_success)
+        job.thread = threading.Thread(target=self._run_job, args=[job])
+        job.thread.daemon = True
+        with self._lock:
+            self._jobs.append(job)
+        job.thread.start()
+        return job
+
+    def _run_job(self, job):
+        with self._semaphore, \
+             tracing.span(resource_usage.tool_name(job.cmd), 'command',
+                          parent=job.span_parent, cmd=job.cmd) as span:
+            self.logger.info("RUNNING: " + job.cmd)
+            start = time.time()
+            try:
+                process = subprocess.Popen(job.cmd, env=job.env, shell=True,
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+                output = process.stdout.read()
+                process.stdout.close()
+                job.returncode, job.usage = \
+                    resource_usage.wait_with_usage(process)
+                if not isinstance(output, str):
+                    output = output.decode('utf-8', 'replace')
+                job.output = output
+            except (OSError, ValueError) as e:
+                job.output = str(e)
+                job.returncode = -1
+            job.seconds = time.time() - start
+            span.set(exit_status=job.returncode)
+        self._log_job(job)
+        report = resource_usage.get_report()
+        if report is not None and job.usage is not None:
+            report.add(job.cmd, job.returncode, job.seconds, job.usage,
+                       wrapper=job.context[0], init_time=job.context[1])
+        if not job.failed and job.on_success is not None:
+            try:
+                job.on_success(job)
+            except Exception as e:
+                self.logger.warning("Post-processing failed for " +
+                                    job.cmd + ": " + str(e))
+
+    def _log_job(self, job):
+        msg = "FINISHED (exit %d, %.1f seconds): %s" % \
+              (job.returncode, job.seconds, job.cmd)
+        if job.output:
+            msg += "\n" + job.output.rstrip("\n")
+        if job.failed:
+            self.logger.error("ERROR: " + msg)
+        else:
+            self.logger.info(msg)
+
+    def join(self):
+        """!Waits for every queued command to finish.
+            @returns list of CommandJobs that exited with non-zero status"""
+        with self._lock:
+            jobs = self._jobs
+            self._jobs = []
+        for job in jobs:
+            job.thread.join()
+        return [job for job in jobs if job.failed]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+'''
+Program Name: command_plan.py
+Contact(s): George McCabe
+Abstract: Collects the commands a run would execute, with cost estimates
+History Log:  Initial version
+Usage: master_metplus.py --plan /path/to/plan.json
+Parameters: None
+Input Files: TIMING_STATS_FILE
+Output Files: JSON plan, TIMING_STATS_FILE
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import json
+import threading
+import time
+import produtil.locking
+
+'''!@namespace command_plan
+@brief Dry-run planning and historical command timings.
+
+When CommandBuilder.plan is set to a CommandPlan, build() adds the
+command to the plan instead of running it.  master_metplus --plan runs
+every run_at_time loop this way and writes the plan as JSON, with an
+estimated run time for each command taken from TIMING_STATS_FILE.
+
+TIMING_STATS_FILE holds the number of runs and total seconds for each
+MET application.  Every command that runs successfully adds to these
+totals, and the file is merged under a lock file when it is saved, so
+concurrent METplus runs can share it.
+'''
+
+PLAN_FORMAT_VERSION = 1
+
+# one TimingStats per (process id, stats file)
+_timing_stats = {}
+_timing_stats_lock = threading.Lock()
+
+
+def get_timing_stats(p):
+    """!Returns the TimingStats shared by every wrapper in this process
+        @param p the config instance"""
+    filename = p.getstr('config', 'TIMING_STATS_FILE', '')
+    key = (os.getpid(), filename)
+    with _timing_stats_lock:
+        if key not in _timing_stats:
+            _timing_stats[key] = TimingStats(filename)
+        return _timing_stats[key]
+
+
+class TimingStats(object):
+    """!Historical run times of each MET application"""
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        # app name -> [count, total seconds] for runs not yet saved
+        self._new = {}
+        self._saved = self._read()
+
+    def _read(self):
+        if not self.filename or not os.path.isfile(self.filename):
+            return {}
+        try:
+            with open(self.filename) as stats_file:
+                return json.load(stats_file).get('apps', {})
+        except (IOError, ValueError):
+            return {}
+
+    def add(self, app, seconds):
+        """!Records one successful run of an application"""
+        with self._lock:
+            count, total = self._new.get(app, [0, 0.0])
+            self._new[app] = [count + 1, total + seconds]
+
+    def estimate(self, app):
+        """!Returns the mean run time of an application in seconds, or None
+            if it has never been timed"""
+        with self._lock:
+            count, total = self._saved.get(app, [0, 0.0])
+            new_count, new_total = self._new.get(app, [0, 0.0])
+        count += new_count
+        total += new_total
+        if count == 0:
+            return None
+        return total / count
+
+    def save(self):
+        """!Adds the runs recorded since the last save to the stats file"""
+        if not self.filename:
+            return
+        with self._lock:
+            new = self._new
+            self._new = {}
+        if not new:
+            return
+        parent = os.path.dirname(self.filename)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with produtil.locking.LockFile(self.filename + '.lock',
+                                       max_tries=300, sleep_time=0.1):
+            apps = self._read()
+            for app, (count, total) in new.items():
+                old_count, old_total = apps.get(app, [0, 0.0])
+                apps[app] = [old_count + count, old_total + total]
+            tmpname = self.filename + '.tmp'
+            with open(tmpname, 'w') as stats_file:
+                json.dump({'apps': apps}, stats_file, indent=1,
+                          sort_keys=True)
+            os.rename(tmpname, self.filename)
+        with self._lock:
+            self._saved = apps
+
+
+class CommandPlan(object):
+    """!The commands a run would execute, collected without running them"""
+    def __init__(self, timing_stats=None):
+        self.timing_stats = timing_stats
+        self.commands = []
+        self.unplanned = []
+        self.process = None
+        self.init_time = None
+        self._lock = threading.Lock()
+
+    def set_context(self, process, init_time):
+        """!Sets the process and init time recorded with the next commands"""
+        self.process = process
+        self.init_time = init_time
+
+    def add_unplanned(self, process, reason):
+        """!Notes a process whose commands cannot be planned"""
+        self.unplanned.append({'process': process, 'reason': reason})
+
+    def add(self, app, cmd, inputs, outputs, up_to_date=False):
+        """!Adds a command to the plan
+            @param app name of the MET application
+            @param cmd the command line
+            @param inputs paths the command reads
+            @param outputs paths the command writes
+            @param up_to_date True if the run ledger would skip it"""
+        estimate = None
+        if up_to_date:
+            estimate = 0.0
+        elif self.timing_stats is not None:
+            estimate = self.timing_stats.estimate(app)
+        with self._lock:
+            self.commands.append({'process': self.process,
+                                  'init_time': self.init_time,
+                                  'app': app,
+                                  'cmd': cmd,
+                                  'inputs': list(inputs),
+                                  'outputs': list(outputs),
+                                  'up_to_date': up_to_date,
+                                  'estimated_seconds': estimate})
+
+    def summary(self):
+        """!Returns command counts and estimated seconds per application.
+            Commands with no timing history are counted as unestimated."""
+        apps = {}
+        total = 0.0
+        for command in self.commands:
+            app = apps.setdefault(command['app'],
+                                  {'commands': 0, 'up_to_date': 0,
+                                   'unestimated': 0,
+                                   'estimated_seconds': 0.0})
+            app['commands'] += 1
+            if command['up_to_date']:
+                app['up_to_date'] += 1
+            if command['estimated_seconds'] is None:
+                app['unestimated'] += 1
+            else:
+                app['estimated_seconds'] += command['estimated_seconds']
+                total += command['estimated_seconds']
+        return {'commands': len(self.commands),
+                'estimated_seconds': total,
+                'apps': apps}
+
+    def write(self, filename):
+        """!Writes the plan as JSON"""
+        parent = os.path.dirname(filename)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with open(filename, 'w') as plan_file:
+            json.dump({'format_version': PLAN_FORMAT_VERSION,
+                       'created': time.strftime('%Y%m%d%H%M%S',
+                                                time.gmtime()),
+                       'summary': self.summary(),
+                       'unplanned': self.unplanned,
+                       'commands': self.commands},
+                      plan_file, indent=1, sort_keys=True)
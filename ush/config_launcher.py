@@ -13,6 +13,7 @@ from os.path import dirname, realpath
 # from random import Random
 from produtil.config import ProdConfig
 import met_util as util
+import config_snapshot
 
 """!Creates the initial METplus directory structure,
 loads information into each job.
@@ -282,6 +283,9 @@ def launch(file_list, moreopt, cycle=None, init_dirs=True,
         logger.info('METPLUS_CONF: %s written here.' % (confloc,))
         with open(confloc, 'wt') as f:
             conf.write(f)
+        # the expanded values, for load() in child processes
+        config_snapshot.write_snapshot(
+            conf, config_snapshot.snapshot_path(confloc), [confloc])
     return conf
 
 
@@ -295,6 +299,12 @@ def load(filename):
 
     @param filename The metplus*.conf file created by launch()"""
 
+    # the snapshot written by launch() is used if filename is unchanged
+    conf = config_snapshot.read_snapshot(
+        config_snapshot.snapshot_path(filename), METplusLauncher())
+    if conf is not None:
+        return conf
+
     conf = METplusLauncher()
     conf.read(filename)
     #    logger = conf.log()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+'''
+Program Name: config_snapshot.py
+Contact(s): George McCabe
+Abstract: Saves the final configuration, already expanded, for fast loading
+History Log:  Initial version
+Usage: Written by config_launcher.launch, read by config_launcher.load
+Parameters: None
+Input Files: METPLUS_CONF and its snapshot
+Output Files: the snapshot of METPLUS_CONF
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import json
+import hashlib
+
+'''!@namespace config_snapshot
+@brief A frozen copy of the final METPLUS_CONF with its values expanded.
+
+config_launcher.load reads METPLUS_CONF with ConfigParser, and every
+getstr, getint or getbool then expands the value again, searching the
+[config] and [dir] sections for each {name} in it.  Each process of a
+LOOP_METHOD = parallel_times pool pays that cost again for the same
+file.
+
+launch() writes METPLUS_CONF, expands every option once and writes a
+JSON snapshot next to it.  The snapshot holds a format version, the
+SHA-1 digest of METPLUS_CONF, the raw value of each option and the
+expanded value of each option that can be expanded on its own.  Options
+such as the filename templates, which are read with getraw, cannot be.
+load() builds the configuration from the raw values without parsing
+the file, and fills the ProdConfig cache with the expanded values, so
+getters return them without expanding anything.  Values that read an
+environment variable are left out, since the environment of a later
+process may differ.
+
+If the snapshot is missing, was written by another format version, or
+METPLUS_CONF was changed after it was written, load() reads METPLUS_CONF
+as before.
+'''
+
+'''!@var FORMAT_VERSION
+Version of the snapshot layout.  Snapshots of other versions are
+ignored.'''
+FORMAT_VERSION = 1
+
+
+def snapshot_path(conf_file):
+    """!Returns the path of the snapshot of a final conf file"""
+    return conf_file + '.snapshot.json'
+
+
+def file_digest(path):
+    """!Returns the SHA-1 hex digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file_handle:
+        for block in iter(lambda: file_handle.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_snapshot(conf, path, source_files):
+    """!Expands every option of conf and writes the snapshot
+        @param conf the ProdConfig, as written to the source files
+        @param path the snapshot file to write
+        @param source_files the files conf was read from.  The snapshot
+        is only used while their contents are unchanged."""
+    raw = {}
+    for section in conf.sections():
+        raw[section] = dict((option, conf.getraw(section, option))
+                            for option in conf.keys(section))
+        for option in raw[section]:
+            try:
+                conf.getstr(section, option)
+            except Exception:
+                # templates and other values with keys that are only
+                # known later, which are read with getraw
+                continue
+    expanded = [[section, option, value] for (section, option), value
+                in conf.expanded_values() if section in raw]
+    snapshot = {'format_version': FORMAT_VERSION,
+                'sources': dict((os.path.abspath(source), file_digest(source))
+                                for source in source_files),
+                'raw': raw,
+                'expanded': expanded}
+
+    # written under another name first, so a process loading the
+    # snapshot never reads it half written
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_path, 'w') as file_handle:
+        json.dump(snapshot, file_handle, separators=(',', ':'))
+    os.rename(tmp_path, path)
+
+
+def read_snapshot(path, conf):
+    """!Fills an empty ProdConfig from a snapshot
+        @param path the snapshot file
+        @param conf the new, empty ProdConfig to fill
+        @returns conf, or None if the snapshot is missing, of another
+        format version, or older than its source files"""
+    try:
+        with open(path) as file_handle:
+            snapshot = json.load(file_handle)
+    except (IOError, OSError, ValueError):
+        return None
+    if snapshot.get('format_version') != FORMAT_VERSION:
+        return None
+    try:
+        for source, digest in snapshot['sources'].items():
+            if file_digest(source) != digest:
+                return None
+    except (IOError, OSError):
+        return None
+
+    conf.set_raw_options(dict(
+        (str(section), dict((str(option), str(value))
+                            for option, value in options.items()))
+        for section, options in snapshot['raw'].items()))
+    conf.preload_expanded(((str(section), str(option)), str(value))
+                          for section, option, value
+                          in snapshot['expanded'])
+    return conf
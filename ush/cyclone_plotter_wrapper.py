@@ -12,12 +12,6 @@ import time
 import datetime
 import re
 import sys
-#pylint:disable=import-error
-# numpy, matplotlib and mpl_toolkits are not part of the standard Python
-# library
-import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap as Basemap
 import met_util as util
 import produtil.setup
 import config_metplus
@@ -301,6 +295,11 @@ class CyclonePlotterWrapper(CommandBuilder):
     def create_plot(self):
         """ Create the plot, with a Basemap of the projection type
             requested in the metplus.conf file."""
+        #pylint:disable=import-error
+        # numpy and matplotlib are not part of the standard Python library
+        # and are slow to import, so only import them when plotting.
+        import numpy as np
+        import matplotlib.pyplot as plt
         #pylint:disable=redefined-builtin
         #pylint:disable=unused-variable
         map, proj_type, extent = self.get_basemap()
@@ -529,6 +528,10 @@ class CyclonePlotterWrapper(CommandBuilder):
             Returns:
         """
 
+        #pylint:disable=import-error
+        # mpl_toolkits is not part of the standard Python library
+        from mpl_toolkits.basemap import Basemap
+
         # Retrieve the llcrnr lons and lats,
         # urcrnr lons and lats and resolution
         llcrnr_lon = self.llcrnrlon
@@ -23,6 +23,9 @@ from command_builder import CommandBuilder
 import met_util as util
 import config_metplus
 from tc_stat_wrapper import TcStatWrapper
+from task_farm import TaskFarm
+import resource_usage
+import tracing
 
 '''!@namespace ExtractTilesWrapper
 @brief Runs  Extracts tiles to be used by series_analysis.
@@ -83,10 +86,15 @@ class ExtractTilesWrapper(CommandBuilder):
 
         # Loop from begYYYYMMDD to endYYYYMMDD incrementing by HH
         # and ending on the endYYYYMMDD_HH End Hour.
+        # the usage report groups the commands by init time
+        wrapper = resource_usage.get_context()[0]
         while init_time <= end_time:
-            self.run_at_time(init_time.strftime("%Y%m%d_%H"))
+            run_time = init_time.strftime("%Y%m%d_%H")
+            resource_usage.set_context(wrapper, run_time)
+            self.run_at_time(run_time)
             init_time = init_time + datetime.timedelta(
                 hours=self.init_hour_inc)
+        resource_usage.set_context(wrapper)
 
         # Remove any empty files and directories in the extract_tiles output
         # directory
@@ -179,6 +187,9 @@ class ExtractTilesWrapper(CommandBuilder):
             self.logger.debug(msg)
             return
 
+        # Regrid commands for every storm are collected and run together
+        farm = TaskFarm(self.config, self.logger)
+
         # Process each storm in the sorted_storm_ids list
         # Iterate over each filter file in the output directory and
         # search for the presence of the storm id.  Store this
@@ -203,11 +214,14 @@ class ExtractTilesWrapper(CommandBuilder):
             # Perform regridding of the forecast and analysis files
             # to an n X n degree tile centered on the storm (dimensions
             # are indicated in the config/param file).
-            util.retrieve_and_regrid(full_tmp_filename, cur_init,
-                                     cur_storm, self.filtered_out_dir,
-                                     self.logger, self.config)
+            with tracing.span('retrieve_and_regrid', 'storm',
+                              storm_id=cur_storm):
+                util.retrieve_and_regrid(full_tmp_filename, cur_init,
+                                         cur_storm, self.filtered_out_dir,
+                                         self.logger, self.config, farm)
 
         # end of for cur_storm
+        farm.run()
 
         # Remove any empty files and directories in the extract_tiles output
         # directory
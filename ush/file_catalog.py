@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+'''
+Program Name: file_catalog.py
+Contact(s): George McCabe
+Abstract: Cached directory listings shared by the wrappers of one run
+History Log:  Initial version
+Usage: file_catalog.get_file_catalog().files(top_dir, regex)
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import re
+import threading
+import time
+import tree_walker
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport of os.scandir for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+'''!@namespace file_catalog
+@brief Walks each directory tree once and answers file queries from
+memory.
+
+met_util.get_files, get_dirs and friends and SeriesByLead search the
+extract tiles and series analysis trees many times per run, once for
+every init time, storm or forecast hour.  A FileCatalog lists each
+directory once, with os.scandir when it is available, and keeps the
+entries.  The tree is read with tree_walker.walk, so with WALK_THREADS
+greater than one the directories are listed and checked in parallel
+threads.  Before a cached listing is used again the directory is
+stat'ed: if its modification time changed, because a file or
+subdirectory was added or removed, that directory alone is listed again.
+A listing made within RACY_SECONDS of the directory's last change is not
+trusted, since a file system with coarse time stamps could change it
+again without changing its modification time.
+
+Every wrapper in a process shares the catalog returned by
+get_file_catalog().  Changes to the contents of a file do not change its
+directory, so the size and time stamp returned by get_stat() are those
+of the first time the file was seen after its directory last changed.
+'''
+
+'''!@var RACY_SECONDS
+A directory modified less than this many seconds before it was listed
+is listed again on its next use.'''
+RACY_SECONDS = 1.0
+
+# one FileCatalog per process
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_file_catalog():
+    """!Returns the FileCatalog shared by every wrapper in this process"""
+    pid = os.getpid()
+    with _catalogs_lock:
+        if pid not in _catalogs:
+            _catalogs[pid] = FileCatalog()
+        return _catalogs[pid]
+
+
+class _ListdirEntry(object):
+    """!Stands in for os.DirEntry when scandir is not available"""
+    def __init__(self, parent, name):
+        self.name = name
+        self.path = os.path.join(parent, name)
+        self._stat = None
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def _list_dir(path):
+    """!Returns the entries of a directory, from scandir if available"""
+    if scandir is not None:
+        return list(scandir(path))
+    return [_ListdirEntry(path, name) for name in os.listdir(path)]
+
+
+class _Listing(object):
+    """!The files and subdirectories of one directory"""
+    def __init__(self, path):
+        self.mtime = os.stat(path).st_mtime
+        self.time = time.time()
+        self.files = {}
+        self.dirs = []
+        # directory links, which are listed but not walked into
+        self.links = set()
+        for entry in _list_dir(path):
+            try:
+                if entry.is_dir():
+                    self.dirs.append(entry.name)
+                    if entry.is_symlink():
+                        self.links.add(entry.name)
+                else:
+                    self.files[entry.name] = entry
+            except OSError:
+                # removed while listing
+                continue
+        self.dirs.sort()
+        self.dir_set = set(self.dirs)
+        self.names = sorted(self.files)
+
+    def is_current(self, mtime):
+        return mtime == self.mtime and self.time - mtime > RACY_SECONDS
+
+
+class FileCatalog(object):
+    """!Directory listings of the trees searched during a run"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listings = {}
+
+    def _listing(self, path):
+        """!Returns the current listing of a directory, or None if it
+            does not exist"""
+        path = os.path.normpath(path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            listing = self._listings.get(path)
+        if listing is not None and listing.is_current(mtime):
+            return listing
+        try:
+            listing = _Listing(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._listings[path] = listing
+        return listing
+
+    def invalidate(self, path=None):
+        """!Forgets the listings of a directory and everything below it
+            @param path the directory, or None to forget everything"""
+        with self._lock:
+            if path is None:
+                self._listings = {}
+                return
+            path = os.path.normpath(path)
+            below = path.rstrip(os.sep) + os.sep
+            for cached in list(self._listings):
+                if cached == path or cached.startswith(below):
+                    del self._listings[cached]
+
+    def _scan(self, path):
+        """!Reads a directory for tree_walker.walk from the catalog"""
+        listing = self._listing(path)
+        if listing is None:
+            raise OSError('Cannot list directory: ' + path)
+        return (list(listing.dirs), list(listing.names),
+                [name for name in listing.dirs if name not in listing.links])
+
+    def walk(self, top, ordered=True):
+        """!Generates (dirpath, dirnames, filenames) for each directory in
+            the tree, top down and in sorted order, like os.walk.  Links
+            to directories are not followed.
+            @param top the topmost directory
+            @param ordered False to yield the directories in the order
+            their listings are ready instead"""
+        return tree_walker.walk(top, ordered=ordered, scan=self._scan)
+
+    def walk_listings(self, top):
+        """!Like walk, but generates (dirpath, dirnames, listing), where
+            listing is the catalog's own listing of the directory, with the
+            sorted file names in listing.names.  A directory gets a new
+            listing object only when it changes, so a caller that keeps
+            what it derived from a directory can compare the listings by
+            identity instead of comparing the names.  Pruning dirnames
+            stops the walk from reading those directories.
+            @param top the topmost directory"""
+        def scan(path):
+            listing = self._listing(path)
+            if listing is None:
+                raise OSError('Cannot list directory: ' + path)
+            return (list(listing.dirs), listing,
+                    [name for name in listing.dirs
+                     if name not in listing.links])
+        return tree_walker.walk(top, scan=scan)
+
+    def listdir(self, path):
+        """!Returns the sorted names of the files and subdirectories of a
+            directory, or an empty list if it does not exist"""
+        listing = self._listing(path)
+        if listing is None:
+            return []
+        return sorted(listing.dirs + listing.names)
+
+    def files(self, top, regex=None, prefix=None):
+        """!Returns the full paths of the files in a tree whose names match
+            @param top the topmost directory of the search
+            @param regex regular expression the file name must match from
+            its start, as with re.match
+            @param prefix string the file name must start with
+            @returns list of paths, sorted within each directory"""
+        pattern = re.compile(regex) if regex is not None else None
+        paths = []
+        for root, _, names in self.walk(top):
+            for name in names:
+                if prefix is not None and not name.startswith(prefix):
+                    continue
+                if pattern is not None and not pattern.match(name):
+                    continue
+                paths.append(os.path.join(root, name))
+        return paths
+
+    def dirs(self, top):
+        """!Returns the full paths of every directory below top"""
+        return [os.path.join(root, name)
+                for root, names, _ in self.walk(top) for name in names]
+
+    def existing(self, paths):
+        """!Returns the set of paths that exist, listing each directory
+            once instead of checking each path
+            @param paths file or directory paths"""
+        by_dir = {}
+        for path in paths:
+            by_dir.setdefault(os.path.dirname(path) or os.curdir,
+                              []).append(path)
+        found = set()
+        for dirname, dir_paths in by_dir.items():
+            listing = self._listing(dirname)
+            if listing is None:
+                continue
+            for path in dir_paths:
+                name = os.path.basename(path)
+                if name in listing.files or name in listing.dir_set:
+                    found.add(path)
+        return found
+
+    def get_stat(self, path):
+        """!Returns the os.stat result of a file in the catalog, or None if
+            the file does not exist"""
+        listing = self._listing(os.path.dirname(path))
+        if listing is None:
+            return None
+        entry = listing.files.get(os.path.basename(path))
+        if entry is None:
+            return None
+        try:
+            return entry.stat()
+        except OSError:
+            return None
@@ -14,10 +14,20 @@ Condition codes: 0 for success, 1 for failure
 
 from __future__ import (print_function, division)
 
+import os
+import shutil
+import tempfile
+import threading
+import met_util as util
 from command_builder import CommandBuilder
+from command_executor import CommandExecutor
 
 
 class GempakToCFWrapper(CommandBuilder):
+    # one lock per output file so tasks running concurrently under
+    # LOOP_METHOD = graph do not convert the same file twice
+    _output_locks = {}
+    _output_locks_guard = threading.Lock()
 
     def __init__(self, p, logger):
         super(GempakToCFWrapper, self).__init__(p, logger)
@@ -41,3 +51,98 @@ class GempakToCFWrapper(CommandBuilder):
 
         cmd += self.get_output_path()
         return cmd
+
+    @staticmethod
+    def _output_lock(outpath):
+        with GempakToCFWrapper._output_locks_guard:
+            return GempakToCFWrapper._output_locks.setdefault(
+                outpath, threading.Lock())
+
+    def build(self):
+        '''Convert to a temporary file, then rename it into place so that
+        other tasks never read a partially written file.  The temporary
+        name includes the process id, so runs in other processes that
+        convert the same file do not write to it.'''
+        if self.plan is not None:
+            return super(GempakToCFWrapper, self).build()
+        outpath = self.get_output_path()
+        with self._output_lock(outpath):
+            if os.path.isfile(outpath):
+                return
+            # keep the extension, GempakToCF uses it to pick the format
+            root, ext = os.path.splitext(self.outfile)
+            tmpfile = root + ".tmp" + str(os.getpid()) + ext
+            self.set_output_filename(tmpfile)
+            super(GempakToCFWrapper, self).build()
+            # the caller reads the converted file right away
+            self.flush()
+            self.set_output_filename(os.path.basename(outpath))
+            tmppath = os.path.join(self.outdir, tmpfile)
+            if os.path.isfile(tmppath):
+                os.rename(tmppath, outpath)
+
+    def convert_batch(self, pairs):
+        '''Convert each (GEMPAK file, NetCDF file) pair whose NetCDF file
+        does not exist yet.  Starting a JVM for every file takes longer
+        than converting it, so the pairs are split into
+        GEMPAKTOCF_BATCH_WORKERS lists and each list is converted in one
+        JVM by GEMPAKTOCF_BATCH_DRIVER, with the lists running at the same
+        time.  The output locks of the files are held until the batch is
+        done, so build and other batches do not convert them again.
+        Returns the commands that failed.'''
+        todo = {}
+        for infile, outfile in pairs:
+            if outfile not in todo and not os.path.isfile(outfile):
+                todo[outfile] = infile
+        # always taken in the same order, so two batches cannot deadlock
+        locks = [self._output_lock(outfile) for outfile in sorted(todo)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            # files converted by another task while this one waited
+            todo = [(todo[outfile], outfile) for outfile in sorted(todo)
+                    if not os.path.isfile(outfile)]
+            return self._convert_batch(todo)
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _convert_batch(self, todo):
+        if len(todo) == 0:
+            return []
+        if self.plan is not None:
+            for infile, outfile in todo:
+                self.clear()
+                self.add_input_file(infile)
+                self.set_output_path(outfile)
+                self.build()
+            self.clear()
+            return []
+
+        workers = min(len(todo),
+                      max(1, self.p.getint('config',
+                                           'GEMPAKTOCF_BATCH_WORKERS', 1)))
+        driver = self.p.getstr('exe', 'GEMPAKTOCF_BATCH_DRIVER',
+                               os.path.join(os.path.dirname(
+                                   os.path.abspath(__file__)),
+                                            'GempakToCFBatch.java'))
+        tmp_dir = self.p.getdir('TMP_DIR')
+        util.mkdir_p(tmp_dir)
+        list_dir = tempfile.mkdtemp(prefix='gempaktocf_', dir=tmp_dir)
+        executor = CommandExecutor(workers, self.logger)
+        for worker in range(workers):
+            list_file = os.path.join(list_dir, 'batch_' + str(worker))
+            with open(list_file, 'w') as list_handle:
+                for infile, outfile in todo[worker::workers]:
+                    util.mkdir_p(os.path.dirname(outfile))
+                    list_handle.write(infile + "\t" + outfile + "\n")
+            # the driver adds the tag to its temporary file names, so
+            # other workers and processes never write the same one
+            executor.submit("java -classpath " + self.class_path + " " +
+                            driver + " " + list_file + " " +
+                            str(os.getpid()) + "_" + str(worker), self.env)
+        failed = [job.cmd for job in executor.join()]
+        shutil.rmtree(list_dir)
+        for cmd in failed:
+            self.logger.error("ERROR: GempakToCF batch failed: " + cmd)
+        return failed
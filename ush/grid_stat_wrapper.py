@@ -21,14 +21,18 @@ import met_util as util
 import re
 import csv
 import subprocess
+import datetime
 from command_builder import CommandBuilder
 from pcp_combine_wrapper import PcpCombineWrapper
 from gempak_to_cf_wrapper import GempakToCFWrapper
-from task_info import TaskInfo
+from task_info import TaskInfo, task_info_list
 import string_template_substitution as sts
+from time_index import get_time_index
+import tracing
 
 
 class GridStatWrapper(CommandBuilder):
+    plans_commands = True
 
     def __init__(self, p, logger):
         super(GridStatWrapper, self).__init__(p, logger)
@@ -39,6 +43,12 @@ class GridStatWrapper(CommandBuilder):
     def set_output_dir(self, outdir):
         self.outdir = "-outdir "+outdir
 
+    def get_output_paths(self):
+        # grid_stat names its own files inside the output directory
+        if self.outdir == "":
+            return []
+        return [self.outdir[len("-outdir "):]]
+
     def get_command(self):
         if self.app_path is None:
             self.logger.error(self.app_name + ": No app path specified. \
@@ -72,32 +82,38 @@ class GridStatWrapper(CommandBuilder):
         forecasts = model_type+'_FORECASTS'
         max_forecast = util.getlistint(self.p.getstr('config', forecasts))[-1]
         init_interval = self.p.getint('config', model_type+'_INIT_INTERVAL')
-        lead_check = lead
-        time_check = init_time
-        time_offset = 0
-        found = False
-        while lead_check <= max_forecast:
-            native_template = self.p.getraw('filename_templates',
-                                            model_type+'_NATIVE_TEMPLATE')
-            model_ss = sts.StringSub(self.logger, native_template,
-                                     init=time_check,
-                                     lead=str(lead_check).zfill(2))
-            model_file = model_ss.doStringSub()
-            print("model file: "+model_file)
-            model_path = os.path.join(model_dir, model_file)
-            if os.path.exists(model_path):
-                found = True
-                break
-
-            time_check = util.shift_time(time_check, -init_interval)
-            lead_check = lead_check + init_interval
-
-        if found:
-            return model_path
-        else:
+        native_template = self.p.getraw('filename_templates',
+                                        model_type+'_NATIVE_TEMPLATE')
+
+        # Earlier inits with longer leads for the same valid time, up to
+        # the longest forecast, are looked up in the index of model_dir,
+        # and the one with the latest init is used
+        valid_dt = datetime.datetime.strptime(init_time, "%Y%m%d%H%M") + \
+            datetime.timedelta(hours=lead)
+        leads = [lead_check * 3600 for lead_check
+                 in range(lead, max_forecast + 1, init_interval)]
+        model_path = get_time_index(model_dir, native_template)\
+            .lowest_lead_at_valid(valid_dt, leads)
+        if model_path is None:
             return ''
+        return model_path
+
+    def get_task_inputs(self, init_time):
+        return [('regrid', ti.ob_type, ti.getValidTime()[0:10], int(ti.level))
+                for ti in task_info_list(self.p, init_time)]
+
+    def get_task_outputs(self, init_time):
+        # HREF_MEAN and NATIONAL_BLEND run pcp_combine on the model first
+        model_type = self.p.getstr('config', 'MODEL_TYPE')
+        return [('bucket', model_type, ti.getValidTime()[0:10], int(ti.level))
+                for ti in task_info_list(self.p, init_time)]
 
     def run_at_time(self, init_time):
+        model_type = self.p.getstr('config', 'MODEL_TYPE')
+        if model_type == 'HREF_MEAN' or model_type == "NATIONAL_BLEND":
+            PcpCombineWrapper(self.p, self.logger).convert_native_files(
+                [(ti.getValidTime(), ti.level, model_type, True)
+                 for ti in task_info_list(self.p, init_time)])
         task_info = TaskInfo()
         task_info.init_time = init_time
         fcst_vars = util.getlist(self.p.getstr('config', 'FCST_VARS'))
@@ -115,7 +131,10 @@ class GridStatWrapper(CommandBuilder):
                         task_info.ob_type = ob_type
                         if lead < int(accum):
                             continue
-                        self.run_at_time_once(task_info)
+                        with tracing.span('run_at_time_once', 'lead',
+                                          lead=lead, var=fcst_var,
+                                          accum=accum, ob_type=ob_type):
+                            self.run_at_time_once(task_info)
 
 
 #    def run_at_time_fcst(self, init_time, lead, accum, ob_type, fcst_var):
@@ -134,12 +153,8 @@ class GridStatWrapper(CommandBuilder):
         config_dir = self.p.getstr('config', 'CONFIG_DIR')
 
         ymd_v = valid_time[0:8]
-        if not os.path.exists(os.path.join(grid_stat_out_dir,
-                                           init_time, "grid_stat")):
-            os.makedirs(os.path.join(grid_stat_out_dir,
-                                     init_time, "grid_stat"))
-        if not os.path.exists(os.path.join(model_bucket_dir, ymd_v)):
-            os.makedirs(os.path.join(model_bucket_dir, ymd_v))
+        util.mkdir_p(os.path.join(grid_stat_out_dir, init_time, "grid_stat"))
+        util.mkdir_p(os.path.join(model_bucket_dir, ymd_v))
 
         # get model to compare
         model_dir = self.p.getstr('config', model_type+'_INPUT_DIR')
@@ -164,8 +179,7 @@ class GridStatWrapper(CommandBuilder):
             for idx, infile in enumerate(infiles):
                 # replace input_dir with native_dir, check if file exists
                 nfile = infile.replace(model_dir, native_dir)
-                if not os.path.exists(os.path.dirname(nfile)):
-                    os.makedirs(os.path.dirname(nfile))
+                util.mkdir_p(os.path.dirname(nfile))
                 data_type = self.p.getstr('config',
                                           ti.ob_type+'_NATIVE_DATA_TYPE')
                 if data_type == "NETCDF":
@@ -203,6 +217,7 @@ class GridStatWrapper(CommandBuilder):
             print("RUNNING: "+str(cmd))
             self.logger.info("")
             run_pcp_ob.build()
+            run_pcp_ob.flush()
             model_path = run_pcp_ob.get_output_path()
         else:
             model_path = self.find_model(model_type, ti.lead, init_time)
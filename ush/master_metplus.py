@@ -9,6 +9,7 @@ import os
 import sys
 import logging
 import getopt
+import importlib
 import config_launcher
 import time
 import datetime
@@ -17,18 +18,32 @@ import produtil.setup
 from produtil.run import batchexe, run  # , checkrun
 import met_util as util
 import config_metplus
-
-from pcp_combine_wrapper import PcpCombineWrapper
-from grid_stat_wrapper import GridStatWrapper
-from regrid_data_plane_wrapper import RegridDataPlaneWrapper
-from tc_pairs_wrapper import TcPairsWrapper
-from extract_tiles_wrapper import ExtractTilesWrapper
-from series_by_lead_wrapper import SeriesByLeadWrapper
-from series_by_init_wrapper import SeriesByInitWrapper
-#from mode_wrapper import ModeWrapper
-from usage_wrapper import UsageWrapper
+import task_graph
+import parallel_times
+import command_plan
+import resource_usage
+import tracing
+import tree_walker
 from command_builder import CommandBuilder
-from tcmpr_plotter_wrapper import TCMPRPlotterWrapper
+
+'''!@var WRAPPERS
+Module that defines each process that can be listed in PROCESS_LIST.
+A wrapper module is only imported when its process is used, so a run
+does not pay for importing every wrapper and its dependencies.
+'''
+WRAPPERS = {
+    'PcpCombine': 'pcp_combine_wrapper',
+    'GridStat': 'grid_stat_wrapper',
+    'RegridDataPlane': 'regrid_data_plane_wrapper',
+    'TcPairs': 'tc_pairs_wrapper',
+    'ExtractTiles': 'extract_tiles_wrapper',
+    'SeriesByLead': 'series_by_lead_wrapper',
+    'SeriesByInit': 'series_by_init_wrapper',
+#    'Mode': 'mode_wrapper',
+    'Usage': 'usage_wrapper',
+    'TCMPRPlotter': 'tcmpr_plotter_wrapper',
+    'CyclonePlotter': 'cyclone_plotter_wrapper',
+}
 
 '''!@var logger
 The logging.Logger for log messages
@@ -42,10 +57,66 @@ def usage():
 Usage: master_metplus.py [ -c /path/to/additional/conf_file] [options]
     -c|--config <arg0>      Specify custom configuration file to use
     -r|--runtime <arg0>     Specify initialization time to process
+    -p|--plan <arg0>        Write the commands the run would execute, with
+                            estimated run times, to a JSON file instead
+                            of running them
     -h|--help               Display this usage statement
 ''')
 
 
+def get_wrapper_class(process):
+    """!Returns the wrapper class for a name in PROCESS_LIST, importing
+        its module the first time it is used"""
+    if process not in WRAPPERS:
+        raise NameError("Process %s doesn't exist" % process)
+    module = importlib.import_module(WRAPPERS[process])
+    return getattr(module, process+"Wrapper")
+
+
+def write_plan(p, process_list, processes, plan_file, logger):
+    """!Runs every run_at_time loop without executing any commands and
+        writes the commands to a JSON plan.  Only wrappers that set
+        plans_commands are called.  The others run their tools or write
+        files outside of build(), so they are listed in the plan as
+        unplanned instead of being run.
+        @param p the config instance
+        @param process_list names of the processes in PROCESS_LIST
+        @param processes the wrapper instances
+        @param plan_file path of the JSON plan to write
+        @param logger the METplus logger"""
+    plan = command_plan.CommandPlan(command_plan.get_timing_stats(p))
+    CommandBuilder.plan = plan
+    try:
+        planned = [getattr(process, 'plans_commands', False)
+                   for process in processes]
+        for item, can_plan in zip(process_list, planned):
+            if not can_plan:
+                plan.add_unplanned(item, "runs commands outside of build()")
+        for run_time in util.get_init_times(p):
+            for item, process, can_plan in zip(process_list, processes,
+                                               planned):
+                if not can_plan:
+                    continue
+                plan.set_context(item, run_time)
+                process.run_at_time(run_time)
+                process.clear()
+    finally:
+        CommandBuilder.plan = None
+    plan.write(plan_file)
+    summary = plan.summary()
+    msg = "Wrote plan with %d commands to %s, estimated %.0f seconds" % \
+          (summary['commands'], plan_file, summary['estimated_seconds'])
+    print(msg)
+    logger.info(msg)
+    for app, app_summary in sorted(summary['apps'].items()):
+        msg = "  %s: %d commands, %d up to date, %d with no timing " \
+              "history, estimated %.0f seconds" % \
+              (app, app_summary['commands'], app_summary['up_to_date'],
+               app_summary['unestimated'], app_summary['estimated_seconds'])
+        print(msg)
+        logger.info(msg)
+
+
 def main():
     """!Main program.
 
@@ -64,10 +135,12 @@ def main():
     cur_filename = sys._getframe().f_code.co_filename
     cur_function = sys._getframe().f_code.co_name
 
-    short_opts = "c:r:h"
+    short_opts = "c:r:p:h"
     long_opts = ["config=",
                  "help",
-                 "runtime="]
+                 "runtime=",
+                 "plan="]
+    plan_file = None
     # All command line input, get options and arguments
     try:
         opts, args = getopt.gnu_getopt(sys.argv[1:], short_opts, long_opts)
@@ -85,6 +158,8 @@ def main():
         elif k in ('-r', '--runtime'):
             start_time = v
             end_time = v
+        elif k in ('-p', '--plan'):
+            plan_file = v
         else:
             assert False, "UNHANDLED OPTION"
     if not args:
@@ -118,52 +193,101 @@ def main():
     # both work ...
     # Note: Using (item))sys.argv[1:], is preferable since
     # it doesn't depend on the conf file existing.
+    def make_wrapper(item):
+        return get_wrapper_class(item)(p, logger)
+
     processes = []
     for item in process_list:
-      try:
-        command_builder = getattr(sys.modules[__name__], item+"Wrapper")(p, logger)
-      except AttributeError:
-        raise NameError("Process %s doesn't exist" % item)
+        processes.append(make_wrapper(item))
+
+    if plan_file is not None:
+        write_plan(p, process_list, processes, plan_file, logger)
         exit()
 
-      processes.append(command_builder)
-
-    if p.getstr('config', 'LOOP_METHOD') == "processes":
-        for process in processes:
-            process.run_all_times()
-
-    elif p.getstr('config', 'LOOP_METHOD') == "times":
-        time_format = p.getstr('config', 'INIT_TIME_FMT')
-        start_t = p.getstr('config', 'INIT_BEG')
-        end_t = p.getstr('config', 'INIT_END')
-        time_interval = p.getint('config', 'INIT_INC')
-        if time_interval < 60:
-            print("ERROR: time_interval parameter must be greater than 60 seconds")
-            exit(1)
-        
-        init_time = calendar.timegm(time.strptime(start_t, time_format))
-        end_time = calendar.timegm(time.strptime(end_t, time_format))
-        while init_time <= end_time:
-            run_time = time.strftime("%Y%m%d%H%M", time.gmtime(init_time))            
-            print("")
-            print("****************************************")
-            print("* RUNNING MET+")
-            print("* at init time: " + run_time)
-            print("****************************************")
-            logger.info("****************************************")
-            logger.info("* RUNNING MET+")
-            logger.info("*  at init time: " + run_time)
-            logger.info("****************************************")            
-            for process in processes:
-                process.run_at_time(run_time)
-                process.clear()
+    usage_report = resource_usage.start_report(p)
+    tracer = tracing.start_tracing(p)
+    tree_walker.configure(p)
 
-            init_time += time_interval
+    loop_method = p.getstr('config', 'LOOP_METHOD')
+    try:
+        with tracing.span('master_metplus', 'run',
+                          loop_method=loop_method):
+            if loop_method == "processes":
+                failed = []
+                for item, process in zip(process_list, processes):
+                    resource_usage.set_context(item)
+                    with tracing.span(item, 'process', process=item):
+                        failed.extend(process.run_all_times() or [])
+                        failed.extend(process.flush())
+                if failed:
+                    logger.error("ERROR | [" + cur_filename + ":" +
+                                 cur_function + "] | " + str(len(failed)) +
+                                 " commands failed: " + ", ".join(failed))
+                    exit(1)
 
-    else:
-        print("ERROR: Invalid LOOP_METHOD defined. " + \
-              "Options are processes, times")
-        exit()
+            elif loop_method == "times":
+                failed = []
+                for run_time in util.get_init_times(p):
+                    print("")
+                    print("****************************************")
+                    print("* RUNNING MET+")
+                    print("* at init time: " + run_time)
+                    print("****************************************")
+                    logger.info("****************************************")
+                    logger.info("* RUNNING MET+")
+                    logger.info("*  at init time: " + run_time)
+                    logger.info("****************************************")            
+                    for item, process in zip(process_list, processes):
+                        resource_usage.set_context(item, run_time)
+                        with tracing.span(item, 'task', process=item,
+                                          init_time=run_time):
+                            process.run_at_time(run_time)
+                            failed.extend(process.flush())
+                            process.clear()
+                if failed:
+                    logger.error("ERROR | [" + cur_filename + ":" +
+                                 cur_function + "] | " + str(len(failed)) +
+                                 " commands failed: " + ", ".join(failed))
+                    exit(1)
+
+            elif loop_method == "graph":
+                max_workers = p.getint('config', 'MAX_WORKERS')
+                failed = task_graph.run_task_graph(process_list,
+                                                   util.get_init_times(p),
+                                                   make_wrapper, max_workers,
+                                                   logger)
+                if failed:
+                    logger.error("ERROR | [" + cur_filename + ":" +
+                                 cur_function + "] | " + str(len(failed)) +
+                                 " tasks failed or were skipped: " +
+                                 ", ".join(node.name for node in failed))
+                    exit(1)
+
+            elif loop_method == "parallel_times":
+                max_workers = p.getint('config', 'MAX_WORKERS')
+                wrapper_classes = [get_wrapper_class(item)
+                                   for item in process_list]
+                failed = parallel_times.run_parallel_times(
+                    p, process_list, wrapper_classes, util.get_init_times(p),
+                    max_workers, logger)
+                if failed:
+                    logger.error("ERROR | [" + cur_filename + ":" +
+                                 cur_function + "] | Init times failed: " +
+                                 ", ".join(failed))
+                    exit(1)
+
+            else:
+                print("ERROR: Invalid LOOP_METHOD defined. " + \
+                      "Options are processes, times, graph, parallel_times")
+                exit()
+    finally:
+        command_plan.get_timing_stats(p).save()
+        if usage_report is not None:
+            usage_report.save()
+            logger.info("Wrote resource usage summary to " +
+                        usage_report.write_summary())
+        if tracer is not None:
+            logger.info("Wrote trace to %s and %s" % tracer.export())
     exit()
     for item in process_list:
 
@@ -11,9 +11,12 @@ import time
 import calendar
 import re
 from produtil.run import batchexe
-from produtil.run import run
+from resource_usage import run
 from string_template_substitution import StringSub
 from tc_stat_wrapper import TcStatWrapper
+from task_farm import TaskFarm
+from file_catalog import get_file_catalog
+import output_tracker
 
 """!@namespace met_util
  @brief Provides  Utility functions for METplus.
@@ -61,9 +64,11 @@ def mkdir_p(path):
            @param path : The full directory path to be created
        Returns
            None: Creates the full directory path if it doesn't exist,
-                 does nothing otherwise.
+                 does nothing otherwise.  Either way the directory is
+                 recorded for prune_empty.
     """
 
+    output_tracker.get_output_tracker().add(path)
     try:
         # ***Note***:
         # For Python 3.2 and beyond, os.makedirs has a third optional argument,
@@ -238,27 +243,8 @@ def get_filepaths_for_grbfiles(base_dir):
                            of the data to be processed.
     """
 
-    # Create an empty list which will eventually store
-    # all the full filenames
-    file_paths = []
-
-    # pylint:disable=unused-variable
-    # os.walk returns tuple, we don't need to utilize all the returned
-    # values in the tuple.
-
-    # Walk the tree
-    for root, directories, files in os.walk(base_dir):
-        for filename in files:
-            # add it to the list only if it is a grib file
-            match = re.match(r'.*(grib|grb|grib2|grb2)$', filename)
-            if match:
-                # Join the two strings to form the full
-                # filepath.
-                filepath = os.path.join(root, filename)
-                file_paths.append(filepath)
-            else:
-                continue
-    return file_paths
+    # The tree is listed once per run by the shared file catalog
+    return get_file_catalog().files(base_dir, r'.*(grib|grb|grib2|grb2)$')
 
 
 def get_storm_ids(filter_filename, logger):
@@ -324,25 +310,10 @@ def get_files(filedir, filename_regex, logger):
     cur_function = sys._getframe().f_code.co_name
 
     logger.debug("DEBUG|" + cur_filename + "|" + cur_function)
-    file_paths = []
 
-    # pylint:disable=unused-variable
-    # os.walk returns a tuple. Not all returned values are needed.
-
-    # Walk the tree
-    for root, directories, files in os.walk(filedir):
-        for filename in files:
-            # add it to the list only if it is a match
-            # to the specified format
-            match = re.match(filename_regex, filename)
-            if match:
-                # Join the two strings to form the full
-                # filepath.
-                filepath = os.path.join(root, filename)
-                file_paths.append(filepath)
-            else:
-                continue
-    return file_paths
+    # The tree is listed once per run by the shared file catalog and
+    # listed again only where it changed
+    return get_file_catalog().files(filedir, filename_regex)
 
 
 def get_name_level(var_combo, logger):
@@ -445,7 +416,7 @@ def extract_year_month(init_time, logger):
 
 
 def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
-                        config):
+                        config, farm=None):
     """! Retrieves the data from the MODEL_DATA_DIR (defined in metplus.conf)
          that corresponds to the storms defined in the tmp_filename:
         1) create the analysis tile and forecast file names from the
@@ -471,6 +442,9 @@ def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
                          is requested, then grib2 data is produced.
         @param logger:  The name of the logger used in logging.
         @param config:  config instance
+        @param farm:    optional task_farm.TaskFarm.  If set, the regrid
+                        commands are added to it instead of run, and the
+                        caller must call farm.run()
         Returns:
            None
     """
@@ -652,12 +626,15 @@ def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
                                      var_level_string,
                                      ' -method NEAREST ']
                     regrid_cmd_fcst = ''.join(fcst_cmd_list)
+                    if farm is not None:
+                        farm.add(regrid_cmd_fcst)
                     regrid_cmd_fcst = \
                         batchexe('sh')['-c', regrid_cmd_fcst].err2out()
                     msg = ("INFO|[regrid]| regrid_data_plane regrid command:" +
                            regrid_cmd_fcst.to_shell())
                     logger.debug(msg)
-                    run(regrid_cmd_fcst)
+                    if farm is None:
+                        run(regrid_cmd_fcst)
 
                 else:
                     # Perform regridding via wgrib2
@@ -668,12 +645,15 @@ def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
                                      ' -new_grid ', fcst_grid_spec, ' ',
                                      fcst_regridded_file]
                     wgrb_cmd_fcst = ''.join(fcst_cmd_list)
+                    if farm is not None:
+                        farm.add(wgrb_cmd_fcst)
                     wgrb_cmd_fcst = \
                         batchexe('sh')['-c', wgrb_cmd_fcst].err2out()
                     msg = ("INFO|[wgrib2]| wgrib2 regrid command:" +
                            wgrb_cmd_fcst.to_shell())
                     logger.debug(msg)
-                    run(wgrb_cmd_fcst)
+                    if farm is None:
+                        run(wgrb_cmd_fcst)
 
             # Create new gridded file for anly tile
             if file_exists(anly_regridded_file) and not overwrite_flag:
@@ -693,9 +673,12 @@ def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
                                      var_level_string, ' ',
                                      ' -method NEAREST ']
                     regrid_cmd_anly = ''.join(anly_cmd_list)
+                    if farm is not None:
+                        farm.add(regrid_cmd_anly)
                     regrid_cmd_anly = \
                         batchexe('sh')['-c', regrid_cmd_anly].err2out()
-                    run(regrid_cmd_anly)
+                    if farm is None:
+                        run(regrid_cmd_anly)
                     msg = ("INFO|[regrid]| on anly file:" +
                            anly_regridded_file)
                     logger.debug(msg)
@@ -708,11 +691,14 @@ def retrieve_and_regrid(tmp_filename, cur_init, cur_storm, out_dir, logger,
                                      ' -new_grid ', anly_grid_spec, ' ',
                                      anly_regridded_file]
                     wgrb_cmd_anly = ''.join(anly_cmd_list)
+                    if farm is not None:
+                        farm.add(wgrb_cmd_anly)
                     wgrb_cmd_anly = \
                         batchexe('sh')['-c', wgrb_cmd_anly].err2out()
                     msg = ("INFO|[wgrib2]| Regridding via wgrib2:" +
                            wgrb_cmd_anly.to_shell())
-                    run(wgrb_cmd_anly)
+                    if farm is None:
+                        run(wgrb_cmd_anly)
                     logger.debug(msg)
 
 
@@ -948,9 +934,9 @@ def gen_init_list(init_date_begin, init_date_end, init_hr_inc, init_hr_end):
     return date_init_list
 
 
-def prune_empty(output_dir, logger):
-    """! Start from the output_dir, and recursively check
-        all directories and files.  If there are any empty
+def prune_empty(output_dir, logger, full_scan=False):
+    """! Start from the output_dir, and check the directories
+        created with mkdir_p below it.  If there are any empty
         files or directories, delete/remove them so they
         don't cause performance degradation or errors
         when performing subsequent tasks.
@@ -959,43 +945,17 @@ def prune_empty(output_dir, logger):
                                 should begin.
             @param logger: The logger to which all logging is
                            directed.
+            @param full_scan: True to check every file and directory
+                              below output_dir, for files left by other
+                              programs or earlier runs.
     """
 
-    # pylint:disable=protected-access
-    # Need to call sys.__getframe() to get the filename and method/func
-    # for logging information.
-    # For logging
-    cur_filename = sys._getframe().f_code.co_filename
-    cur_function = sys._getframe().f_code.co_name
-
-    # Check for empty files.
-    for root, dirs, files in os.walk(output_dir):
-        # Create a full file path by joining the path
-        # and filename.
-        for a_file in files:
-            a_file = os.path.join(root, a_file)
-            if os.stat(a_file).st_size == 0:
-                msg = ("INFO|[" + cur_filename + ":" +
-                       cur_function + "]|" +
-                       "Empty file: " + a_file +
-                       "...removing")
-
-                logger.debug(msg)
-                os.remove(a_file)
-
-    # Now check for any empty directories, some
-    # may have been created when removing
-    # empty files.
-    for root, dirs, files in os.walk(output_dir):
-        for direc in dirs:
-            full_dir = os.path.join(root, direc)
-            if not os.listdir(full_dir):
-                msg = ("INFO|[" + cur_filename + ":" +
-                       cur_function + "]|" +
-                       "Empty directory: " + full_dir +
-                       "...removing")
-                logger.debug(msg)
-                os.rmdir(full_dir)
+    # Empty directories are removed bottom-up in the same pass as the
+    # empty files, so directories emptied by removing files go too.
+    if full_scan:
+        output_tracker.prune_tree(output_dir, logger)
+    else:
+        output_tracker.get_output_tracker().prune(output_dir, logger)
 
 
 def cleanup_temporary_files(list_of_files):
@@ -1052,6 +1012,9 @@ def apply_series_filters(tile_dir, init_times, series_output_dir, filter_opts,
     logger.debug("DEBUG|" + cur_filename + "|" + cur_function +
                  " creating tmp dir: " + tmp_dir)
 
+    # regrid commands for every storm, run together after the loop
+    farm = TaskFarm(config, logger)
+
     for cur_init in init_times:
         # Call the tc_stat wrapper to build up the command and invoke
         # the MET tool tc_stat.
@@ -1108,7 +1071,9 @@ def apply_series_filters(tile_dir, init_times, series_output_dir, filter_opts,
                 # Store the analysis and forecast files in the
                 # series_output_dir.
                 retrieve_and_regrid(tmp_filename, cur_init, cur_storm,
-                                    series_output_dir, logger, config)
+                                    series_output_dir, logger, config, farm)
+
+    farm.run()
 
     # Check for any empty files and directories and remove them to avoid
     # any errors or performance degradation when performing
@@ -1204,16 +1169,7 @@ def get_dirs(base_dir):
            dir_list:  A list of directories under the base_dir
     """
 
-    dir_list = []
-
-    # pylint:disable=unused-variable
-    # os.walk returns a tuple, not all returned values are needed.
-
-    for dirname, dirs, filenames in os.walk(base_dir):
-        for direc in dirs:
-            dir_list.append(os.path.join(dirname, direc))
-
-    return dir_list
+    return get_file_catalog().dirs(base_dir)
 
 
 def getlist(s, logger=None):
@@ -1254,5 +1210,31 @@ def shift_time(time, shift):
             datetime.timedelta(hours=shift)).strftime("%Y%m%d%H%M")
 
 
+def get_init_times(config, out_fmt="%Y%m%d%H%M"):
+    """!Returns the list of init times from INIT_BEG to INIT_END, stepping
+        by INIT_INC seconds.
+        Args:
+            @param config the config instance
+            @param out_fmt strftime format of the returned times
+        Returns:
+            list of init time strings
+    """
+    time_format = config.getstr('config', 'INIT_TIME_FMT')
+    start_t = config.getstr('config', 'INIT_BEG')
+    end_t = config.getstr('config', 'INIT_END')
+    time_interval = config.getint('config', 'INIT_INC')
+    if time_interval < 60:
+        print("ERROR: time_interval parameter must be greater than 60 seconds")
+        exit(1)
+
+    init_time = calendar.timegm(time.strptime(start_t, time_format))
+    end_time = calendar.timegm(time.strptime(end_t, time_format))
+    init_times = []
+    while init_time <= end_time:
+        init_times.append(time.strftime(out_fmt, time.gmtime(init_time)))
+        init_time += time_interval
+    return init_times
+
+
 if __name__ == "__main__":
     gen_init_list("20141201", "20150331", 6, "18")
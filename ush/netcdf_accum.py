@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+'''
+Program Name: netcdf_accum.py
+Contact(s): George McCabe
+Abstract: Sums NetCDF precipitation fields without running pcp_combine
+History Log:  Initial version
+Usage: Used by PcpCombineWrapper.build when PCP_COMBINE_ENGINE = NUMPY
+Parameters: None
+Input Files: NetCDF files with accumulated precipitation
+Output Files: NetCDF file with the sum of the input fields
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import re
+import time
+
+try:
+    import numpy
+    import netCDF4
+except ImportError:
+    numpy = None
+    netCDF4 = None
+
+'''!@namespace netcdf_accum
+@brief In-process replacement for pcp_combine -add on NetCDF inputs.
+
+For NETCDF native data, PcpCombineWrapper only adds gridded
+precipitation fields, but each bucket starts a pcp_combine process that
+decodes every input again.  add_fields() reads the same fields with
+netCDF4, a block of rows at a time so memory use does not grow with the
+grid, adds them in float32, and writes the sum as <VAR>_<accum> with
+the dimensions, coordinate variables, global attributes and field
+attributes of the first input, updated for the new accumulation: the
+accumulation is the total of the inputs, and like pcp_combine the init
+time is the earliest of the inputs and the valid time the latest.
+A point that is bad data in any input is bad data in the sum, as with
+pcp_combine.  test_netcdf_accum compares the output with pcp_combine's
+where MET is installed.
+
+numpy and netCDF4 are optional.  available() is False without them, and
+PcpCombineWrapper then runs pcp_combine.
+'''
+
+'''!@var BAD_DATA
+The MET bad data value'''
+BAD_DATA = -9999.0
+
+'''!@var CHUNK_ROWS
+Number of grid rows read from each input at a time'''
+CHUNK_ROWS = 256
+
+# field information added after a NetCDF input file name by
+# PcpCombineWrapper.get_accumulation
+_FIELD_RE = re.compile(r"""^'name="([^"]+)"; *level="\(([0-9]+),\*,\*\)";'$""")
+
+
+def available():
+    """!Returns True if numpy and netCDF4 can be imported"""
+    return numpy is not None and netCDF4 is not None
+
+
+def parse_field(addon):
+    """!Parses the field information of a pcp_combine NetCDF input
+        @param addon the text after the file name, such as
+        'name="P01M_NONE"; level="(0,*,*)";'
+        @returns a tuple of the variable name and the index of the first
+        dimension, or None if the text is not a NetCDF field selection"""
+    match = _FIELD_RE.match(addon.strip())
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def _read_rows(variable, index, start, stop):
+    """!Reads rows start to stop of one field as float32, with the bad
+        data points set to NaN"""
+    if variable.ndim == 3:
+        data = variable[index, start:stop, :]
+    elif variable.ndim == 2 and index == 0:
+        data = variable[start:stop, :]
+    else:
+        raise ValueError("Cannot select level " + str(index) + " of " +
+                         variable.name)
+    data = numpy.ma.filled(numpy.ma.asarray(data, dtype=numpy.float32),
+                           numpy.nan)
+    data[data == BAD_DATA] = numpy.nan
+    return data
+
+
+def _accum_seconds(variables):
+    """!Returns the total of the accum_time_sec attributes of the
+        input fields, or None if any of them lacks one"""
+    total = 0
+    for variable in variables:
+        if 'accum_time_sec' not in variable.ncattrs():
+            return None
+        total += int(variable.getncattr('accum_time_sec'))
+    return total
+
+
+def _times(variables, prefix):
+    """!Returns the <prefix>_time_ut attributes of the input fields in
+        unix seconds, or None if any of them lacks one"""
+    times = []
+    for variable in variables:
+        if prefix + '_time_ut' not in variable.ncattrs():
+            return None
+        times.append(int(variable.getncattr(prefix + '_time_ut')))
+    return times
+
+
+def _set_time(result, prefix, seconds):
+    """!Sets the <prefix>_time and <prefix>_time_ut attributes of the
+        output field.  <prefix>_time_ut keeps the type the input had."""
+    like = result.getncattr(prefix + '_time_ut')
+    result.setncattr(prefix + '_time', time.strftime('%Y%m%d_%H%M%S',
+                                                     time.gmtime(seconds)))
+    if isinstance(like, (int, numpy.integer)):
+        result.setncattr(prefix + '_time_ut', type(like)(seconds))
+    else:
+        result.setncattr(prefix + '_time_ut', str(seconds))
+
+
+def add_fields(inputs, out_path, out_name):
+    """!Adds NetCDF fields and writes the sum
+        @param inputs list of (path, variable name, level index), latest
+        valid time first, as pcp_combine -add takes them
+        @param out_path the NetCDF file to write.  It is written under a
+        temporary name and renamed when complete.
+        @param out_name name of the output variable, <VAR>_<accum>"""
+    datasets = [netCDF4.Dataset(path) for path, _, _ in inputs]
+    try:
+        variables = [dataset.variables[name] for dataset, (_, name, _)
+                     in zip(datasets, inputs)]
+        first = variables[0]
+        dims = first.dimensions[-2:]
+        shape = first.shape[-2:]
+        for variable in variables:
+            if variable.shape[-2:] != shape:
+                raise ValueError("Grid of " + variable.name + " is " +
+                                 str(variable.shape[-2:]) + ", expected " +
+                                 str(shape))
+
+        tmp_path = out_path + '.' + str(os.getpid()) + '.tmp'
+        out = netCDF4.Dataset(tmp_path, 'w',
+                              format=datasets[0].data_model)
+        try:
+            source = datasets[0]
+            for attr in source.ncattrs():
+                out.setncattr(attr, source.getncattr(attr))
+            out.setncattr('MET_tool', 'pcp_combine')
+            out.setncattr('FileOrigins', 'PcpCombineWrapper in-process ' +
+                          'sum of ' + str(len(inputs)) + ' files')
+            for dim in dims:
+                out.createDimension(dim, len(source.dimensions[dim]))
+            # lat and lon, and any other variable on the grid dimensions
+            for name, variable in source.variables.items():
+                if name == first.name or len(variable.dimensions) == 0 or \
+                   not set(variable.dimensions) <= set(dims):
+                    continue
+                copy = out.createVariable(name, variable.dtype,
+                                          variable.dimensions)
+                copy.setncatts(dict((attr, variable.getncattr(attr))
+                                    for attr in variable.ncattrs()
+                                    if attr != '_FillValue'))
+                copy[:] = variable[:]
+
+            result = out.createVariable(out_name, 'f4', dims,
+                                        fill_value=BAD_DATA)
+            result.setncatts(dict((attr, first.getncattr(attr))
+                                  for attr in first.ncattrs()
+                                  if attr != '_FillValue'))
+            result.setncattr('name', out_name)
+            seconds = _accum_seconds(variables)
+            if seconds is not None:
+                result.setncattr('level', 'A' + str(seconds // 3600))
+                result.setncattr('accum_time_sec', seconds)
+                result.setncattr('accum_time', '%02d%02d%02d' %
+                                 (seconds // 3600, seconds // 60 % 60,
+                                  seconds % 60))
+            inits = _times(variables, 'init')
+            if inits is not None:
+                _set_time(result, 'init', min(inits))
+            valids = _times(variables, 'valid')
+            if valids is not None:
+                _set_time(result, 'valid', max(valids))
+
+            for start in range(0, shape[0], CHUNK_ROWS):
+                stop = min(start + CHUNK_ROWS, shape[0])
+                total = numpy.zeros((stop - start, shape[1]), numpy.float32)
+                for variable, (_, _, index) in zip(variables, inputs):
+                    # NaN in any input leaves NaN in the sum
+                    total += _read_rows(variable, index, start, stop)
+                total[numpy.isnan(total)] = BAD_DATA
+                result[start:stop, :] = total
+            out.close()
+        except Exception:
+            out.close()
+            os.remove(tmp_path)
+            raise
+        os.rename(tmp_path, out_path)
+    finally:
+        for dataset in datasets:
+            dataset.close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+'''
+Program Name: output_tracker.py
+Contact(s): George McCabe
+Abstract: Removes the empty files and directories a run leaves behind
+History Log:  Initial version
+Usage: Used by met_util.mkdir_p and met_util.prune_empty
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import threading
+import tree_walker
+
+'''!@namespace output_tracker
+@brief Records the output directories of a run so pruning only looks
+there.
+
+met_util.prune_empty used to walk the whole output tree twice, once for
+empty files and once for empty directories, and the wrappers call it
+for every storm, forecast hour group and init time.  Every directory
+created or reused with met_util.mkdir_p, which the wrappers call before
+writing anything, is now recorded by the OutputTracker of the process.
+prune() lists only the recorded directories under the directory being
+pruned, and the directories between them and it, deepest first, so a
+directory emptied by removing its files or subdirectories is removed in
+the same pass.  Files the MET tools write into those directories are
+found by listing them.
+
+prune_tree() is the full scan, for trees with leftovers from other
+programs or earlier runs.  It makes one bottom-up pass over the tree
+read by tree_walker.walk.
+'''
+
+# one OutputTracker per process
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_output_tracker():
+    """!Returns the OutputTracker shared by every wrapper in this process"""
+    pid = os.getpid()
+    with _trackers_lock:
+        if pid not in _trackers:
+            _trackers[pid] = OutputTracker()
+        return _trackers[pid]
+
+
+def _remove_if_empty_file(path, logger):
+    """!Removes a file of size zero
+        @returns True if the file was removed"""
+    try:
+        if os.path.islink(path) or os.path.getsize(path) != 0:
+            return False
+        os.remove(path)
+    except OSError:
+        return False
+    if logger is not None:
+        logger.debug("Empty file: " + path + "...removing")
+    return True
+
+
+def _remove_if_empty_dir(path, logger):
+    """!Removes a directory with nothing in it
+        @returns True if the directory was removed"""
+    try:
+        if os.listdir(path):
+            return False
+        os.rmdir(path)
+    except OSError:
+        return False
+    if logger is not None:
+        logger.debug("Empty directory: " + path + "...removing")
+    return True
+
+
+def prune_tree(top, logger=None):
+    """!Removes every empty file and directory below top, in one
+        bottom-up walk of the whole tree.  top itself is kept.
+        @param top the directory to clean up
+        @param logger optional logger for the removed paths"""
+    # reversed top-down order lists every directory after the
+    # directories below it
+    for root, dirs, files in reversed(list(tree_walker.walk(top))):
+        for name in files:
+            _remove_if_empty_file(os.path.join(root, name), logger)
+        if os.path.normpath(root) != os.path.normpath(top):
+            _remove_if_empty_dir(root, logger)
+
+
+class OutputTracker(object):
+    """!The directories written to by the wrappers of this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = set()
+
+    def add(self, path):
+        """!Records a directory the run writes to
+            @param path the directory"""
+        path = os.path.normpath(os.path.abspath(path))
+        with self._lock:
+            self._dirs.add(path)
+
+    def tracked(self, top):
+        """!Returns the recorded directories below top, and the
+            directories between them and top, deepest first"""
+        top = os.path.normpath(os.path.abspath(top))
+        below = top.rstrip(os.sep) + os.sep
+        with self._lock:
+            recorded = [path for path in self._dirs
+                        if path.startswith(below)]
+        dirs = set()
+        for path in recorded:
+            while path != top and path not in dirs:
+                dirs.add(path)
+                path = os.path.dirname(path)
+        return sorted(dirs, key=lambda path: (-path.count(os.sep), path))
+
+    def prune(self, top, logger=None):
+        """!Removes the empty files in the tracked directories below top,
+            then the tracked directories that are left empty.  top
+            itself is kept.
+            @param top the directory to clean up
+            @param logger optional logger for the removed paths"""
+        removed = []
+        for path in self.tracked(top):
+            try:
+                names = os.listdir(path)
+            except OSError:
+                removed.append(path)
+                continue
+            for name in names:
+                _remove_if_empty_file(os.path.join(path, name), logger)
+            if _remove_if_empty_dir(path, logger):
+                removed.append(path)
+        with self._lock:
+            self._dirs.difference_update(removed)
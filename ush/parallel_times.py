@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+'''
+Program Name: parallel_times.py
+Contact(s): George McCabe
+Abstract: Runs the PROCESS_LIST for each init time in a pool of processes
+History Log:  Initial version
+Usage: Called by master_metplus.py when LOOP_METHOD = parallel_times
+Parameters: None
+Input Files: METPLUS_CONF written by master_metplus.py
+Output Files: one log file per init time under LOG_DIR/parallel_times
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import logging
+import multiprocessing
+import time
+import traceback
+import config_launcher
+import command_plan
+import resource_usage
+import tracing
+import tree_walker
+import met_util as util
+
+'''!@namespace parallel_times
+@brief Sends each init time's run_at_time calls to a process pool.
+
+Every init time runs every process in PROCESS_LIST, in order, inside one
+worker process, exactly like one pass of the LOOP_METHOD = times loop.
+Each worker reads its own copy of the final METPLUS_CONF file, and each
+task creates new wrapper instances, so no arguments or environment
+settings are shared between init times.  Each task logs to its own file,
+which is copied into the main log as a block when the task finishes so
+that messages from different init times are not interleaved.
+'''
+
+# Set in each worker process by _init_worker
+_worker_conf = None
+_worker_classes = None
+
+
+def _init_worker(conf_file, wrapper_classes):
+    """!Pool initializer: loads the final conf file in the worker process
+        @param conf_file path to METPLUS_CONF
+        @param wrapper_classes list of (process name, wrapper class)"""
+    global _worker_conf, _worker_classes
+    _worker_conf = config_launcher.load(conf_file)
+    _worker_classes = wrapper_classes
+    resource_usage.start_report(_worker_conf, new=False)
+    tracing.start_tracing(_worker_conf, new=False)
+    tree_walker.configure(_worker_conf)
+
+
+def get_task_log_path(p, run_time):
+    """!Returns the log file used by the task for one init time"""
+    log_dir = os.path.join(p.getdir('LOG_DIR'), 'parallel_times')
+    log_root = os.path.splitext(
+        os.path.basename(p.getstr('config', 'LOG_FILENAME')))[0]
+    return os.path.join(log_dir, log_root + '.' + run_time + '.log')
+
+
+def _get_task_logger(p, run_time):
+    log_path = get_task_log_path(p, run_time)
+    util.mkdir_p(os.path.dirname(log_path))
+    logger = logging.getLogger('parallel_times.' + run_time)
+    logger.setLevel(p.getstr('config', 'LOG_LEVEL'))
+    logger.propagate = False
+    handler = logging.FileHandler(log_path, mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s : %(message)s'))
+    logger.addHandler(handler)
+    return logger, handler, log_path
+
+
+def _run_init_time(run_time):
+    """!Runs every process for one init time in a worker process.
+        @param run_time init time in YYYYMMDDHHMM format
+        @returns tuple of (run_time, success, log path, seconds)"""
+    start = time.time()
+    logger, handler, log_path = _get_task_logger(_worker_conf, run_time)
+    success = True
+    try:
+        logger.info("* RUNNING MET+ at init time: " + run_time +
+                    " (pid " + str(os.getpid()) + ")")
+        for name, wrapper_class in _worker_classes:
+            wrapper = wrapper_class(_worker_conf, logger)
+            resource_usage.set_context(name, run_time)
+            with tracing.span(name, 'task', process=name,
+                              init_time=run_time):
+                wrapper.run_at_time(run_time)
+                failed = wrapper.flush()
+                wrapper.clear()
+            if failed:
+                raise RuntimeError(name + ": " + str(len(failed)) +
+                                   " commands failed")
+    except (Exception, SystemExit):
+        # wrappers call exit() on fatal errors
+        logger.error("ERROR: init time " + run_time + " failed\n" +
+                     traceback.format_exc())
+        success = False
+    finally:
+        command_plan.get_timing_stats(_worker_conf).save()
+        if resource_usage.get_report() is not None:
+            resource_usage.get_report().save()
+        if tracing.get_tracer() is not None:
+            tracing.get_tracer().save()
+        logger.removeHandler(handler)
+        handler.close()
+    return run_time, success, log_path, time.time() - start
+
+
+def _collate_log(logger, run_time, log_path):
+    logger.info("**** Log for init time " + run_time + " (" +
+                log_path + ") ****")
+    try:
+        with open(log_path) as log_file:
+            for line in log_file:
+                logger.info("[" + run_time + "] " + line.rstrip("\n"))
+    except IOError as e:
+        logger.warning("Could not read log for init time " + run_time +
+                       ": " + str(e))
+    logger.info("**** End of log for init time " + run_time + " ****")
+
+
+def run_parallel_times(p, process_list, wrapper_classes, init_times,
+                       max_workers, logger):
+    """!Runs each init time's run_at_time in a pool of processes.
+        @param p the config instance
+        @param process_list names of the processes to run, in order
+        @param wrapper_classes wrapper class for each process
+        @param init_times init times in YYYYMMDDHHMM format
+        @param max_workers number of worker processes
+        @param logger the main METplus logger
+        @returns list of init times that failed"""
+    for name, wrapper_class in zip(process_list, wrapper_classes):
+        if not hasattr(wrapper_class, 'run_at_time'):
+            logger.error("ERROR: " + name + " does not support " +
+                         "LOOP_METHOD = parallel_times")
+            return list(init_times)
+
+    conf_file = p.getloc('METPLUS_CONF')
+    max_workers = max(1, min(int(max_workers), len(init_times)))
+    logger.info("Running %d init times with %d worker processes" %
+                (len(init_times), max_workers))
+    failed = []
+    pool = multiprocessing.Pool(
+        max_workers, _init_worker,
+        (conf_file, list(zip(process_list, wrapper_classes))))
+    try:
+        results = pool.imap_unordered(_run_init_time, init_times)
+        for run_time, success, log_path, seconds in results:
+            _collate_log(logger, run_time, log_path)
+            if success:
+                logger.info("Finished init time %s in %.1f seconds" %
+                            (run_time, seconds))
+            else:
+                logger.error("ERROR: init time " + run_time + " failed")
+                failed.append(run_time)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return sorted(failed)
@@ -15,7 +15,8 @@ Condition codes: 0 for success, 1 for failure
 from __future__ import (print_function, division)
 
 import produtil.setup
-from produtil.run import batchexe, run, checkrun
+from produtil.run import batchexe
+from resource_usage import run, checkrun
 import logging
 import os
 import sys
@@ -23,22 +24,73 @@ import met_util as util
 import re
 import csv
 import subprocess
-import glob
 import datetime
+import itertools
 import string_template_substitution as sts
+from file_catalog import get_file_catalog
+from time_index import get_time_index
+from bucket_cache import get_bucket_cache
+import netcdf_accum
 
 from command_builder import CommandBuilder
-from task_info import TaskInfo
+from task_info import TaskInfo, task_info_list
 from gempak_to_cf_wrapper import GempakToCFWrapper
+import tracing
+
+
+def plan_accumulation(total, available):
+    """!Chooses the fewest bucket files that add up to an accumulation.
+        The hours before the valid time are numbered from 0, and a file
+        ending offset hours before the valid time with accumulation a
+        covers offsets offset to offset+a-1.
+        @param total the accumulation to build, in hours
+        @param available dictionary from each offset to the accumulations
+        of the files that end then
+        @returns list of (offset, accum) from the valid time back, which
+        covers offsets 0 to total-1 exactly once, or None if the files
+        cannot.  Of the plans with fewest files, the one using the
+        largest accumulations first is returned."""
+    # fewest[offset] is the number of files that cover offset to total-1
+    fewest = {total: 0}
+    choice = {}
+    for offset in range(total - 1, -1, -1):
+        for accum in sorted(available.get(offset, ()), reverse=True):
+            rest = fewest.get(offset + accum)
+            if rest is None:
+                continue
+            if offset not in fewest or rest + 1 < fewest[offset]:
+                fewest[offset] = rest + 1
+                choice[offset] = accum
+    if 0 not in fewest:
+        return None
+    plan = []
+    offset = 0
+    while offset < total:
+        plan.append((offset, choice[offset]))
+        offset += choice[offset]
+    return plan
 
 
 class PcpCombineWrapper(CommandBuilder):
+    plans_commands = True
+
+    # warn only once per process that the NUMPY engine is unavailable
+    _engine_warned = False
+
     def __init__(self, p, logger):
         super(PcpCombineWrapper, self).__init__(p, logger)
         self.app_path = os.path.join(self.p.getdir('MET_BUILD_BASE'),
                                      'bin/pcp_combine')
         self.app_name = os.path.basename(self.app_path)
         self.inaddons = []
+        self.bucket_cache = get_bucket_cache(p, logger)
+        self.engine = self.p.getstr('config', 'PCP_COMBINE_ENGINE', 'MET')
+        if self.engine == 'NUMPY' and not netcdf_accum.available():
+            if not PcpCombineWrapper._engine_warned:
+                self.logger.warning("PCP_COMBINE_ENGINE = NUMPY needs numpy "
+                                    "and netCDF4, running pcp_combine")
+                PcpCombineWrapper._engine_warned = True
+            self.engine = 'MET'
 
     def clear(self):
         super(PcpCombineWrapper, self).clear()
@@ -49,65 +101,27 @@ class PcpCombineWrapper(CommandBuilder):
         self.infiles.append(filename)
         self.inaddons.append(str(addon))
 
-    def getLastFile(self, valid_time, search_time, template):
-        out_file = ""
-        files = sorted(glob.glob("{:s}/{:s}/*".format(self.input_dir,
-                                                      str(search_time)[0:8])))
-        for fpath in files:
-            f = os.path.join(str(search_time)[0:8], os.path.basename(fpath))
-            se = sts.StringExtract(self.logger, template, f)
-            se.parseTemplate()
-
-            fcst = se.leadHour
-            if fcst is -1:
-                print("ERROR: Could not pull forecast lead from f")
-                exit
-
-            init = se.getInitTime("%Y%m%d%H")
-            v = util.shift_time(init, fcst)
-            if v == valid_time:
-                out_file = fpath
-        return out_file
-
     # NOTE: Assumes YYYYMMDD sub dir
     def get_lowest_forecast_at_valid(self, valid_time, dtype):
-        out_file = ""
-        day_before = util.shift_time(valid_time, -24)
         input_template = self.p.getraw('filename_templates',
                                        dtype + '_INPUT_TEMPLATE')
-        # get all files in yesterday directory, get valid time from init/fcst
-        # NOTE: This will only apply to forecasts up to 48  hours
-        #  If more is needed, will need to add parameter to specify number of
-        #  days to look back
-        out_file = self.getLastFile(valid_time, day_before, input_template)
-        out_file2 = self.getLastFile(valid_time, valid_time, input_template)
-        if out_file2 == "":
-            return out_file
-        else:
-            return out_file2
-
-
-    def search_day(self, dir, file_time, search_time, template):
-        out_file = ""
-        files = sorted(glob.glob("{:s}/*{:s}*".format(dir, search_time)))
-        for f in files:
-            se = sts.StringExtract(self.logger, template,
-                                   os.path.basename(f))
-            se.parseTemplate()
-            ftime = se.getValidTime("%Y%m%d%H")
-            if ftime < file_time:
-                out_file = f
+        # the index reads the input tree once and gets the valid time of
+        # each file from its init and forecast lead
+        out_file = get_time_index(self.input_dir,
+                                  input_template).lowest_lead_at_valid(
+                                      valid_time)
+        if out_file is None:
+            return ""
         return out_file
 
     def find_closest_before(self, dir, time, template):
+        # only files valid since the start of the day before
         day_before = util.shift_time(time, -24)
-        yesterday_file = self.search_day(dir, time,
-                                         str(day_before)[0:8], template)
-        today_file = self.search_day(dir, time, str(time)[0:8], template)
-        if today_file == "":
-            return yesterday_file
-        else:
-            return today_file
+        out_file = get_time_index(dir, template).closest_before(
+            time, str(day_before)[0:8])
+        if out_file is None:
+            return ""
+        return out_file
 
     def get_accumulation(self, valid_time, accum, ob_type, is_forecast=False):
         # TODO: pass in template (input/native) so this isn't assumed
@@ -178,85 +192,82 @@ class PcpCombineWrapper(CommandBuilder):
 #        search_accum = total_accum
         search_accum = self.p.getint('config', ob_type+'_ACCUM')
 
-        # loop backwards in time until you have a full set of accum
-        while last_time <= start_time:
-            if is_forecast:
-                f = self.get_lowest_forecast_at_valid(start_time, ob_type)
-                if f == "":
-                    break
-                # TODO: assumes 1hr accum (6 for NB) in these files for now
-                if ob_type == "NATIONAL_BLEND":
-                    ob_str = self.p.getstr('config',
-                                           ob_type + '_' + str(6) +
-                                           '_FIELD_NAME')
-                    addon = "'name=\"" + ob_str + "\"; level=\"(0,*,*)\";'"
-                else:
-                    ob_str = self.p.getstr('config',
-                                           ob_type + '_' + str(1) +
-                                           '_FIELD_NAME')
+        if not is_forecast:
+            # every bucket file that fits in the accumulation window is
+            # looked for at once, then the fewest that cover it are used
+            buckets = self.find_buckets(valid_time, total_accum,
+                                        search_accum, file_template)
+            plan = plan_accumulation(total_accum, buckets)
+            if plan is None:
+                self.logger.warning(self.app_name + ": Could not find "
+                                    "files to compute accumulation for " +
+                                    ob_type)
+                return None
+            data_type = self.p.getstr('config',
+                                      ob_type + '_NATIVE_DATA_TYPE')
+            for offset, bucket_accum in plan:
+                addon = ""
+                if data_type == "GRIB":
+                    addon = bucket_accum
+                elif data_type == "NETCDF":
+                    ob_str = self.p.getstr('config', ob_type + '_' +
+                                           str(bucket_accum) + '_FIELD_NAME')
                     addon = "'name=\"" + ob_str + "\"; level=\"(0,*,*)\";'"
+                self.add_input_file(buckets[offset][bucket_accum], addon)
+            self.set_output_dir(self.outdir)
+            return
 
-                self.add_input_file(f, addon)
-                start_time = util.shift_time(start_time, -1)
-                search_accum -= 1
-            else:  # not looking for forecast files
-                # get all files of valid_time (all accums)
-#                files = sorted(glob.glob("{:s}/{:s}/*{:s}*"
-#                                         .format(self.input_dir,
-#                                                 start_time[0:8], start_time)))
-                print("INPUTDIR IS:"+self.input_dir+" and START TIME IS:"+start_time)
-                files = sorted(glob.glob("{:s}/*{:s}*"
-                                         .format(self.input_dir,
-                                                 start_time)))
-
-                # look for biggest accum that fits search
-                while search_accum > 0:
-                    fSts = sts.StringSub(self.logger,
-                                         file_template,
-                                         valid=start_time,
-                                         accum=str(search_accum).zfill(2))
-                    search_file = os.path.join(self.input_dir,
-                                               fSts.doStringSub())
-                    f = None
-                    for file in files:
-                        if file == search_file:
-                            f = file
-                            break
-                    # if found a file, add it to input list with info
-                    if f is not None:
-                        addon = ""
-                        data_type = self.p.getstr('config', ob_type +
-                                                  '_NATIVE_DATA_TYPE')
-                        if data_type == "GRIB":
-                            addon = search_accum
-                        elif data_type == "NETCDF":
-                            ob_str = self.p.getstr('config', ob_type +
-                                                   '_' + str(search_accum) +
-                                                   '_FIELD_NAME')
-                            addon = "'name=\"" + ob_str + \
-                                    "\"; level=\"(0,*,*)\";'"
-                        self.add_input_file(f, addon)
-                        start_time = util.shift_time(start_time+"00", -search_accum)[0:10]
-                        total_accum -= search_accum
-#                        search_accum = total_accum
-                        break
-                    search_accum -= 1
-
-
-                if total_accum == 0:
-                    break
-
-                if search_accum == 0:
-                        self.logger.warning(self.app_name + ": Could not find " \
-                                            "files to compute accumulation for " \
-                                            + ob_type)
-                        return None                                    
-
-
-                
+        # loop backwards in time until you have a full set of accum
+        while last_time <= start_time:
+            f = self.get_lowest_forecast_at_valid(start_time, ob_type)
+            if f == "":
+                break
+            # TODO: assumes 1hr accum (6 for NB) in these files for now
+            if ob_type == "NATIONAL_BLEND":
+                ob_str = self.p.getstr('config',
+                                       ob_type + '_' + str(6) +
+                                       '_FIELD_NAME')
+                addon = "'name=\"" + ob_str + "\"; level=\"(0,*,*)\";'"
+            else:
+                ob_str = self.p.getstr('config',
+                                       ob_type + '_' + str(1) +
+                                       '_FIELD_NAME')
+                addon = "'name=\"" + ob_str + "\"; level=\"(0,*,*)\";'"
+
+            self.add_input_file(f, addon)
+            start_time = util.shift_time(start_time, -1)
+            search_accum -= 1
 
             self.set_output_dir(self.outdir)
 
+    def find_buckets(self, valid_time, accum, max_accum, template):
+        """!Looks for every bucket file that ends within an accumulation
+            window, rendering all of their names at once and listing each
+            directory once
+            @param valid_time end of the window, YYYYMMDDHH
+            @param accum length of the window in hours
+            @param max_accum longest bucket accumulation to look for
+            @param template filename template of the bucket files
+            @returns dictionary from hours before valid_time to a
+            dictionary from accumulation to the path of the file"""
+        valid = datetime.datetime.strptime(valid_time, "%Y%m%d%H")
+        offsets = list(range(accum))
+        accums = list(range(1, min(max_accum, accum) + 1))
+        # TODO: This assumes max 99 accumulation.
+        paths = [os.path.join(self.input_dir, path) for path in
+                 sts.compile_template(template).render_many(
+                     self.logger, product=True,
+                     valid=[valid - datetime.timedelta(hours=offset)
+                            for offset in offsets],
+                     accum=[str(a).zfill(2) for a in accums])]
+        existing = get_file_catalog().existing(paths)
+        buckets = {}
+        for (offset, bucket_accum), path in zip(
+                itertools.product(offsets, accums), paths):
+            if offset + bucket_accum <= accum and path in existing:
+                buckets.setdefault(offset, {})[bucket_accum] = path
+        return buckets
+
     def get_command(self):
         if self.app_path is None:
             self.logger.error("No app path specified. You must use a subclass")
@@ -287,7 +298,100 @@ class PcpCombineWrapper(CommandBuilder):
         cmd += os.path.join(self.outdir, self.outfile)
         return cmd
 
+    def build(self, on_success=None):
+        '''Run pcp_combine, or add the fields in this process if
+        PCP_COMBINE_ENGINE is NUMPY and the command is a plain -add of
+        NetCDF fields.  If USE_BUCKET_CACHE is set, the bucket of an
+        identical earlier command is linked to the output path instead,
+        and the bucket of each new command is recorded.'''
+        if self.plan is not None or self.get_command() is None:
+            return super(PcpCombineWrapper, self).build(on_success)
+        cache = self.bucket_cache
+        entry = None
+        if cache is not None:
+            args = [self.app_path] + self.args
+            if self.param != "":
+                args.append(self.param)
+            entry = cache.make_entry(args,
+                                     zip(self.infiles, self.inaddons),
+                                     self.get_ledger_env(),
+                                     self.get_output_path())
+            if cache.reuse(entry):
+                return 0
+            cache.prepare(entry)
+
+        def finished():
+            if entry is not None:
+                cache.record(entry)
+            if on_success is not None:
+                on_success()
+
+        return super(PcpCombineWrapper, self).build(finished)
+
+    def get_engine_job(self):
+        '''Returns the inputs and the output variable name for
+        netcdf_accum.add_fields if PCP_COMBINE_ENGINE is NUMPY and the
+        command only adds NetCDF fields, otherwise None'''
+        if self.engine != 'NUMPY' or self.param != "":
+            return None
+        names = [a[len('-name '):] for a in self.args
+                 if a.startswith('-name ')]
+        if len(names) != 1 or \
+           [a for a in self.args if not a.startswith('-name ')] != ['-add']:
+            return None
+        fields = [netcdf_accum.parse_field(a) for a in self.inaddons]
+        if None in fields:
+            return None
+        return ([(f,) + field for f, field in zip(self.infiles, fields)],
+                names[0])
+
+    def get_in_process_job(self):
+        '''Adds the fields with netcdf_accum instead of running
+        pcp_combine if get_engine_job finds a job'''
+        job = self.get_engine_job()
+        if job is None:
+            return None
+        inputs, name = job
+        outpath = self.get_output_path()
+        return lambda: netcdf_accum.add_fields(inputs, outpath, name)
+
+    def convert_native_files(self, accumulations):
+        '''If GEMPAKTOCF_BATCH is set, convert the GEMPAK inputs of every
+        accumulation to NetCDF in one GempakToCF batch before any of them
+        is built.  Each accumulation is a tuple of the get_accumulation
+        arguments: valid time, accumulation, data type and is_forecast.'''
+        if not self.p.getbool('config', 'GEMPAKTOCF_BATCH', False):
+            return
+        pairs = []
+        for valid_time, accum, data_type, is_forecast in accumulations:
+            if self.p.getstr('config',
+                             data_type + '_NATIVE_DATA_TYPE') != "NETCDF":
+                continue
+            input_dir = self.p.getstr('config', data_type + '_INPUT_DIR')
+            native_dir = self.p.getstr('config', data_type + '_NATIVE_DIR')
+            self.set_input_dir(input_dir)
+            self.get_accumulation(valid_time, accum, data_type, is_forecast)
+            for infile in self.get_input_files():
+                nfile = infile.replace(input_dir, native_dir)
+                nfile = os.path.splitext(nfile)[0] + '.nc'
+                if not os.path.isfile(nfile):
+                    pairs.append((infile, nfile))
+            self.clear()
+        if len(pairs) != 0:
+            GempakToCFWrapper(self.p, self.logger).convert_batch(pairs)
+
+    def get_task_inputs(self, init_time):
+        # reads raw observations only, nothing produced by other wrappers
+        return []
+
+    def get_task_outputs(self, init_time):
+        return [('bucket', ti.ob_type, ti.getValidTime()[0:10], int(ti.level))
+                for ti in task_info_list(self.p, init_time)]
+
     def run_at_time(self, init_time):
+        self.convert_native_files(
+            [(ti.getValidTime()[0:10], int(ti.level), ti.ob_type, False)
+             for ti in task_info_list(self.p, init_time)])
         task_info = TaskInfo()
         task_info.init_time = init_time
         fcst_vars = util.getlist(self.p.getstr('config', 'FCST_VARS'))
@@ -308,10 +412,13 @@ class PcpCombineWrapper(CommandBuilder):
                         if lead < int(accum):
                             continue
                         #                        self.run_at_time_fcst(task_info)
-                        self.run_at_time_once(task_info.getValidTime(),
-                                              task_info.level,
-                                              task_info.ob_type,
-                                              task_info.fcst_var)
+                        with tracing.span('run_at_time_once', 'lead',
+                                          lead=lead, var=fcst_var,
+                                          accum=accum, ob_type=ob_type):
+                            self.run_at_time_once(task_info.getValidTime(),
+                                                  task_info.level,
+                                                  task_info.ob_type,
+                                                  task_info.fcst_var)
 
     def run_at_time_once(self, valid_time, accum, ob_type,
                          fcst_var, is_forecast=False):
@@ -323,10 +430,8 @@ class PcpCombineWrapper(CommandBuilder):
 
         ymd_v = valid_time[0:8]
         if ob_type != "QPE":
-          if not os.path.exists(os.path.join(native_dir, ymd_v)):
-              os.makedirs(os.path.join(native_dir, ymd_v))
-        if not os.path.exists(os.path.join(bucket_dir, ymd_v)):
-            os.makedirs(os.path.join(bucket_dir, ymd_v))
+            util.mkdir_p(os.path.join(native_dir, ymd_v))
+        util.mkdir_p(os.path.join(bucket_dir, ymd_v))
 
         self.set_input_dir(input_dir)
         self.set_output_dir(bucket_dir)
@@ -366,6 +471,7 @@ class PcpCombineWrapper(CommandBuilder):
         cmd = self.get_command()
         if cmd is None:
             print("ERROR: pcp_combine could not generate command")
+            self.clear()
             return
         self.logger.info("")
         self.build()
@@ -65,6 +65,28 @@ class Environment(object):
 #  an Environment object.  You should never need to instantiate another one.
 ENVIRONMENT=Environment()
 
+class RecordingEnvironment(Environment):
+    """!An Environment that remembers whether it was read
+
+    ProdConfig._interp passes one of these in place of ENVIRONMENT
+    when it expands a value it may cache.  A value that read an
+    environment variable is not cached, since the environment may
+    change after the value is expanded."""
+    def __init__(self):
+        """!Constructor for RecordingEnvironment"""
+        super(RecordingEnvironment,self).__init__()
+        self.used=False
+    def __contains__(self,s):
+        self.used=True
+        return super(RecordingEnvironment,self).__contains__(s)
+    def __getitem__(self,s):
+        self.used=True
+        return super(RecordingEnvironment,self).__getitem__(s)
+
+##@var INTERP_CACHE_SIZE
+# the number of expanded values each ProdConfig keeps
+INTERP_CACHE_SIZE=4096
+
 class ConfFormatter(Formatter):
     """!Internal class that implements ProdConfig.strinterp()
 
@@ -533,6 +555,76 @@ class ProdConfig(object):
         self._conf.add_section('dir')
         self._fallback_callbacks=list()
 
+        # expanded values of (section,option,morevars,taskvars), least
+        # recently used first
+        self._interp_cache=collections.OrderedDict()
+        self._interp_cache_size=INTERP_CACHE_SIZE
+        self.interp_cache_hits=0
+        self.interp_cache_misses=0
+
+    def clear_interp_cache(self):
+        """!forget all expanded values
+
+        Empties the cache of expanded option values.  This is called
+        automatically whenever options or sections are added or
+        changed through this ProdConfig.  Call it after changing the
+        underlying ConfigParser object by other means."""
+        with self:
+            self._interp_cache.clear()
+
+    def set_raw_options(self,values):
+        """!sets many options from their raw values
+
+        Sets the options without the checks of the % syntax
+        SafeConfigParser.set makes, since the values are taken as
+        they were read from a conf file, and adds any missing sections.
+        @param values a dict from each section name to a dict of its
+          options and raw values"""
+        with self:
+            for sec,options in values.iteritems():
+                if not self._conf.has_section(sec):
+                    self._conf.add_section(sec)
+                for opt,value in options.iteritems():
+                    ConfigParser.RawConfigParser.set(self._conf,sec,opt,value)
+            self.clear_interp_cache()
+
+    def expanded_values(self):
+        """!returns the cached expansions of options
+
+        @return a list of ((section,option),value) for the options
+        expanded without morevars or taskvars that are in the cache.
+        Options that are not set are left out."""
+        with self:
+            return [ ((key[0],key[1]),value)
+                     for key,value in self._interp_cache.iteritems()
+                     if key[2] is None and key[3] is None
+                     and value is not NOTFOUND ]
+
+    def preload_expanded(self,values):
+        """!adds expansions of options to the cache
+
+        Fills the cache of expanded values, for instance from a
+        snapshot of a configuration that was already expanded.  The
+        values must be what _interp would return for the options as
+        they are set now.
+        @param values an iterable of ((section,option),value)"""
+        with self:
+            for (sec,opt),value in values:
+                self._interp_cache[(sec,opt,None,None)]=value
+                if len(self._interp_cache)>self._interp_cache_size:
+                    self._interp_cache.popitem(last=False)
+
+    def interp_cache_stats(self):
+        """!returns the use of the cache of expanded values
+
+        @return a dict with the number of cache hits and misses, the
+        number of values cached and the maximum number kept"""
+        with self:
+            return { 'hits':self.interp_cache_hits,
+                     'misses':self.interp_cache_misses,
+                     'size':len(self._interp_cache),
+                     'maxsize':self._interp_cache_size }
+
     @property
     def quoted_literals(self):
         return self._time_formatter.quoted_literals and \
@@ -593,6 +685,7 @@ class ProdConfig(object):
         fp=StringIO.StringIO(str(source))
         self._conf.readfp(fp)
         fp.close()
+        self.clear_interp_cache()
         return self
 
     def from_args(self,args=None,allow_files=True,allow_options=True,
@@ -701,6 +794,7 @@ class ProdConfig(object):
         @param source the file to read
         @return self"""
         self._conf.read(source)
+        self.clear_interp_cache()
         return self
 
     def readfp(self,source):
@@ -711,6 +805,7 @@ class ProdConfig(object):
         @param source the opened file to read
         @return self"""
         self._conf.readfp(source)
+        self.clear_interp_cache()
         return self
 
     def readstr(self,string):
@@ -723,6 +818,7 @@ class ProdConfig(object):
         @return self"""
         sio=StringIO.StringIO(string)
         self._conf.readfp(sio)
+        self.clear_interp_cache()
         return self
 
     def set_options(self,section,**kwargs):
@@ -737,6 +833,7 @@ class ProdConfig(object):
         for k,v in kwargs.iteritems():
             value=str(v)
             self._conf.set(section,k,value)
+        self.clear_interp_cache()
 
     @property
     def realtime(self):
@@ -753,6 +850,7 @@ class ProdConfig(object):
         section, to the specified value.  All three are converted to
         strings via str() before setting the value."""
         self._conf.set(str(section),str(key),str(value))
+        self.clear_interp_cache()
     def __enter__(self):
         """!grab the thread lock
 
@@ -830,6 +928,7 @@ class ProdConfig(object):
         cycle=to_datetime(cycle)
         strcycle=cycle.strftime('%Y%m%d%H')
         self._conf.set('config','cycle',strcycle)
+        self.clear_interp_cache()
         self._cycle=cycle
         self.set_time_vars()
 
@@ -871,6 +970,7 @@ class ProdConfig(object):
                              ('DD','%d'), ('hour','%H'), ('cyc','%H'),
                              ('HH','%H'), ('minute','%M'), ('min','%M') ]:
                 self._conf.set('config',var,self._cycle.strftime(fmt))
+            self.clear_interp_cache()
     def add_section(self,sec):
         """!add a new config section
 
@@ -880,6 +980,7 @@ class ProdConfig(object):
         @param sec the new section's name"""
         with self:
             self._conf.add_section(sec)
+            self.clear_interp_cache()
             return self
     def has_section(self,sec): 
         """!does this section exist?
@@ -1099,13 +1200,58 @@ class ProdConfig(object):
                 __atime=atime, __ftime=ftime,**kwargs)
 
     def _interp(self,sec,opt,morevars=None,taskvars=None):
-        """!implementation of data-getting routines
+        """!implementation of data-getting routines, with a cache
+
+        Returns the expanded value of option opt in section sec from
+        the cache of recently expanded values, or expands it with
+        _expand and caches the result.  Options that are not set are
+        cached too, and raise NoOptionError again.  Values that read
+        environment variables, and calls whose morevars or taskvars
+        cannot be used as a dict key, are not cached.  The cache keeps the
+        INTERP_CACHE_SIZE most recently used values.
+
+        @param sec the section name
+        @param opt the option name
+        @param morevars,taskvars dicts of more variables for string
+        expansion; see _expand
+        @return the result of the string expansion"""
+        try:
+            key=(sec,opt,
+                 None if morevars is None else frozenset(morevars.items()),
+                 None if taskvars is None else frozenset(taskvars.items()))
+            hash(key)
+        except TypeError:
+            # unhashable values in morevars or taskvars
+            return self._expand(sec,opt,morevars,taskvars,ENVIRONMENT)
+        with self:
+            cache=self._interp_cache
+            if key in cache:
+                self.interp_cache_hits+=1
+                value=cache.pop(key)
+                cache[key]=value
+            else:
+                self.interp_cache_misses+=1
+                env=RecordingEnvironment()
+                try:
+                    value=self._expand(sec,opt,morevars,taskvars,env)
+                except NoOptionError:
+                    value=NOTFOUND
+                if not env.used:
+                    cache[key]=value
+                    if len(cache)>self._interp_cache_size:
+                        cache.popitem(last=False)
+            if value is NOTFOUND:
+                raise NoOptionError(opt,sec)
+            return value
+
+    def _expand(self,sec,opt,morevars,taskvars,env):
+        """!expands an option, without the cache
 
         This is the underlying implementation of the various self.get*
-        routines, and lies below the self._get.  It reads a config
+        routines, and lies below the self._interp.  It reads a config
         option opt from the config section sec.
 
-        If the string contains a {...} expansion, the _interp will
+        If the string contains a {...} expansion, the _expand will
         perform string interpolation, expanding {...} strings
         according to ConfigParser rules.  If the section contains an
         @inc, and any variables requested are not found, then the
@@ -1119,6 +1265,7 @@ class ProdConfig(object):
         interpolation.  
         @param taskvars  serves the same purpose as morevars, but
         provides a second scope.
+        @param env the Environment used for ENV[...] expansions
         @return the result of the string expansion"""
         sections=( sec, 'config','dir', '@inc' )
         gotted=False
@@ -1155,11 +1302,11 @@ class ProdConfig(object):
         if morevars is None:
             return self._formatter.format(got,
                 __section=sec,__key=opt,__depth=0,__conf=self._conf,
-                ENV=ENVIRONMENT, __taskvars=taskvars)
+                ENV=env, __taskvars=taskvars)
         else:
             return self._formatter.format(got,
                 __section=sec,__key=opt,__depth=0,__conf=self._conf,
-                ENV=ENVIRONMENT,__taskvars=taskvars,**morevars)
+                ENV=env,__taskvars=taskvars,**morevars)
 
     def _get(self,sec,opt,typeobj,default,badtypeok,morevars=None,taskvars=None):
         """! high-level implemention of get routines
@@ -22,17 +22,28 @@ import re
 import csv
 import subprocess
 import string_template_substitution as sts
-from task_info import TaskInfo
+from task_info import TaskInfo, task_info_list
 from command_builder import CommandBuilder
+import tracing
 
 
 class RegridDataPlaneWrapper(CommandBuilder):
+    plans_commands = True
+
     def __init__(self, p, logger):
         super(RegridDataPlaneWrapper, self).__init__(p, logger)
         self.app_path = os.path.join(self.p.getdir('MET_BUILD_BASE'),
                                      'bin/regrid_data_plane')
         self.app_name = os.path.basename(self.app_path)
 
+    def get_task_inputs(self, init_time):
+        return [('bucket', ti.ob_type, ti.getValidTime()[0:10], int(ti.level))
+                for ti in task_info_list(self.p, init_time)]
+
+    def get_task_outputs(self, init_time):
+        return [('regrid', ti.ob_type, ti.getValidTime()[0:10], int(ti.level))
+                for ti in task_info_list(self.p, init_time)]
+
     def run_at_time(self, init_time):
         task_info = TaskInfo()
         task_info.init_time = init_time
@@ -55,9 +66,12 @@ class RegridDataPlaneWrapper(CommandBuilder):
                         if lead < int(accum):
                             continue
                         #                        self.run_at_time_fcst(task_info)
-                        self.run_at_time_once(task_info.getValidTime(),
-                                              task_info.level,
-                                              task_info.ob_type)
+                        with tracing.span('run_at_time_once', 'lead',
+                                          lead=lead, var=fcst_var,
+                                          accum=accum, ob_type=ob_type):
+                            self.run_at_time_once(task_info.getValidTime(),
+                                                  task_info.level,
+                                                  task_info.ob_type)
 
     def run_at_time_once(self, valid_time, accum, ob_type):
         obs_var = self.p.getstr('config', ob_type + "_VAR")
@@ -69,8 +83,7 @@ class RegridDataPlaneWrapper(CommandBuilder):
                                         ob_type + '_REGRID_TEMPLATE')
 
         ymd_v = valid_time[0:8]
-        if not os.path.exists(os.path.join(regrid_dir, ymd_v)):
-            os.makedirs(os.path.join(regrid_dir, ymd_v))
+        util.mkdir_p(os.path.join(regrid_dir, ymd_v))
 
         pcpSts = sts.StringSub(self.logger,
                                bucket_template,
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+'''
+Program Name: resource_usage.py
+Contact(s): George McCabe
+Abstract: Records the resources used by each command METplus runs
+History Log:  Initial version
+Usage: Enabled with USAGE_REPORT = True
+Parameters: None
+Input Files: N/A
+Output Files: USAGE_REPORT_FILE (CSV) and a JSON summary next to it
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import csv
+import json
+import time
+import resource
+import threading
+import produtil.locking
+import produtil.rusage
+import produtil.run
+import tracing
+from produtil.run import ExitStatusException
+
+'''!@namespace resource_usage
+@brief Per-command wall time, CPU time, max RSS and block I/O.
+
+When USAGE_REPORT is True every command run by CommandBuilder.build, the
+CommandExecutor and the run() and checkrun() functions of this module is
+recorded with the wrapper and init time it ran for.  Wrappers import
+run and checkrun from here instead of produtil.run; they behave the
+same, and also add a command span to the trace (see tracing).
+
+Commands started with subprocess are reaped with os.wait4, which gives
+the usage of that command alone.  produtil.run reaps its own children,
+so those commands are measured with produtil.rusage.RUsage, the change
+in RUSAGE_CHILDREN over the call.  That is exact when one command runs
+at a time.  RUSAGE_CHILDREN only keeps the largest RSS of any child, so
+max_rss_kb is left empty when a command did not exceed an earlier one.
+Work that CommandBuilder.build does in this process instead of running
+the command is measured with thread_usage() before and after it.
+
+Records are appended to USAGE_REPORT_FILE under a lock file by save(),
+so the worker processes of LOOP_METHOD = parallel_times can share it.
+write_summary() totals the CSV by wrapper, tool and init time into a
+JSON file with the same name and a .json extension.
+'''
+
+USAGE_FIELDS = ['wrapper', 'tool', 'init_time', 'exit_status',
+                'wall_seconds', 'user_seconds', 'sys_seconds',
+                'max_rss_kb', 'in_blocks', 'out_blocks', 'cmd']
+
+# wrapper and init time of the commands run by the current thread
+_context = threading.local()
+
+# the UsageReport of this process, or None if USAGE_REPORT is False
+_report = None
+
+
+def set_context(wrapper=None, init_time=None):
+    """!Sets the wrapper and init time recorded with the commands this
+        thread runs next"""
+    _context.wrapper = wrapper
+    _context.init_time = init_time
+
+
+def get_context():
+    """!Returns (wrapper, init time) set by set_context for this thread"""
+    return (getattr(_context, 'wrapper', None),
+            getattr(_context, 'init_time', None))
+
+
+def start_report(p, new=True):
+    """!Starts recording if USAGE_REPORT is True
+        @param p the config instance
+        @param new True to start a new report, False for a worker process
+        that adds to the report its parent started
+        @returns the UsageReport, or None"""
+    global _report
+    if not p.getbool('config', 'USAGE_REPORT', False):
+        _report = None
+        return None
+    _report = UsageReport(p.getstr('config', 'USAGE_REPORT_FILE'))
+    if new:
+        _report.reset()
+    return _report
+
+
+def get_report():
+    """!Returns the UsageReport of this process, or None"""
+    return _report
+
+
+def tool_name(cmd):
+    """!Returns the name of the program a shell command line runs.  Export
+        statements added by the task farm are skipped."""
+    for part in cmd.split(';'):
+        words = part.split()
+        if words and words[0] != 'export':
+            return os.path.basename(words[0])
+    return ''
+
+
+def _runner_command(arg):
+    """!Returns the command line of a produtil.prog.Runner.  For sh -c
+        this is the string passed to the shell."""
+    try:
+        args = list(arg.args())
+    except AttributeError:
+        return arg.to_shell()
+    if len(args) > 2 and os.path.basename(args[0]) == 'sh' and \
+       args[1] == '-c':
+        return args[2]
+    return ' '.join(args)
+
+
+def wait_with_usage(process):
+    """!Waits for a subprocess.Popen with os.wait4
+        @returns tuple of (exit status, resource usage of the process)"""
+    pid, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, usage
+
+
+def thread_usage():
+    """!Returns the resource usage of the calling thread where the
+        system reports it, otherwise of this process"""
+    return resource.getrusage(getattr(resource, 'RUSAGE_THREAD',
+                                      resource.RUSAGE_SELF))
+
+
+def _rusage_values(usage, before=None):
+    """!Returns user and sys seconds, max RSS and block counts from a
+        resource usage structure, or from the difference between two"""
+    values = [usage.ru_utime, usage.ru_stime, usage.ru_maxrss,
+              usage.ru_inblock, usage.ru_oublock]
+    if before is not None:
+        values = [after - base for after, base in zip(
+            values, [before.ru_utime, before.ru_stime, 0,
+                     before.ru_inblock, before.ru_oublock])]
+        if usage.ru_maxrss <= before.ru_maxrss:
+            # not larger than an earlier child, so unknown
+            values[2] = ''
+    return values
+
+
+class UsageReport(object):
+    """!Resource usage of the commands run by this process"""
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._records = []
+
+    def reset(self):
+        """!Removes the records of previous runs"""
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def add(self, cmd, exit_status, wall_seconds, usage, before=None,
+            wrapper=None, init_time=None):
+        """!Records one command
+            @param cmd the command line
+            @param exit_status the exit status of the command
+            @param wall_seconds elapsed time
+            @param usage resource usage from os.wait4 or
+            resource.getrusage after the command
+            @param before resource.getrusage before the command, if usage
+            is cumulative
+            @param wrapper wrapper name, if not the one from set_context
+            @param init_time init time, if not the one from set_context"""
+        context_wrapper, context_init = get_context()
+        record = [wrapper or context_wrapper or '', tool_name(cmd),
+                  init_time or context_init or '', exit_status,
+                  '%.3f' % wall_seconds]
+        record += ['%.3f' % value if isinstance(value, float) else value
+                   for value in _rusage_values(usage, before)]
+        record.append(cmd)
+        with self._lock:
+            self._records.append(record)
+
+    def measure(self):
+        """!Returns a produtil.rusage.RUsage for a "with" block that runs
+            one command.  Call add_measured with it after the block."""
+        return produtil.rusage.RUsage(who=resource.RUSAGE_CHILDREN)
+
+    def add_measured(self, cmd, exit_status, measured):
+        """!Records a command measured with a RUsage from measure()"""
+        self.add(cmd, exit_status,
+                 measured.time_after - measured.time_before,
+                 measured.rusage_after, measured.rusage_before)
+
+    def save(self):
+        """!Appends the records added since the last save to the CSV"""
+        with self._lock:
+            records = self._records
+            self._records = []
+        if not records:
+            return
+        parent = os.path.dirname(self.filename)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with produtil.locking.LockFile(self.filename + '.lock',
+                                       max_tries=300, sleep_time=0.1):
+            new_file = not os.path.exists(self.filename)
+            with open(self.filename, 'a') as csv_file:
+                writer = csv.writer(csv_file)
+                if new_file:
+                    writer.writerow(USAGE_FIELDS)
+                writer.writerows(records)
+
+    def read(self):
+        """!Returns the records in the CSV as a list of dicts"""
+        if not os.path.exists(self.filename):
+            return []
+        with open(self.filename) as csv_file:
+            return list(csv.DictReader(csv_file))
+
+    def write_summary(self):
+        """!Writes the JSON summary of the CSV, totalled by tool and by
+            wrapper, tool and init time
+            @returns the path of the JSON file"""
+        groups = {}
+        tools = {}
+        for record in self.read():
+            key = (record['wrapper'], record['tool'], record['init_time'])
+            for totals in (groups.setdefault(key, {}),
+                           tools.setdefault(record['tool'], {})):
+                _add_to_totals(totals, record)
+        summary = {'created': time.strftime('%Y%m%d%H%M%S', time.gmtime()),
+                   'tools': tools,
+                   'groups': [dict(wrapper=key[0], tool=key[1],
+                                   init_time=key[2], **groups[key])
+                              for key in sorted(groups)]}
+        json_file = os.path.splitext(self.filename)[0] + '.json'
+        with open(json_file, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=1, sort_keys=True)
+        return json_file
+
+
+def _add_to_totals(totals, record):
+    totals['commands'] = totals.get('commands', 0) + 1
+    if record['exit_status'] != '0':
+        totals['failed'] = totals.get('failed', 0) + 1
+    for field in ('wall_seconds', 'user_seconds', 'sys_seconds'):
+        totals[field] = totals.get(field, 0.0) + float(record[field])
+    for field in ('in_blocks', 'out_blocks'):
+        totals[field] = totals.get(field, 0) + int(record[field])
+    if record['max_rss_kb'] != '':
+        totals['max_rss_kb'] = max(totals.get('max_rss_kb', 0),
+                                   int(record['max_rss_kb']))
+
+
+def _command_span(cmd):
+    return tracing.span(tool_name(cmd), 'command', cmd=cmd)
+
+
+def run(arg, logger=None, **kwargs):
+    """!produtil.run.run, recorded in the usage report and trace"""
+    cmd = _runner_command(arg)
+    with _command_span(cmd) as span:
+        if _report is None:
+            status = produtil.run.run(arg, logger=logger, **kwargs)
+        else:
+            measured = _report.measure()
+            with measured:
+                status = produtil.run.run(arg, logger=logger, **kwargs)
+            _report.add_measured(cmd, status, measured)
+        span.set(exit_status=status)
+    return status
+
+
+def checkrun(arg, logger=None, **kwargs):
+    """!produtil.run.checkrun, recorded in the usage report and trace"""
+    cmd = _runner_command(arg)
+    with _command_span(cmd):
+        if _report is None:
+            return produtil.run.checkrun(arg, logger=logger, **kwargs)
+        measured = _report.measure()
+        status = 0
+        try:
+            with measured:
+                return produtil.run.checkrun(arg, logger=logger, **kwargs)
+        except ExitStatusException as e:
+            status = e.status
+            raise
+        finally:
+            if measured.rusage_after is not None:
+                _report.add_measured(cmd, status, measured)
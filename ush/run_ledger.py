@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+'''
+Program Name: run_ledger.py
+Contact(s): George McCabe
+Abstract: Records completed commands so reruns can skip them
+History Log:  Initial version
+Usage: Used by CommandBuilder.build when USE_RUN_LEDGER = True
+Parameters: None
+Input Files: N/A
+Output Files: RUN_LEDGER_FILE (sqlite3 database)
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import hashlib
+import json
+import threading
+import produtil.datastore
+
+'''!@namespace run_ledger
+@brief Make-like incremental reruns for every CommandBuilder subclass.
+
+Each command that completes successfully is stored as a
+produtil.datastore.Product in the RUN_LEDGER_FILE sqlite3 database.  The
+product name is a hash of the command line and the environment
+variables the wrapper set.  Its metadata holds a hash of those plus the
+size and modification time of each input file, and the size and
+modification time of each output file after the command ran.
+
+On a rerun a command is skipped if its record is available, the hash is
+unchanged and every output file still has the recorded size and
+modification time.  For an output directory (grid_stat -outdir), which
+other commands write into too, the directory is listed before the
+command runs and again after, and the files that are new or changed
+are recorded as the outputs of the command.  A directory the command
+wrote nothing into is never current.
+'''
+
+LEDGER_CATEGORY = 'metplus_ledger'
+
+# one RunLedger per (process id, database file)
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(p, logger):
+    """!Returns the RunLedger for this run, or None if USE_RUN_LEDGER is
+        False.  Wrappers in the same process share one RunLedger.
+        @param p the config instance
+        @param logger a logging.Logger for log messages"""
+    if not p.getbool('config', 'USE_RUN_LEDGER', False):
+        return None
+    filename = p.getstr('config', 'RUN_LEDGER_FILE')
+    key = (os.getpid(), filename)
+    with _ledgers_lock:
+        if key not in _ledgers:
+            parent = os.path.dirname(filename)
+            if parent and not os.path.isdir(parent):
+                os.makedirs(parent)
+            _ledgers[key] = RunLedger(filename, logger)
+        return _ledgers[key]
+
+
+def _file_state(path):
+    """!Returns [path, size, mtime] for a file, [path, -1, -1] for a
+        directory, or None if path does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if os.path.isdir(path):
+        return [path, -1, -1]
+    return [path, st.st_size, int(st.st_mtime)]
+
+
+def _dir_files(path):
+    """!Returns a dictionary from the path of each file in a directory to
+        its state, or an empty dictionary if path is not a directory"""
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return {}
+    states = {}
+    for name in names:
+        state = _file_state(os.path.join(path, name))
+        if state is not None and state[1] != -1:
+            states[state[0]] = state
+    return states
+
+
+def _output_state(path, written=None):
+    """!Returns the state of one output.  A file has its _file_state.  A
+        directory has [path, states], where states are the _file_state
+        of the files in written.
+        @param path the output file or directory
+        @param written for a directory, the paths of the files the
+        command wrote into it"""
+    if written is None:
+        return _file_state(path)
+    return [path, [_file_state(f) for f in sorted(written)]]
+
+
+class LedgerEntry(object):
+    """!The ledger record for one command, computed before it runs"""
+    def __init__(self, cmd, env_items, inputs, outputs):
+        self.cmd = cmd
+        self.outputs = list(outputs)
+        # files already in the output directories, to find the ones the
+        # command writes
+        self.dirs_before = dict((path, _dir_files(path))
+                                for path in self.outputs
+                                if os.path.isdir(path))
+        # the same command line can run with different settings in the
+        # environment (grid_stat FCST_FIELD), so both identify the command
+        command = json.dumps({'cmd': cmd, 'env': sorted(env_items)},
+                             sort_keys=True)
+        self.key = hashlib.sha1(command.encode('utf-8')).hexdigest()
+        state = {'command': command,
+                 'inputs': [[path, _file_state(path)]
+                            for path in sorted(set(inputs))]}
+        self.hash = hashlib.sha1(
+            json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RunLedger(object):
+    """!Stores completed commands in a produtil.datastore.Datastore"""
+    def __init__(self, filename, logger=None):
+        self.filename = filename
+        self.logger = logger
+        self.datastore = produtil.datastore.Datastore(filename, logger)
+
+    def _product(self, entry):
+        return produtil.datastore.Product(self.datastore, entry.key,
+                                          LEDGER_CATEGORY, cache=False)
+
+    def make_entry(self, cmd, env_items, inputs, outputs):
+        """!Creates the LedgerEntry for a command
+            @param cmd the command line
+            @param env_items list of (name, value) environment settings
+            that affect the command
+            @param inputs paths of files the command reads
+            @param outputs paths of files or directories it writes"""
+        return LedgerEntry(cmd, env_items, inputs, outputs)
+
+    def is_current(self, entry):
+        """!Returns True if the command already completed with the same
+            hash and its outputs have not changed since"""
+        if not entry.outputs:
+            # nothing to check, always run
+            return False
+        product = self._product(entry)
+        if not product.available or product.get('hash') != entry.hash:
+            return False
+        recorded = json.loads(product.get('outputs', '[]'))
+        if len(recorded) != len(entry.outputs):
+            return False
+        current = []
+        for path, state in zip(entry.outputs, recorded):
+            if state is not None and isinstance(state[1], list):
+                # a directory: check the files the command wrote to it
+                if not state[1]:
+                    return False
+                current.append(_output_state(
+                    path, [written[0] for written in state[1]
+                           if written is not None]))
+            else:
+                current.append(_file_state(path))
+        return current == recorded
+
+    def record(self, entry):
+        """!Records that the command completed successfully"""
+        product = self._product(entry)
+        with self.datastore.transaction():
+            product['hash'] = entry.hash
+            product['outputs'] = json.dumps(
+                [self._written_state(entry, path) for path in entry.outputs])
+            product['cmd'] = entry.cmd
+            product.set_loc_avail(
+                entry.outputs[0] if entry.outputs else '', 1)
+
+    def _written_state(self, entry, path):
+        """!Returns the state of an output after the command ran"""
+        if not os.path.isdir(path):
+            return _file_state(path)
+        before = entry.dirs_before.get(path, {})
+        return _output_state(path, [f for f, state
+                                    in _dir_files(path).items()
+                                    if before.get(f) != state])
+
+    def forget(self, entry):
+        """!Marks the command as not completed"""
+        self._product(entry).set_loc_avail('', 0)
@@ -12,7 +12,7 @@ import met_util as util
 import produtil.setup
 from command_builder import CommandBuilder
 from produtil.run import batchexe
-from produtil.run import run
+from resource_usage import run
 
 '''! @namespace SeriesByInitWrapper
 @brief Performs any optional filtering of input tcst data then performs
@@ -196,6 +196,7 @@ class SeriesByInitWrapper(CommandBuilder):
 
         # Build up the arguments to and then run the MET tool series_analysis.
         self.build_and_run_series_request(sorted_filter_init, tile_dir)
+        self.flush()
 
         # Generate plots
         # Check for .nc files in output_dir first, if these are absent, the
@@ -398,7 +399,10 @@ class SeriesByInitWrapper(CommandBuilder):
                     self.create_fcst_anly_to_ascii_file(
                         anly_grid_files, cur_init, cur_storm,
                         self.anly_ascii_file_prefix)
-                    util.prune_empty(self.series_out_dir, self.logger)
+
+        # Remove any empty files and directories left by storms without
+        # tiles, once for all the storms and init times.
+        util.prune_empty(self.series_out_dir, self.logger)
         return sorted_filter_init
 
     def build_and_run_series_request(self, sorted_filter_init, tile_dir):
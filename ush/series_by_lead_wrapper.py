@@ -8,10 +8,12 @@ import errno
 import glob
 import produtil.setup
 from produtil.run import batchexe
-from produtil.run import run
+from resource_usage import run
 from command_builder import CommandBuilder
 import met_util as util
 import config_metplus
+from task_farm import TaskFarm
+from file_catalog import get_file_catalog
 
 
 ## @namespace SeriesByLeadWrapper
@@ -71,6 +73,8 @@ class SeriesByLeadWrapper(CommandBuilder):
             p.getdir('SERIES_LEAD_FILTERED_OUT_DIR')
         self.series_lead_out_dir = p.getdir('SERIES_LEAD_OUT_DIR')
         self.tmp_dir = p.getdir('TMP_DIR')
+        # series_analysis, plot_data_plane and convert commands
+        self.farm = TaskFarm(p, self.logger)
         self.background_map = p.getbool('config', 'BACKGROUND_MAP')
         self.regrid_with_met_tool = \
             p.getbool('config', 'REGRID_USING_MET_TOOL')
@@ -328,9 +332,6 @@ class SeriesByLeadWrapper(CommandBuilder):
         # determine how many forecast hour groupings exist.
         num_of_groups = len(self.fhr_group_beg)
 
-        fcst_tiles_list = []
-        anly_tiles_list = []
-
         self.logger.debug('DEBUG|' + cur_filename + '|' + cur_function +
                           ' Performing series analysis on forecast hour'
                           ' groupings.')
@@ -347,6 +348,7 @@ class SeriesByLeadWrapper(CommandBuilder):
         #    combining the -fcst -obs, -out and other arguments.
 
         util.mkdir_p(self.series_lead_out_dir)
+        tile_index = self.get_tile_index(tile_dir)
         for group in range(num_of_groups):
             cur_label = self.fhr_group_labels[group]
             cur_beg_str = self.fhr_group_beg_str[group].zfill(3)
@@ -362,134 +364,126 @@ class SeriesByLeadWrapper(CommandBuilder):
                    cur_end_str)
             self.logger.debug(msg)
 
-            # Loop over each forecast hour within each group
+            # Gather the tiles of each forecast hour within each group
             # for example, if the FHR_GROUP_BEG of the first group is 24 hours
             # and the FHR_GROUP_END of the first group is 42 hours and the
-            # forecast hours are incremented by 6 hours, then we will iterate
-            # over the 24, 30, 36, and 42 hour forecast times.
+            # forecast hours are incremented by 6 hours, then the tiles
+            # of the 24, 30, 36, and 42 hour forecast times are gathered.
             inc_hr = int(self.fhr_inc)
+            fcst_tiles_list = []
+            anly_tiles_list = []
             for cur_fhr in range(cur_beg, cur_end + inc_hr, inc_hr):
-                cur_fcst_tiles_list = self.get_anly_or_fcst_files(
-                    tile_dir, "FCST", self.fcst_tile_regex,
-                    cur_fhr)
-
-                cur_anly_tiles_list = self.get_anly_or_fcst_files(
-                    tile_dir, "ANLY", self.anly_tile_regex, cur_fhr)
-
-                # Location of "grouped" FCST_FILES_Fhhh and ANLY_FILES_Fhhh
-                ascii_fcst_file_parts = [out_dir, '/FCST_FILES_F',
-                                         cur_beg_str + '_to_F' + cur_end_str]
-                ascii_anly_file_parts = [out_dir, '/ANLY_FILES_F',
-                                         cur_beg_str + '_to_F' + cur_end_str]
-                ascii_fcst_file = ''.join(ascii_fcst_file_parts)
-                ascii_anly_file = ''.join(ascii_anly_file_parts)
-
-                # Iterate over each forecast hour beg, end pair in this
-                # grouping
-                for cur_fcst in cur_fcst_tiles_list:
-                    fcst_tiles_list.append(cur_fcst)
-
-                for cur_anly in cur_anly_tiles_list:
-                    anly_tiles_list.append(cur_anly)
-
-                # Create the FCST and ANLY ASCII files that are the args
-                # to the -fcst and -obs portion of the series_analysis
-                # command.
-
-                # For FCST
-                try:
-                    if not fcst_tiles_list:
-                        msg = ("INFO|[" + cur_filename + ":" +
-                               cur_function +
-                               " No fcst_tiles for fhr group: " + cur_beg_str +
-                               " to " + cur_end_str +
-                               " Don't create FCST_F<fhr> ASCII file")
-                        self.logger.debug(msg)
-                    else:
-                        with open(ascii_fcst_file, 'a') as file_handle:
-                            for fcst_tiles in fcst_tiles_list:
-                                file_handle.write(fcst_tiles)
-                                file_handle.write('\n')
-                except IOError as io_error:
-                    msg = ("ERROR: Could not create requested" +
-                           " ASCII file: " + ascii_fcst_file + " | ")
-                    self.logger.error(msg + io_error)
-
-                # For ANLY
-                try:
-                    if not anly_tiles_list:
-                        msg = ("INFO|[" + cur_filename + ":" +
-                               cur_function +
-                               " No anly_tiles for fhr group: " +
-                               str(cur_beg) + " to " + str(cur_end) +
-                               " Don't create ANLY_F<fhr> ASCII file")
-                        self.logger.debug(msg)
-                    else:
-                        with open(ascii_anly_file, 'a') as file_handle:
-                            for anly_tiles in anly_tiles_list:
-                                file_handle.write(anly_tiles)
-                                file_handle.write('\n')
-
-                except IOError as io_error:
-                    msg = ("ERROR: Could not create requested" +
-                           " ASCII file: " + ascii_anly_file + " | ")
-                    self.logger.error(msg + io_error)
-
-                # Remove any empty directories that were created when no
-                # files were written.
-                util.prune_empty(out_dir, self.logger)
-
-                # Create the -fcst and -obs portion of the series_analysis
-                # command.
-                fcst_param_parts = ['-fcst ', ascii_fcst_file]
-                fcst_param = ''.join(fcst_param_parts)
-                obs_param_parts = ['-obs ', ascii_anly_file]
-                obs_param = ''.join(obs_param_parts)
-                self.logger.debug('fcst param: ' + fcst_param)
-                self.logger.debug('obs param: ' + obs_param)
-
-                # Create the -out portion of the series_analysis command.
-                for cur_var in self.var_list:
-                    # Get the name and level to create the -out param
-                    # and set the NAME and LEVEL environment variables that
-                    # are needed by the MET series analysis binary.
-                    match = re.match(r'(.*)/(.*)', cur_var)
-                    name = match.group(1)
-                    level = match.group(2)
-                    os.environ['NAME'] = name
-                    os.environ['LEVEL'] = level
-
-                    # Set the NAME environment to <name>_<level> format if
-                    # regridding method is to be done with the MET tool
-                    # regrid_data_plane (which is  indicated in the
-                    # config/param file).
-                    if self.regrid_with_met_tool:
-                        os.environ['NAME'] = name + '_' + level
-                    out_param_parts = ['-out ', out_dir, '/series_F',
-                                       cur_beg_str, '_to_F', cur_end_str,
-                                       '_', name, '_', level, '.nc']
-                    out_param = ''.join(out_param_parts)
+                fcst_tiles_list.extend(tile_index.get(('FCST', cur_fhr), []))
+                anly_tiles_list.extend(tile_index.get(('ANLY', cur_fhr), []))
+
+            # Location of "grouped" FCST_FILES_Fhhh and ANLY_FILES_Fhhh
+            ascii_fcst_file_parts = [out_dir, '/FCST_FILES_F',
+                                     cur_beg_str + '_to_F' + cur_end_str]
+            ascii_anly_file_parts = [out_dir, '/ANLY_FILES_F',
+                                     cur_beg_str + '_to_F' + cur_end_str]
+            ascii_fcst_file = ''.join(ascii_fcst_file_parts)
+            ascii_anly_file = ''.join(ascii_anly_file_parts)
+
+            # Create the FCST and ANLY ASCII files that are the args
+            # to the -fcst and -obs portion of the series_analysis
+            # command.
 
-                    # Create the full series analysis command.
-                    config_param_parts = ['-config ',
-                                          self.series_anly_configuration_file]
-                    config_param = ''.join(config_param_parts)
-                    series_analysis_cmd_parts = [self.series_analysis_exe, ' ',
-                                                 ' -v 4 ', fcst_param, ' ',
-                                                 obs_param, ' ', config_param,
-                                                 ' ', out_param]
-                    series_analysis_cmd = ''.join(series_analysis_cmd_parts)
-                    msg = ("INFO:[ " + cur_filename + ":" +
-                           cur_function + "]|series analysis command: " +
-                           series_analysis_cmd)
+            # For FCST
+            try:
+                if not fcst_tiles_list:
+                    msg = ("INFO|[" + cur_filename + ":" +
+                           cur_function +
+                           " No fcst_tiles for fhr group: " + cur_beg_str +
+                           " to " + cur_end_str +
+                           " Don't create FCST_F<fhr> ASCII file")
                     self.logger.debug(msg)
-                    series_analysis_cmd = batchexe('sh')[
-                        '-c', series_analysis_cmd].err2out()
-                    run(series_analysis_cmd)
+                else:
+                    with open(ascii_fcst_file, 'a') as file_handle:
+                        for fcst_tiles in fcst_tiles_list:
+                            file_handle.write(fcst_tiles)
+                            file_handle.write('\n')
+            except IOError as io_error:
+                msg = ("ERROR: Could not create requested" +
+                       " ASCII file: " + ascii_fcst_file + " | ")
+                self.logger.error(msg + str(io_error))
 
-                    # Clean up any empty files and directories that still
-                    # persist.
-                    util.prune_empty(self.series_lead_out_dir, self.logger)
+            # For ANLY
+            try:
+                if not anly_tiles_list:
+                    msg = ("INFO|[" + cur_filename + ":" +
+                           cur_function +
+                           " No anly_tiles for fhr group: " +
+                           str(cur_beg) + " to " + str(cur_end) +
+                           " Don't create ANLY_F<fhr> ASCII file")
+                    self.logger.debug(msg)
+                else:
+                    with open(ascii_anly_file, 'a') as file_handle:
+                        for anly_tiles in anly_tiles_list:
+                            file_handle.write(anly_tiles)
+                            file_handle.write('\n')
+
+            except IOError as io_error:
+                msg = ("ERROR: Could not create requested" +
+                       " ASCII file: " + ascii_anly_file + " | ")
+                self.logger.error(msg + str(io_error))
+
+            # Remove any empty directories that were created when no
+            # files were written.
+            util.prune_empty(out_dir, self.logger)
+
+            # Create the -fcst and -obs portion of the series_analysis
+            # command.
+            fcst_param_parts = ['-fcst ', ascii_fcst_file]
+            fcst_param = ''.join(fcst_param_parts)
+            obs_param_parts = ['-obs ', ascii_anly_file]
+            obs_param = ''.join(obs_param_parts)
+            self.logger.debug('fcst param: ' + fcst_param)
+            self.logger.debug('obs param: ' + obs_param)
+
+            # Create the -out portion of the series_analysis command.
+            for cur_var in self.var_list:
+                # Get the name and level to create the -out param
+                # and set the NAME and LEVEL environment variables that
+                # are needed by the MET series analysis binary.
+                match = re.match(r'(.*)/(.*)', cur_var)
+                name = match.group(1)
+                level = match.group(2)
+                os.environ['NAME'] = name
+                os.environ['LEVEL'] = level
+
+                # Set the NAME environment to <name>_<level> format if
+                # regridding method is to be done with the MET tool
+                # regrid_data_plane (which is  indicated in the
+                # config/param file).
+                if self.regrid_with_met_tool:
+                    os.environ['NAME'] = name + '_' + level
+                out_param_parts = ['-out ', out_dir, '/series_F',
+                                   cur_beg_str, '_to_F', cur_end_str,
+                                   '_', name, '_', level, '.nc']
+                out_param = ''.join(out_param_parts)
+
+                # Create the full series analysis command.
+                config_param_parts = ['-config ',
+                                      self.series_anly_configuration_file]
+                config_param = ''.join(config_param_parts)
+                series_analysis_cmd_parts = [self.series_analysis_exe, ' ',
+                                             ' -v 4 ', fcst_param, ' ',
+                                             obs_param, ' ', config_param,
+                                             ' ', out_param]
+                series_analysis_cmd = ''.join(series_analysis_cmd_parts)
+                msg = ("INFO:[ " + cur_filename + ":" +
+                       cur_function + "]|series analysis command: " +
+                       series_analysis_cmd)
+                self.logger.debug(msg)
+                self.farm.add(series_analysis_cmd,
+                              {'NAME': os.environ['NAME'],
+                               'LEVEL': level})
+
+        self.farm.run()
+
+        # Clean up any empty files and directories that still
+        # persist.
+        util.prune_empty(self.series_lead_out_dir, self.logger)
 
     def perform_series_for_all_fhrs(self, tile_dir, start, end, step):
         """! Performs a series analysis by lead time, based on a range and
@@ -514,6 +508,7 @@ class SeriesByLeadWrapper(CommandBuilder):
         cur_filename = sys._getframe().f_code.co_filename
         cur_function = sys._getframe().f_code.co_name
 
+        tile_index = self.get_tile_index(tile_dir)
         for fhr in range(start, end, step):
             cur_fhr = str(fhr).zfill(3)
             msg = ('INFO|[' + cur_filename + ':' + cur_function +
@@ -530,9 +525,7 @@ class SeriesByLeadWrapper(CommandBuilder):
 
             # Gather all the forecast gridded tile files
             # so they can be saved in ASCII files.
-            fcst_tiles_list = self.get_anly_or_fcst_files(tile_dir, "FCST",
-                                                          self.fcst_tile_regex,
-                                                          cur_fhr)
+            fcst_tiles_list = tile_index.get(('FCST', fhr), [])
             fcst_tiles = self.retrieve_fhr_tiles(fcst_tiles_list,
                                                  self.fcst_tile_regex)
 
@@ -559,9 +552,7 @@ class SeriesByLeadWrapper(CommandBuilder):
 
             # Gather all the anly gridded tile files
             # so they can be saved in ASCII files.
-            anly_tiles_list = self.get_anly_or_fcst_files(tile_dir, "ANLY",
-                                                          self.anly_tile_regex,
-                                                          cur_fhr)
+            anly_tiles_list = tile_index.get(('ANLY', fhr), [])
             anly_tiles = self.retrieve_fhr_tiles(anly_tiles_list,
                                                  self.anly_tile_regex)
 
@@ -633,12 +624,13 @@ class SeriesByLeadWrapper(CommandBuilder):
                        cur_function + "]|series analysis command: " +
                        series_analysis_cmd)
                 self.logger.debug(msg)
-                series_analysis_cmd = \
-                    batchexe('sh')['-c', series_analysis_cmd].err2out()
-                run(series_analysis_cmd)
+                self.farm.add(series_analysis_cmd,
+                              {'NAME': os.environ['NAME'], 'LEVEL': level})
 
-                # Make sure there aren't any emtpy
-                # files or directories that still persist.
+        self.farm.run()
+
+        # Make sure there aren't any emtpy
+        # files or directories that still persist.
         util.prune_empty(self.series_lead_out_dir, self.logger)
 
     def get_nseries(self, do_fhr_by_range, nc_var_file):
@@ -1024,61 +1016,45 @@ class SeriesByLeadWrapper(CommandBuilder):
                               anly_from_fcst)
             return None
 
-    @staticmethod
-    def get_anly_or_fcst_files(filedir, file_type, filename_regex,
-                               cur_fhr):
-        """! Get all the ANLY or FCST files by walking
-            through the directories starting at filedir.
+    def get_tile_index(self, tile_dir):
+        """! Index all the FCST and ANLY tiles under tile_dir by
+            forecast hour, walking the tree only once for all the forecast
+            hours.
 
             Args:
-              @param filedir:  The topmost directory from which the
-                               search begins.
-              @param file_type:  FCST or ANLY
-              @param filename_regex:  The regular expression that
-                                      defines the naming format
-                                      of the files of interest.
-
-              @param cur_fhr:  The current forecast hour for which we need to
-                               find the corresponding file
+              @param tile_dir:  The topmost directory from which the
+                                search begins.
 
             Returns:
-                file_paths (string): a list of filenames (with full filepath)
+                tile_index (dict): sorted list of tile files (with full
+                                   filepath) for each ("FCST" or "ANLY",
+                                   forecast hour) pair
         """
-
-        file_paths = []
-
-        # Convert cur_fhr to a string that has zero padding/filling
-        cur_fhr_str = (str(cur_fhr)).zfill(3)
+        tile_regexes = [('FCST', re.compile(self.fcst_tile_regex),
+                         re.compile(r'.*FCST_TILE_F([0-9]{3}).*')),
+                        ('ANLY', re.compile(self.anly_tile_regex),
+                         re.compile(r'.*ANLY_TILE_F([0-9]{3}).*'))]
+        tile_index = {}
 
         # pylint:disable=unused-variable
-        # os.walk returns tuple, not all returned variables are used.
-
-        # Walk the tree
-        for root, directories, files in os.walk(filedir):
+        # walk returns tuple, not all returned variables are used.
+        for root, directories, files in get_file_catalog().walk(tile_dir):
             for filename in files:
-                # add it to the list only if it is a match
-                # to the specified format
-                # prog = re.compile(filename_regex)
-                match = re.match(filename_regex, filename)
-                if match:
-                    # Now match based on the current forecast hour
-                    if file_type == 'FCST':
-                        match_fhr = re.match(r'.*FCST_TILE_F([0-9]{3}).*',
-                                             match.group())
-
-                    elif file_type == 'ANLY':
-                        match_fhr = re.match(r'.*ANLY_TILE_F([0-9]{3}).*',
-                                             match.group())
-
+                for file_type, type_regex, fhr_regex in tile_regexes:
+                    # add it to the index only if it is a match
+                    # to the specified format
+                    match = type_regex.match(filename)
+                    if not match:
+                        continue
+                    match_fhr = fhr_regex.match(match.group())
                     if match_fhr:
-                        if match_fhr.group(1) == cur_fhr_str:
-                            # Join the two strings to form the full
-                            # file path.
-                            filepath = os.path.join(root, filename)
-                            file_paths.append(filepath)
-                else:
-                    continue
-        return file_paths
+                        key = (file_type, int(match_fhr.group(1)))
+                        tile_index.setdefault(key, []).append(
+                            os.path.join(root, filename))
+
+        for tiles in tile_index.values():
+            tiles.sort()
+        return tile_index
 
     def cleanup_lead_ascii(self):
         """! Remove any pre-existing FCST and ANLY ASCII files
@@ -1152,6 +1128,8 @@ class SeriesByLeadWrapper(CommandBuilder):
                    str(len(nc_list)))
             self.logger.debug(msg)
 
+        # (postscript file, convert command) for each plot
+        convert_cmds = []
         for cur_var in self.var_list:
             # Get the name and level to set the NAME and LEVEL
             # environment variables that
@@ -1256,21 +1234,31 @@ class SeriesByLeadWrapper(CommandBuilder):
                                              ' ', str(vmax)]
 
                     plot_data_plane_cmd = ''.join(plot_data_plane_parts)
-                    plot_data_plane_cmd = \
-                        batchexe('sh')['-c', plot_data_plane_cmd].err2out()
                     msg = ("INFO|[" + cur_filename + ":" +
                            cur_function + "]| plot_data_plane cmd: " +
-                           plot_data_plane_cmd.to_shell())
+                           plot_data_plane_cmd)
                     self.logger.debug(msg)
-                    run(plot_data_plane_cmd)
 
                     # Create the convert command.
                     convert_parts = [self.convert_exe, ' -rotate 90 ',
                                      ' -background white -flatten ',
                                      ps_file, ' ', png_file]
                     convert_cmd = ''.join(convert_parts)
-                    convert_cmd = batchexe('sh')['-c', convert_cmd].err2out()
-                    run(convert_cmd)
+
+                    self.farm.add(plot_data_plane_cmd,
+                                  {'NAME': os.environ['NAME'],
+                                   'LEVEL': level,
+                                   'CUR_STAT': cur_stat})
+                    convert_cmds.append((ps_file, convert_cmd))
+
+        self.farm.run()
+
+        # convert reads the postscript files, so it runs as a second
+        # stage once every plot_data_plane command has finished
+        for ps_file, convert_cmd in convert_cmds:
+            if os.path.isfile(ps_file):
+                self.farm.add(convert_cmd)
+        self.farm.run()
 
     def create_animated_gifs(self, do_fhr_by_range):
         """! Creates the animated GIF files from the .png files created in
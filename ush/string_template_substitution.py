@@ -16,6 +16,7 @@ Condition codes: Varies
 
 import re
 import datetime
+import itertools
 import time
 import calendar
 import math
@@ -465,162 +466,487 @@ class StringSub:
 
         """
 
-        cur_filename = sys._getframe().f_code.co_filename
-        cur_function = sys._getframe().f_code.co_name
-
-        # The . matches any single character except newline, and the
-        # following + matches 1 or more occurrence of preceding expression.
-        # The ? after the .+ makes it a lazy match so that it stops
-        # after the first "}" instead of continuin to match as many
-        # characters as possible
-
-        # findall searches through the string and finds all non-overlapping
-        # matches and returns the group
-        # match_list is a list with the contents being the data between the
-        # curly braces
-        match_list = re.findall('\{(.+?)\}', self.tmpl)
-
-        # finditer gets the start and end indices
-        # Iterate over each match to get the starting and ending indices
-        matches = re.finditer('\{(.+?)\}', self.tmpl)
-        match_start_end_list = []
-        for match in matches:
-            match_start_end_list.append((match.start(), match.end()))
-
-        if match_list == 0:
-            # Log and exit
-            self.logger.error("ERROR |  [" + cur_filename + ":" +
-                              cur_function + "] | " +
-                              "No matches found for template: " +
-                              self.tmpl)
-            exit(0)
-        elif len(match_list) != len(match_start_end_list):
-            # Log and exit
-            self.logger.error("ERROR |  [" + cur_filename + ":" +
-                              cur_function + "] | " +
-                              "match_list and match_start_end_list should " +
-                              "have the same length for template: " +
-                              self.tmpl)
+        # The template is parsed once and kept by compile_template
+        self.tmpl = compile_template(self.tmpl).render(self.logger,
+                                                       **self.kwargs)
+        return self.tmpl
+
+
+TEMPLATE_REGEX = re.compile(r'\{(.+?)\}')
+
+TIME_KEYS = (INIT_STRING, VALID_STRING, LEAD_STRING, ACCUM_STRING)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+try:
+    STRING_TYPES = basestring
+except NameError:
+    STRING_TYPES = str
+
+# CompiledTemplate for each template string, see compile_template
+_compiled_templates = {}
+
+
+def compile_template(tmpl):
+    """ Returns the CompiledTemplate for a template string.  Each template
+        is parsed once per process. """
+    compiled = _compiled_templates.get(tmpl)
+    if compiled is None:
+        compiled = CompiledTemplate(tmpl)
+        _compiled_templates[tmpl] = compiled
+    return compiled
+
+
+def to_datetime(value):
+    """ Returns a datetime for an init or valid time given as a datetime
+        or a YYYYmmdd[HH[MM[SS]]] string """
+    if isinstance(value, datetime.datetime):
+        return value
+    return date_str_to_datetime_obj(value)
+
+
+def to_seconds(logger, value):
+    """ Returns the number of seconds for a lead or accum time given as a
+        timedelta, a number of seconds or a [H]HH[MMSS] string """
+    if isinstance(value, datetime.timedelta):
+        return value.days * 86400 + value.seconds
+    if isinstance(value, STRING_TYPES):
+        return get_lead_accum_time_seconds(logger, value)
+    return int(value)
+
+
+def to_epoch(value):
+    """ Returns the seconds since 1970 for an init or valid time given as
+        a datetime or a YYYYmmdd[HH[MM[SS]]] string """
+    return calendar.timegm(to_datetime(value).timetuple())
+
+
+def is_sequence(value):
+    """ Returns True for a list, tuple or other iterable of times, False
+        for a single time or string """
+    return hasattr(value, '__iter__') and \
+        not isinstance(value, STRING_TYPES)
+
+
+def resolve_times(logger, values):
+    """ Returns a dictionary with the init and valid times as datetimes
+        and the lead and accum times in seconds.  A missing init, valid or
+        lead time is computed from the other two, as doStringSub does. """
+    times = {}
+    for key in (INIT_STRING, VALID_STRING):
+        if values.get(key) is not None:
+            times[key] = to_datetime(values[key])
+    for key in (LEAD_STRING, ACCUM_STRING):
+        if values.get(key) is not None:
+            times[key] = to_seconds(logger, values[key])
+
+    lead = times.get(LEAD_STRING)
+    if VALID_STRING in times and lead is not None and \
+       INIT_STRING not in times:
+        times[INIT_STRING] = \
+            times[VALID_STRING] - datetime.timedelta(seconds=lead)
+    elif INIT_STRING in times and lead is not None and \
+            VALID_STRING not in times:
+        times[VALID_STRING] = \
+            times[INIT_STRING] + datetime.timedelta(seconds=lead)
+    elif INIT_STRING in times and VALID_STRING in times and lead is None:
+        times[LEAD_STRING] = \
+            to_seconds(logger, times[VALID_STRING] - times[INIT_STRING])
+    return times
+
+
+def format_hours(logger, seconds, hours_digits, with_mmss):
+    """ Formats a number of seconds as [-]HH[MMSS] or [-]HHH[MMSS], as
+        leadAccumFormat does """
+    sign = ""
+    if seconds < 0:
+        sign = "-"
+        seconds = -seconds
+    hours, seconds = divmod(int(seconds), SECONDS_PER_HOUR)
+    minutes, seconds = divmod(seconds, SECONDS_PER_MINUTE)
+    hours_str = str(hours).zfill(hours_digits)
+    if len(hours_str) > hours_digits and logger is not None:
+        logger.warn("WARN | The requested format for hours was " +
+                    "H" * hours_digits + " but the hours given are " +
+                    hours_str + ". Returning a " + str(len(hours_str)) +
+                    " digit hour.")
+    if with_mmss:
+        hours_str += str(minutes).zfill(TWO_DIGIT_PAD) + \
+            str(seconds).zfill(TWO_DIGIT_PAD)
+    return sign + hours_str
+
+
+def parse_hours(text, with_mmss):
+    """ Returns the number of seconds for a lead or accum time written by
+        format_hours as [-]H..H or [-]H..HMMSS """
+    sign = 1
+    if text.startswith("-"):
+        sign = -1
+        text = text[1:]
+    if not with_mmss:
+        return sign * int(text) * SECONDS_PER_HOUR
+    return sign * (int(text[:-4]) * SECONDS_PER_HOUR +
+                   int(text[-4:-2]) * SECONDS_PER_MINUTE + int(text[-2:]))
+
+
+# regular expression for the text each strftime directive writes, used to
+# parse file names.  Directives not listed here match any text.
+TIME_DIRECTIVES = {'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{2}',
+                   'd': r'\d{2}', 'j': r'\d{3}', 'H': r'\d{2}',
+                   'M': r'\d{2}', 'S': r'\d{2}'}
+
+
+def parts_to_datetime(parts):
+    """ Returns the datetime for the strftime fields read from a file
+        name, e.g. {'Y': 2017, 'm': 5, 'd': 9}, or None if there is no
+        year or the date does not exist """
+    if 'Y' in parts:
+        year = parts['Y']
+    elif 'y' in parts:
+        # same century rule as strptime
+        year = parts['y'] + (1900 if parts['y'] >= 69 else 2000)
+    else:
+        return None
+    try:
+        if 'j' in parts:
+            day = datetime.datetime(year, 1, 1) + \
+                datetime.timedelta(days=parts['j'] - 1)
+        else:
+            day = datetime.datetime(year, parts.get('m', 1),
+                                    parts.get('d', 1))
+        return day.replace(hour=parts.get('H', 0), minute=parts.get('M', 0),
+                           second=parts.get('S', 0))
+    except ValueError:
+        return None
+
+
+class TemplateField(object):
+    """ One {key} or {key?fmt=...} place-holder of a CompiledTemplate.
+        The formatter for the key and format is chosen when the template
+        is compiled. """
+
+    def __init__(self, text):
+        self.text = TEMPLATE_IDENTIFIER_BEGIN + text + TEMPLATE_IDENTIFIER_END
+        split_string = text.split(FORMATTING_DELIMITER)
+        self.key = split_string[0]
+        self.fmt = None
+        self.render = self.render_value
+        if len(split_string) == 1:
+            if self.key in (INIT_STRING, VALID_STRING):
+                self.render = self.render_time
+            elif self.key in (LEAD_STRING, ACCUM_STRING):
+                self.render = self.render_hours
+                self.hours_digits = TWO_DIGIT_PAD
+                self.with_mmss = True
+            return
+
+        format_split_string = split_string[1].split(FORMATTING_VALUE_DELIMITER)
+        if len(split_string) != 2 or \
+           format_split_string[0] != FORMAT_STRING or \
+           self.key not in (INIT_STRING, VALID_STRING, LEAD_STRING,
+                            ACCUM_STRING):
+            # left in place, as doStringSub does
+            self.render = self.render_unchanged
+            return
+
+        self.fmt = format_split_string[1]
+        if self.key in (INIT_STRING, VALID_STRING):
+            self.render = self.render_time
+            return
+
+        self.render = self.render_hours
+        format_string_split = \
+            self.fmt.split(LEAD_ACCUM_FORMATTING_DELIMITER)
+        self.with_mmss = len(format_string_split) == 3
+        self.hours_digits = None
+        if len(format_string_split) in (2, 3):
+            self.hours_digits = {'HH': TWO_DIGIT_PAD,
+                                 'HHH': THREE_DIGIT_PAD}.get(
+                                     format_string_split[1])
+
+    def patterns(self):
+        """ Returns the pieces of a regular expression matching the text
+            this place-holder writes, as (pattern, kind) tuples.  kind
+            names the value a piece holds, or is None for text that is
+            matched but not read. """
+        if self.render == self.render_unchanged:
+            return [(re.escape(self.text), None)]
+        if self.render == self.render_value:
+            return [(r'.+?', ('value', self.key))]
+        if self.render == self.render_time:
+            if self.fmt is None:
+                return [(r'\d{8}(?:\d{2}){0,3}', ('date', self.key))]
+            pieces = []
+            i = 0
+            while i < len(self.fmt):
+                char = self.fmt[i]
+                directive = self.fmt[i + 1:i + 2]
+                if char != "%" or not directive:
+                    pieces.append((re.escape(char), None))
+                    i += 1
+                    continue
+                if directive == "%":
+                    pieces.append((re.escape("%"), None))
+                elif directive in TIME_DIRECTIVES:
+                    pieces.append((TIME_DIRECTIVES[directive],
+                                   ('time', self.key, directive)))
+                else:
+                    pieces.append((r'.+?', None))
+                i += 2
+            return pieces
+        # lead and accum
+        if self.fmt is None:
+            return [(r'-?\d{2,7}', ('hours', self.key, None))]
+        if self.hours_digits is None:
+            return [(r'.+?', None)]
+        pattern = r'-?\d{' + str(self.hours_digits) + r',}'
+        if self.with_mmss:
+            pattern += r'\d{4}'
+        return [(pattern, ('hours', self.key, self.with_mmss))]
+
+    def missing(self, logger, tmpl):
+        if logger is not None:
+            logger.error("ERROR | The key " + self.key +
+                         " does not exist for template: " + tmpl)
+        return self.text
+
+    def render_unchanged(self, logger, tmpl, values, times):
+        return self.text
+
+    def render_value(self, logger, tmpl, values, times):
+        value = values.get(self.key)
+        if value is None:
+            return self.missing(logger, tmpl)
+        return str(value)
+
+    def render_time(self, logger, tmpl, values, times):
+        if self.key not in times:
+            return self.missing(logger, tmpl)
+        if self.fmt is None:
+            # unformatted times are written as given, or as
+            # YYYYmmddHHMMSS when given as a datetime or computed
+            value = values.get(self.key)
+            if isinstance(value, STRING_TYPES):
+                return value
+            return times[self.key].strftime("%Y%m%d%H%M%S")
+        return times[self.key].strftime(self.fmt)
+
+    def render_hours(self, logger, tmpl, values, times):
+        if self.key not in times:
+            return self.missing(logger, tmpl)
+        if self.fmt is None:
+            value = values.get(self.key)
+            if isinstance(value, STRING_TYPES):
+                return value
+        elif self.hours_digits is None:
+            if logger is not None:
+                logger.error("ERROR | The time must be in the format " +
+                             "[H]HH[MMSS], where a two digit hour is " +
+                             "required.  Providing a three digit hour, " +
+                             "two digit minutes and a two digit seconds " +
+                             "are optional.")
             exit(0)
+        return format_hours(logger, times[self.key], self.hours_digits,
+                            self.with_mmss)
+
+
+class CompiledTemplate(object):
+    """ A filename template parsed once into literal text and
+        TemplateFields, so it can be filled in many times without any
+        regular expression work.
+
+        render() takes the same keys as StringSub.  init and valid may be
+        datetimes or YYYYmmddHH[MMSS] strings, lead and accum may be
+        timedeltas, numbers of seconds or [H]HH[MMSS] strings.  As in
+        doStringSub, a missing init, valid or lead time is computed from
+        the other two, and place-holders with an unknown key or format are
+        left in the result. """
+
+    def __init__(self, tmpl):
+        self.tmpl = tmpl
+        self.segments = []
+        self.keys = set()
+        position = 0
+        for match in TEMPLATE_REGEX.finditer(tmpl):
+            if match.start() > position:
+                self.segments.append(tmpl[position:match.start()])
+            field = TemplateField(match.group(1))
+            self.segments.append(field)
+            self.keys.add(field.key)
+            position = match.end()
+        if position < len(tmpl):
+            self.segments.append(tmpl[position:])
+        # regular expression and group kinds for parse, made on first use
+        self._regex = None
+        self._groups = None
+
+    def compile_regex(self):
+        """ Returns the regular expression that matches the paths this
+            template writes, with a named group for each value in them.
+            A value written more than once must be the same each time. """
+        if self._regex is not None:
+            return self._regex
+        pattern = []
+        names = {}
+        for segment in self.segments:
+            if not isinstance(segment, TemplateField):
+                pattern.append(re.escape(segment))
+                continue
+            for piece, kind in segment.patterns():
+                if kind is None:
+                    pattern.append(piece)
+                elif kind in names:
+                    pattern.append("(?P=" + names[kind] + ")")
+                else:
+                    names[kind] = "g" + str(len(names))
+                    pattern.append("(?P<" + names[kind] + ">" + piece + ")")
+        self._groups = [(name, kind) for kind, name in names.items()]
+        self._regex = re.compile("".join(pattern) + r'\Z')
+        return self._regex
+
+    def parse(self, path):
+        """ Reads the values back out of a path this template wrote.
+
+            Returns:
+                dictionary with init and valid as datetimes, lead and accum
+                in seconds and any other keys as strings, holding only the
+                values written in the path (resolve_times fills in the
+                others), or None if the path does not match the template """
+        match = self.compile_regex().match(path)
+        if match is None:
+            return None
+        values = {}
+        time_parts = {}
+        for name, kind in self._groups:
+            text = match.group(name)
+            if kind[0] == 'value':
+                values[kind[1]] = text
+            elif kind[0] == 'date':
+                values[kind[1]] = date_str_to_datetime_obj(text)
+            elif kind[0] == 'time':
+                time_parts.setdefault(kind[1], {})[kind[2]] = int(text)
+            elif kind[2] is None:
+                sign = -1 if text.startswith("-") else 1
+                values[kind[1]] = \
+                    sign * get_lead_accum_time_seconds(None, text.lstrip("-"))
+            else:
+                values[kind[1]] = parse_hours(text, kind[2])
+        for key, parts in time_parts.items():
+            if key in values:
+                continue
+            value = parts_to_datetime(parts)
+            if value is None:
+                if 'Y' in parts or 'y' in parts:
+                    # e.g. month 13, so not a path this template wrote
+                    return None
+                continue
+            values[key] = value
+        return values
+
+    def parse_many(self, paths):
+        """ Reads the values out of each path of a directory listing with
+            one regular expression match per path.
+
+            Returns:
+                list of (path, values) for the paths that match the
+                template, in the order given """
+        results = []
+        for path in paths:
+            values = self.parse(path)
+            if values is not None:
+                results.append((path, values))
+        return results
+
+    def render(self, logger=None, **values):
+        """ Returns the template filled in with the given values """
+        times = resolve_times(logger, values)
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, TemplateField):
+                parts.append(segment.render(logger, self.tmpl, values, times))
+            else:
+                parts.append(segment)
+        return "".join(parts)
+
+    def render_many(self, logger=None, product=False, **values):
+        """ Returns the template filled in for many times in one call.
+
+            Any of init, valid, lead and accum may be a sequence.  The
+            sequences are taken element by element, or every combination
+            of them when product is True.  Other values are used for every
+            path.  Each distinct time is converted to seconds once and the
+            arithmetic between them is done on integers.  The text of
+            each place-holder is made once for each distinct time and
+            shared by every path and place-holder that needs it.
+
+            Returns:
+                list of paths, in the order of the sequences (with product,
+                the last sequence of init, valid, lead, accum varies
+                fastest) """
+        columns = [key for key in TIME_KEYS
+                   if key in values and is_sequence(values[key])]
+        sequences = [list(values[key]) for key in columns]
+        if product:
+            rows = itertools.product(*sequences)
+        elif len(set(len(sequence) for sequence in sequences)) > 1:
+            raise ValueError("The sequences of " + ", ".join(columns) +
+                             " must have the same length to render " +
+                             self.tmpl)
         else:
-            # Check for init, lead, and valid time in kwargs.
-            # If not present, compute.
-
-            # Compute init time
-            if (
-               VALID_STRING in self.kwargs and
-               LEAD_STRING in self.kwargs and
-               INIT_STRING not in self.kwargs
-               ):
-                self.kwargs[INIT_STRING] = self.dateCalcInit()
-            # Compute valid time
-            elif (
-                 INIT_STRING in self.kwargs and
-                 LEAD_STRING in self.kwargs and
-                 VALID_STRING not in self.kwargs
-                 ):
-                self.kwargs[VALID_STRING] = self.dateCalcValid()
-            # Compute lead time
-            elif (
-                 INIT_STRING in self.kwargs and
-                 VALID_STRING in self.kwargs and
-                 LEAD_STRING not in self.kwargs
-                 ):
-                self.kwargs[LEAD_STRING] = self.dateCalcLead()
-
-            # A dictionary that will contain the string to replace (key)
-            # and the string to replace it with (value)
-            replacement_dict = {}
-
-            # Search for the FORMATTING_DELIMITER within the first string
-            for index, match in enumerate(match_list):
-                split_string = match.split(FORMATTING_DELIMITER)
-
-                # valid, init, lead, etc.
-                # print split_string[0]
-                # value e.g. 2016012606, 3
-                # print (self.kwargs).get(split_string[0], None)
-
-                # Formatting is requested or length is requested
-                if len(split_string) == 2:
-
-                    # split_string[0] holds the key (e.g. "init", "valid", etc)
-                    if split_string[0] not in (self.kwargs).keys():
-                        # Log and continue
-                        self.logger.error("ERROR |  [" + cur_filename +
-                                          ":" + cur_function + "] | " +
-                                          "The key " + split_string[0] +
-                                          "does not exist for template: " +
-                                          self.tmpl)
-
-                    # Key is in the dictionary
+            rows = zip(*sequences) if sequences else [()]
+
+        # seconds for each distinct time, and text for each distinct
+        # place-holder and time
+        seconds = {}
+        texts = {}
+        row_values = dict(values)
+        paths = []
+        for row in rows:
+            row_values.update(zip(columns, row))
+            times = {}
+            for key in TIME_KEYS:
+                value = row_values.get(key)
+                if value is None:
+                    continue
+                if (key, value) not in seconds:
+                    if key in (INIT_STRING, VALID_STRING):
+                        seconds[(key, value)] = to_epoch(value)
                     else:
-                        # Check for formating/length request by splitting on
-                        # FORMATTING_VALUE_DELIMITER
-                        # split_string[1] holds the formatting/length
-                        # information (e.g. "fmt=%Y%m%d", "len=3")
-                        format_split_string = \
-                            split_string[1].split(FORMATTING_VALUE_DELIMITER)
-
-                        # Check for requested FORMAT_STRING
-                        # format_split_string[0] holds the formatting/length
-                        # value delimiter (e.g. "fmt", "len")
-                        if format_split_string[0] == FORMAT_STRING:
-                            if(
-                               split_string[0] == VALID_STRING or
-                               split_string[0] == INIT_STRING
-                               ):
-                                # Get the value of the valid, init, etc. and
-                                # convert to a datetime object with the
-                                # requested FORMAT_STRING format
-                                date_time_value = \
-                                    self.kwargs.get(split_string[0], None)
-                                dt_obj = \
-                                    date_str_to_datetime_obj(date_time_value)
-                                # Convert the dateime object back to a
-                                # string of the requested format
-                                date_time_str = \
-                                    dt_obj.strftime(format_split_string[1])
-
-                                # Add back the template identifiers to the
-                                # matched string to replace and add the
-                                # key, value pair to the dictionary
-                                string_to_replace = TEMPLATE_IDENTIFIER_BEGIN \
-                                    + match + TEMPLATE_IDENTIFIER_END
-                                replacement_dict[string_to_replace] = \
-                                    date_time_str
-
-                            elif (split_string[0] == LEAD_STRING):
-                                value = \
-                                  self.leadAccumFormat(LEAD_STRING,
-                                                       format_split_string[1])
-                                string_to_replace = TEMPLATE_IDENTIFIER_BEGIN \
-                                    + match + TEMPLATE_IDENTIFIER_END
-                                replacement_dict[string_to_replace] = value
-
-                            elif (split_string[0] == ACCUM_STRING):
-                                value = \
-                                  self.leadAccumFormat(ACCUM_STRING,
-                                                       format_split_string[1])
-                                string_to_replace = TEMPLATE_IDENTIFIER_BEGIN \
-                                    + match + TEMPLATE_IDENTIFIER_END
-                                replacement_dict[string_to_replace] = value
-
-                # No formatting or length is requested
-                elif len(split_string) == 1:
-
-                    # Add back the template identifiers to the matched
-                    # string to replace and add the key, value pair to the
-                    # dictionary
-                    string_to_replace = TEMPLATE_IDENTIFIER_BEGIN + match + \
-                        TEMPLATE_IDENTIFIER_END
-                    replacement_dict[string_to_replace] = \
-                        (self.kwargs).get(split_string[0], None)
-
-            # Replace regex with properly formatted information
-            temp_str = multiple_replace(replacement_dict, self.tmpl)
-            self.tmpl = temp_str
-            return self.tmpl
+                        seconds[(key, value)] = to_seconds(logger, value)
+                times[key] = seconds[(key, value)]
+
+            lead = times.get(LEAD_STRING)
+            if VALID_STRING in times and lead is not None and \
+               INIT_STRING not in times:
+                times[INIT_STRING] = times[VALID_STRING] - lead
+            elif INIT_STRING in times and lead is not None and \
+                    VALID_STRING not in times:
+                times[VALID_STRING] = times[INIT_STRING] + lead
+            elif INIT_STRING in times and VALID_STRING in times and \
+                    lead is None:
+                times[LEAD_STRING] = times[VALID_STRING] - times[INIT_STRING]
+
+            parts = []
+            for segment in self.segments:
+                if not isinstance(segment, TemplateField):
+                    parts.append(segment)
+                    continue
+                text_key = (segment.text, times.get(segment.key),
+                            row_values.get(segment.key))
+                text = texts.get(text_key)
+                if text is None:
+                    field_times = {}
+                    if segment.key in times:
+                        field_times[segment.key] = times[segment.key]
+                        if segment.key in (INIT_STRING, VALID_STRING):
+                            field_times[segment.key] = EPOCH + \
+                                datetime.timedelta(seconds=times[segment.key])
+                    text = segment.render(logger, self.tmpl, row_values,
+                                          field_times)
+                    texts[text_key] = text
+                parts.append(text)
+            paths.append("".join(parts))
+        return paths
 
 
 class StringExtract:
@@ -655,143 +981,13 @@ class StringExtract:
         return self.accumTime / 3600
 
     def parseTemplate(self):
-        tempLen = len(self.temp)
-        i = 0
-        idx = 0
-        yIdx = -1
-        mIdx = -1
-        dIdx = -1
-        hIdx = -1
-        lead = -1
-        accum = -1
-
-        inValid = False
-        inAccum = False
-        inLead = False
-        inInit = False
-
-        while i < tempLen:
-            if self.temp[i] == TEMPLATE_IDENTIFIER_BEGIN:
-                i += 1
-                if self.temp[i:i+len(VALID_STRING)+5] == VALID_STRING+"?fmt=":
-                    inValid = True
-                    i += 9
-                if self.temp[i:i+len(ACCUM_STRING)+5] == ACCUM_STRING+"?fmt=":
-                    inAccum = True
-                    i += 9
-                if self.temp[i:i+len(INIT_STRING)+5] == INIT_STRING+"?fmt=":
-                    inInit = True
-                    i += 8
-                if self.temp[i:i+len(LEAD_STRING)+5] == LEAD_STRING+"?fmt=":
-                    inLead = True
-                    i += 8
-            elif self.temp[i] == TEMPLATE_IDENTIFIER_END:
-                if inValid:
-                    if yIdx == -1 or mIdx == -1 or dIdx == -1:
-                        print("ERROR: Invalid valid time")
-                        exit(1)
-                    if hIdx == -1:
-                        hour = 0
-                    else:
-                        hour = int(self.fstr[hIdx:hIdx+2])
-                    self.validTime = \
-                        datetime.datetime(int(self.fstr[yIdx:yIdx+4]),
-                                          int(self.fstr[mIdx:mIdx+2]),
-                                          int(self.fstr[dIdx:dIdx+2]),
-                                          hour, 0)
-                    yIdx = -1
-                    mIdx = -1
-                    dIdx = -1
-                    hIdx = -1
-                    inValid = False
-
-                if inInit:
-                    if yIdx == -1 or mIdx == -1 or dIdx == -1:
-                        print("ERROR: Invalid init time")
-                        exit(1)
-                    if hIdx == -1:
-                        hour = 0
-                    else:
-                        hour = int(self.fstr[hIdx:hIdx+2])
-                    self.initTime = \
-                        datetime.datetime(int(self.fstr[yIdx:yIdx+4]),
-                                          int(self.fstr[mIdx:mIdx+2]),
-                                          int(self.fstr[dIdx:dIdx+2]),
-                                          hour, 0)
-                    yIdx = -1
-                    mIdx = -1
-                    dIdx = -1
-                    hIdx = -1
-                    inInit = False
-
-                elif inAccum:
-                    if accum == -1:
-                        print("ERROR: Invalid accum time")
-                        exit(1)
-                    self.accumTime = int(accum) * SECONDS_PER_HOUR
-                    accum = -1
-                    inAccum = False
-
-                elif inLead:
-                    if lead == -1:
-                        print("ERROR: Invalid lead time")
-                        exit(1)
-                    self.leadTime = int(lead) * SECONDS_PER_HOUR
-                    lead = -1
-                    inLead = False
-
-            elif inValid:
-                if self.temp[i:i+2] == "%Y":
-                    yIdx = idx
-                    idx += 4
-                    i += 1
-                elif self.temp[i:i+2] == "%m":
-                    mIdx = idx
-                    idx += 2
-                    i += 1
-                elif self.temp[i:i+2] == "%d":
-                    dIdx = idx
-                    idx += 2
-                    i += 1
-                elif self.temp[i:i+2] == "%H":
-                    hIdx = idx
-                    idx += 2
-                    i += 1
-            elif inInit:
-                if self.temp[i:i+2] == "%Y":
-                    yIdx = idx
-                    idx += 4
-                    i += 1
-                elif self.temp[i:i+2] == "%m":
-                    mIdx = idx
-                    idx += 2
-                    i += 1
-                elif self.temp[i:i+2] == "%d":
-                    dIdx = idx
-                    idx += 2
-                    i += 1
-                elif self.temp[i:i+2] == "%H":
-                    hIdx = idx
-                    idx += 2
-                    i += 1
-            elif inAccum:
-                if self.temp[i:i+4] == "%HHH":
-                    accum = self.fstr[idx:idx+3]
-                    idx += 3
-                    i += 3
-                elif self.temp[i:i+3] == "%HH":
-                    accum = self.fstr[idx:idx+2]
-                    idx += 2
-                    i += 2
-            elif inLead:
-                if self.temp[i:i+4] == "%HHH":
-                    lead = self.fstr[idx:idx+3]
-                    idx += 3
-                    i += 3
-                elif self.temp[i:i+3] == "%HH":
-                    lead = self.fstr[idx:idx+2]
-                    idx += 2
-                    i += 2
-            else:
-                idx += 1
-            i += 1
+        """ Reads the times out of the file name with the regular
+            expression of the compiled template.  The times are left
+            unset if the name does not match the template. """
+        values = compile_template(self.temp).parse(self.fstr)
+        if values is None:
+            return
+        self.validTime = values.get(VALID_STRING)
+        self.initTime = values.get(INIT_STRING)
+        self.leadTime = values.get(LEAD_STRING, -1)
+        self.accumTime = values.get(ACCUM_STRING, -1)
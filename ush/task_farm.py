@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+'''
+Program Name: task_farm.py
+Contact(s): George McCabe
+Abstract: Launches independent serial commands as one MPMD job
+History Log:  Initial version
+Usage: Used by ExtractTiles, SeriesByLead and SeriesByInit filtering
+       when USE_TASK_FARM = True
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import operator
+from functools import reduce
+import produtil.mpi_impl
+from produtil.fileop import CannotFindExe
+from produtil.mpi_impl.mpi_impl_base import MPIConfigError
+from produtil.run import batchexe, mpirun, mpiserial
+from resource_usage import run, tool_name
+from command_executor import CommandExecutor
+import tracing
+
+'''!@namespace task_farm
+@brief Collects serial commands and runs them across all MPI ranks.
+
+Some wrappers run many small independent commands in a loop:
+regrid_data_plane for every storm tile, series_analysis for every
+forecast hour and variable, plot_data_plane for every statistic.  A
+TaskFarm collects those commands with add() and launches them with
+run().  When produtil.mpi_impl detects an MPI launcher, each batch of
+TASK_FARM_RANKS commands becomes one MPMD job made of
+produtil.run.mpiserial ranks, so the launcher places one command on
+each allocated rank (srun and friends use a command file for this).
+Under no_mpi, or when the launcher cannot run serial ranks, the commands
+run in a local pool of TASK_FARM_WORKERS processes instead.
+
+Wrappers pass the commands' NAME/LEVEL/CUR_STAT settings to add()
+instead of relying on os.environ, since by the time the farm runs the
+loop that set them has moved on.  The settings are written into the
+command as export statements, which also carries them through the MPI
+launcher.
+
+When USE_TASK_FARM is False, add() runs each command immediately, the
+same way the wrappers always have.  When CommandBuilder.plan is set,
+add() adds the command to the plan instead and nothing runs.
+'''
+
+
+def _shell_quote(value):
+    return "'" + str(value).replace("'", "'\\''") + "'"
+
+
+def make_task_line(cmd, env=None):
+    """!Returns a shell command line that sets the given environment
+        variables and runs cmd
+        @param cmd the shell command to run
+        @param env optional dict of environment variables for the command"""
+    if not env:
+        return cmd
+    exports = ['export ' + name + '=' + _shell_quote(env[name])
+               for name in sorted(env)]
+    return '; '.join(exports + [cmd])
+
+
+class TaskFarm(object):
+    """!Collects serial commands and runs them as MPMD jobs, or in a local
+        pool of processes when MPI is not available"""
+    def __init__(self, p, logger):
+        self.logger = logger
+        self.enabled = p.getbool('config', 'USE_TASK_FARM', False)
+        self.ranks = p.getint('config', 'TASK_FARM_RANKS', 0)
+        self.workers = p.getint('config', 'TASK_FARM_WORKERS', 1)
+        self.tasks = []
+        self._seen = set()
+
+    def add(self, cmd, env=None):
+        """!Adds a command to the farm, or runs it now if the farm is
+            disabled.  Commands that were already added are ignored.
+            @param cmd the shell command to run
+            @param env optional dict of environment variables the command
+            needs, in addition to the current environment
+            @returns the exit status if the command ran now, else None"""
+        # command_builder imports met_util, which imports this module
+        from command_builder import CommandBuilder
+        line = make_task_line(cmd, env)
+        if CommandBuilder.plan is not None:
+            CommandBuilder.plan.add(tool_name(line), line, [], [])
+            return None
+        if not self.enabled:
+            return run(batchexe('sh')['-c', line].err2out())
+        if line in self._seen:
+            return None
+        self._seen.add(line)
+        self.tasks.append(line)
+        return None
+
+    def run(self):
+        """!Runs every command added since the last call
+            @returns list of command lines that failed.  In an MPMD job
+            every command of a failed batch is reported."""
+        tasks = self.tasks
+        self.tasks = []
+        self._seen = set()
+        if not tasks:
+            return []
+        failed = None
+        if produtil.mpi_impl.can_run_mpi():
+            failed = self._run_mpmd(tasks)
+        if failed is None:
+            failed = self._run_local(tasks)
+        for line in failed:
+            self.logger.error("ERROR: task farm command failed: " + line)
+        return failed
+
+    def _run_mpmd(self, tasks):
+        """!Runs the tasks as MPMD jobs of at most TASK_FARM_RANKS ranks
+            @returns the failed command lines, or None if the MPI
+            launcher cannot run serial programs"""
+        batch_size = self.ranks if self.ranks > 0 else len(tasks)
+        jobs = []
+        try:
+            for start in range(0, len(tasks), batch_size):
+                batch = tasks[start:start + batch_size]
+                prog = reduce(operator.add,
+                              [mpiserial(batchexe('sh')['-c', line])
+                               for line in batch])
+                jobs.append((batch, mpirun(prog, logger=self.logger)))
+        except (MPIConfigError, CannotFindExe) as e:
+            # e.g. mpiexec without the mpiserial program
+            self.logger.warning("Cannot run task farm through MPI, using "
+                                "local workers: " + str(e))
+            return None
+        failed = []
+        for batch, runner in jobs:
+            self.logger.info("Running %d commands as one MPMD job" %
+                             len(batch))
+            with tracing.span('mpmd', 'farm', ranks=len(batch)):
+                if run(runner, logger=self.logger) != 0:
+                    failed.extend(batch)
+        return failed
+
+    def _run_local(self, tasks):
+        self.logger.info("Running %d commands with %d local workers" %
+                         (len(tasks), self.workers))
+        executor = CommandExecutor(self.workers, self.logger)
+        with tracing.span('task_farm', 'farm', commands=len(tasks)):
+            for line in tasks:
+                executor.submit(line, os.environ)
+            return [job.cmd for job in executor.join()]
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+'''
+Program Name: task_graph.py
+Contact(s): George McCabe
+Abstract: Dependency-aware scheduler for the wrappers in PROCESS_LIST
+History Log:  Initial version
+Usage: Called by master_metplus.py when LOOP_METHOD = graph
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from produtil.workpool import WorkPool
+import resource_usage
+import tracing
+
+'''!@namespace task_graph
+@brief Builds a graph of (wrapper, init time) tasks and runs every task
+whose dependencies are satisfied concurrently, up to MAX_WORKERS at once.
+
+A wrapper that implements run_at_time gets one node per init time.  A
+wrapper that only implements run_all_times gets a single node that
+covers the whole run; it waits for every node of the processes listed
+before it and every later node waits for it.
+
+Dependencies between per-time nodes come from the products a wrapper
+declares with CommandBuilder.get_task_inputs and get_task_outputs.  A
+node depends on the node that produces each of its inputs, and on any
+earlier node that writes one of the same outputs.  A wrapper that does
+not declare its inputs (get_task_inputs returns None) depends on the
+previous process in PROCESS_LIST at the same init time, which is the
+same ordering LOOP_METHOD = times uses.
+'''
+
+# Node states
+WAITING = 'waiting'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class TaskNode(object):
+    """!One unit of work in a TaskGraph: a process run at a single init
+        time, or a process run over all times when init_time is None."""
+    def __init__(self, process, init_time, inputs=None, outputs=None):
+        self.process = process
+        self.init_time = init_time
+        self.inputs = inputs
+        self.outputs = outputs if outputs is not None else []
+        self.depends_on = set()
+        self.dependents = set()
+        self.state = WAITING
+        self.error = None
+
+    @property
+    def name(self):
+        if self.init_time is None:
+            return self.process + "[all times]"
+        return self.process + "[" + self.init_time + "]"
+
+    def __repr__(self):
+        return 'TaskNode(%s)' % (self.name,)
+
+
+class TaskGraph(object):
+    """!Directed acyclic graph of TaskNode objects.  Nodes must be added in
+        PROCESS_LIST order; dependencies only ever point at nodes that
+        were added earlier, so the graph cannot contain a cycle."""
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.nodes = []
+        # product key -> node that last declared it as an output
+        self.producers = {}
+        # process -> nodes for that process, in the order they were added
+        self.by_process = {}
+        self.process_order = []
+
+    def add_node(self, node):
+        """!Adds a node and wires up its dependencies on existing nodes.
+            @param node the TaskNode to add
+            @returns the node"""
+        previous = self._previous_process(node.process)
+        if node.init_time is None:
+            # run_all_times: acts as a barrier across all init times
+            for other in self.nodes:
+                self.add_edge(other, node)
+        else:
+            barrier = self._last_barrier()
+            if barrier is not None:
+                self.add_edge(barrier, node)
+            if node.inputs is None:
+                for other in self.by_process.get(previous, []):
+                    if other.init_time in (None, node.init_time):
+                        self.add_edge(other, node)
+            else:
+                for key in node.inputs:
+                    if key in self.producers:
+                        self.add_edge(self.producers[key], node)
+            # serialize nodes that write the same product
+            for key in node.outputs:
+                if key in self.producers:
+                    self.add_edge(self.producers[key], node)
+
+        for key in node.outputs:
+            self.producers[key] = node
+        if node.process not in self.by_process:
+            self.by_process[node.process] = []
+            self.process_order.append(node.process)
+        self.by_process[node.process].append(node)
+        self.nodes.append(node)
+        return node
+
+    def add_edge(self, before, after):
+        """!Makes after wait until before has completed."""
+        if before is after:
+            return
+        after.depends_on.add(before)
+        before.dependents.add(after)
+
+    def _previous_process(self, process):
+        if process in self.by_process:
+            idx = self.process_order.index(process)
+        else:
+            idx = len(self.process_order)
+        if idx == 0:
+            return None
+        return self.process_order[idx - 1]
+
+    def _last_barrier(self):
+        for node in reversed(self.nodes):
+            if node.init_time is None:
+                return node
+        return None
+
+    def ready_nodes(self):
+        """!Returns the waiting nodes whose dependencies have all
+            succeeded."""
+        return [node for node in self.nodes if node.state == WAITING and
+                all(dep.state == SUCCEEDED for dep in node.depends_on)]
+
+    def _skip_dependents(self, node):
+        stack = list(node.dependents)
+        while stack:
+            child = stack.pop()
+            if child.state != WAITING:
+                continue
+            child.state = SKIPPED
+            self._log('error', "Skipping " + child.name + " because " +
+                      node.name + " failed")
+            stack.extend(child.dependents)
+
+    def _log(self, level, msg):
+        if self.logger is not None:
+            getattr(self.logger, level)(msg)
+
+    def run(self, run_node, max_workers=1):
+        """!Runs every node in dependency order.  Nodes whose
+            dependencies are satisfied run concurrently in a pool of
+            max_workers threads.  If a node fails, the nodes that depend
+            on it are skipped and the rest of the graph keeps running.
+            @param run_node function called with a TaskNode that does the
+            work for that node.  It is called from a worker thread.
+            @param max_workers maximum number of nodes to run at once
+            @returns list of nodes that failed or were skipped"""
+        max_workers = max(1, int(max_workers))
+        done_queue = queue.Queue()
+
+        def work(node):
+            try:
+                run_node(node)
+            except (Exception, SystemExit) as e:
+                # wrappers call exit() on fatal errors; do not let that
+                # silently end the worker thread
+                node.error = e
+                if self.logger is not None:
+                    self.logger.error("ERROR: " + node.name + " failed: " +
+                                      str(e), exc_info=True)
+            done_queue.put(node)
+
+        self._log('info', "Running %d tasks with up to %d workers" %
+                  (len(self.nodes), max_workers))
+        running = 0
+        with WorkPool(max_workers, logger=self.logger) as pool:
+            while True:
+                for node in self.ready_nodes():
+                    node.state = RUNNING
+                    running += 1
+                    self._log('info', "Starting " + node.name)
+                    pool.add_work(work, [node])
+                if running == 0:
+                    break
+                node = done_queue.get()
+                running -= 1
+                if node.error is None:
+                    node.state = SUCCEEDED
+                    self._log('info', "Finished " + node.name)
+                else:
+                    node.state = FAILED
+                    self._skip_dependents(node)
+
+        return [node for node in self.nodes
+                if node.state in (FAILED, SKIPPED)]
+
+
+def build_task_graph(process_list, init_times, make_wrapper, logger=None):
+    """!Builds the TaskGraph for a PROCESS_LIST.
+        @param process_list names of the processes to run, in order
+        @param init_times init times, in the format run_at_time expects
+        @param make_wrapper function that returns a new wrapper instance
+        for a process name.  The instance is only used to ask the wrapper
+        for its inputs and outputs.
+        @returns the TaskGraph"""
+    graph = TaskGraph(logger)
+    for process in process_list:
+        wrapper = make_wrapper(process)
+        if not hasattr(wrapper, 'run_at_time'):
+            graph.add_node(TaskNode(process, None))
+            continue
+        for init_time in init_times:
+            graph.add_node(TaskNode(process, init_time,
+                                    wrapper.get_task_inputs(init_time),
+                                    wrapper.get_task_outputs(init_time)))
+    return graph
+
+
+def run_task_graph(process_list, init_times, make_wrapper, max_workers,
+                   logger=None):
+    """!Builds and runs the TaskGraph for a PROCESS_LIST.  Each node gets a
+        fresh wrapper instance from make_wrapper so that nodes running at
+        the same time do not share arguments or environment.
+        @returns list of nodes that failed or were skipped"""
+    graph = build_task_graph(process_list, init_times, make_wrapper, logger)
+    # nodes run in WorkPool threads, so pass the parent span along
+    parent_span = tracing.current_span()
+
+    def run_node(node):
+        wrapper = make_wrapper(node.process)
+        resource_usage.set_context(node.process, node.init_time)
+        with tracing.span(node.process, 'task', parent=parent_span,
+                          process=node.process, init_time=node.init_time):
+            if node.init_time is None:
+                wrapper.run_all_times()
+            else:
+                wrapper.run_at_time(node.init_time)
+                failed = wrapper.flush()
+                wrapper.clear()
+                if failed:
+                    raise RuntimeError(str(len(failed)) + " commands failed")
+
+    return graph.run(run_node, max_workers)
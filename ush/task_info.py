@@ -53,3 +53,30 @@ class TaskInfo:
       if self.valid_time is not -1 and self.lead is not -1:
           return util.shift_time(self.valid_time, -self.lead)
       return -1
+
+
+def task_info_list(p, init_time):
+    """!Returns a TaskInfo for each lead, forecast variable, accumulation
+        and observation type combination that the QPF wrappers process
+        for an init time.  Mirrors the loops in their run_at_time methods.
+        @param p the config instance
+        @param init_time init time in YYYYMMDDHHMM format"""
+    task_infos = []
+    fcst_vars = util.getlist(p.getstr('config', 'FCST_VARS'))
+    lead_seq = util.getlistint(p.getstr('config', 'LEAD_SEQ'))
+    for lead in lead_seq:
+        for fcst_var in fcst_vars:
+            accums = util.getlist(p.getstr('config', fcst_var + "_ACCUM"))
+            ob_types = util.getlist(p.getstr('config', fcst_var + "_OBTYPE"))
+            for accum in accums:
+                for ob_type in ob_types:
+                    if lead < int(accum):
+                        continue
+                    ti = TaskInfo()
+                    ti.init_time = init_time
+                    ti.lead = lead
+                    ti.fcst_var = fcst_var
+                    ti.level = accum
+                    ti.ob_type = ob_type
+                    task_infos.append(ti)
+    return task_infos
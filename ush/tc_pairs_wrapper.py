@@ -22,7 +22,7 @@ import re
 import csv
 import produtil.setup
 from produtil.run import batchexe
-from produtil.run import run
+from resource_usage import run
 from command_builder import CommandBuilder
 import met_util as util
 import config_metplus
@@ -21,7 +21,7 @@ import os
 import sys
 import produtil.setup
 from produtil.run import batchexe
-from produtil.run import checkrun
+from resource_usage import checkrun
 import met_util as util
 
 ## @namespace TcStatWrapper
@@ -7,7 +7,7 @@ import os
 import re
 import produtil.setup
 from produtil.run import batchexe
-from produtil.run import checkrun
+from resource_usage import checkrun
 from command_builder import CommandBuilder
 import met_util as util
 import config_metplus
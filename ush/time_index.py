@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+'''
+Program Name: time_index.py
+Contact(s): George McCabe
+Abstract: Index of the files of a directory by the times in their names
+History Log:  Initial version
+Usage: time_index.get_time_index(input_dir, template).closest_before(time)
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import time
+import bisect
+import collections
+import threading
+import string_template_substitution as sts
+from file_catalog import get_file_catalog
+
+'''!@namespace time_index
+@brief Answers "which file covers time X" for a directory of files named
+by a filename template.
+
+PcpCombineWrapper looked for the file closest before a time, or the
+shortest forecast valid at a time, by globbing a day directory and
+reading the times back out of every name, once for every hour of every
+accumulation.  A TemplateTimeIndex reads the directory tree once,
+parses each path with the compiled template, computes the init, valid
+and lead times each path is missing from the other two, and keeps the
+paths in lists sorted by valid time, by init time and by init time and
+lead, so each lookup is a binary search.
+
+A lookup walks the tree again through the FileCatalog if the index is
+older than REFRESH_SECONDS, or if it finds nothing and the index is older
+than MISS_REFRESH_SECONDS, so files that arrive during a realtime run are
+found.  The catalog only lists directories whose modification time
+changed and gives them a new listing object, so only the directories
+whose listing is not the one parsed before are parsed again.  The walk
+only goes as deep as the template has directories.
+
+get_time_index() returns the index shared by the wrappers of a process
+for a (directory, template) pair.
+'''
+
+'''!@var REFRESH_SECONDS
+A lookup walks the tree again if the last walk is older than this'''
+REFRESH_SECONDS = 10.0
+
+'''!@var MISS_REFRESH_SECONDS
+A lookup that finds nothing walks the tree again if the last walk is
+older than this'''
+MISS_REFRESH_SECONDS = 1.0
+
+# the sorted entries of a TemplateTimeIndex, replaced as a whole when the
+# index changes so a lookup in another thread sees one consistent set
+_Sorted = collections.namedtuple('_Sorted',
+                                 'valid valid_keys init init_keys')
+
+# one TemplateTimeIndex per process, directory and template
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_time_index(top, template):
+    """!Returns the TemplateTimeIndex of a directory and filename template
+        shared by every wrapper in this process
+        @param top the directory the template is relative to
+        @param template the filename template"""
+    key = (os.getpid(), os.path.normpath(top), template)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = TemplateTimeIndex(top, template)
+        return _indexes[key]
+
+
+class TemplateTimeIndex(object):
+    """!The files below a directory that match a filename template, sorted
+        by the times in their names"""
+    def __init__(self, top, template):
+        self.top = os.path.normpath(top)
+        self.template = sts.compile_template(template)
+        # number of directories in the template
+        self.depth = template.count('/')
+        self._lock = threading.Lock()
+        self.refresh_seconds = REFRESH_SECONDS
+        self.miss_refresh_seconds = MISS_REFRESH_SECONDS
+        # time of the last walk
+        self._refreshed = None
+        # catalog listing and parsed entries of each directory, from the
+        # last walk
+        self._dirs = {}
+        self._sorted = _Sorted([], [], [], [])
+
+    def _parse_dir(self, root, names):
+        """!Returns (valid, init, lead, path) for each name in a directory
+            that matches the template.  Times that cannot be known from
+            the name are None."""
+        relative = os.path.relpath(root, self.top)
+        if relative == os.curdir:
+            relative = ""
+        entries = []
+        for path, values in self.template.parse_many(
+                [os.path.join(relative, name) for name in names]):
+            times = sts.resolve_times(None, values)
+            entries.append((times.get(sts.VALID_STRING),
+                            times.get(sts.INIT_STRING),
+                            times.get(sts.LEAD_STRING),
+                            os.path.join(self.top, path)))
+        return entries
+
+    def refresh(self):
+        """!Parses the directories that changed since the last refresh and
+            sorts the entries again if any did"""
+        with self._lock:
+            changed = False
+            seen = set()
+            for root, dirs, listing in \
+                    get_file_catalog().walk_listings(self.top):
+                relative = os.path.relpath(root, self.top)
+                level = 0 if relative == os.curdir \
+                    else relative.count(os.sep) + 1
+                if level >= self.depth:
+                    dirs[:] = []
+                if level != self.depth:
+                    continue
+                seen.add(root)
+                cached = self._dirs.get(root)
+                if cached is not None and cached[0] is listing:
+                    continue
+                self._dirs[root] = (listing,
+                                    self._parse_dir(root, listing.names))
+                changed = True
+            for root in list(self._dirs):
+                if root not in seen:
+                    del self._dirs[root]
+                    changed = True
+            if changed:
+                self._sort()
+            self._refreshed = time.time()
+
+    def _lookup(self, lookup):
+        """!Calls lookup with the _Sorted entries, walking the tree first
+            if the index is older than refresh_seconds, and again if lookup
+            finds nothing and the index is older than miss_refresh_seconds
+            @returns the result of lookup"""
+        if self._refreshed is None or \
+           time.time() - self._refreshed > self.refresh_seconds:
+            self.refresh()
+        result = lookup(self._sorted)
+        if not result and \
+           time.time() - self._refreshed > self.miss_refresh_seconds:
+            self.refresh()
+            result = lookup(self._sorted)
+        return result
+
+    def _sort(self):
+        entries = [entry for _, dir_entries in self._dirs.values()
+                   for entry in dir_entries]
+        # (time, no lead, lead, path), so for each time the known leads
+        # come first, lowest first
+        by_valid = sorted(
+            (valid, lead is None, lead or 0, path)
+            for valid, _, lead, path in entries if valid is not None)
+        by_init = sorted(
+            (init, lead is None, lead or 0, path)
+            for _, init, lead, path in entries if init is not None)
+        self._sorted = _Sorted(by_valid, [entry[0] for entry in by_valid],
+                               by_init, [entry[0] for entry in by_init])
+
+    def _range(self, keys, entries, time):
+        start = bisect.bisect_left(keys, time)
+        end = bisect.bisect_right(keys, time, start)
+        return entries[start:end]
+
+    def paths_at_valid(self, valid):
+        """!Returns the paths valid at a time, lowest lead first
+            @param valid datetime or YYYYmmddHH[MMSS] string"""
+        valid = sts.to_datetime(valid)
+        return self._lookup(lambda index: [
+            path for _, _, _, path in
+            self._range(index.valid_keys, index.valid, valid)])
+
+    def paths_at_init(self, init):
+        """!Returns the paths initialized at a time, lowest lead first
+            @param init datetime or YYYYmmddHH[MMSS] string"""
+        init = sts.to_datetime(init)
+        return self._lookup(lambda index: [
+            path for _, _, _, path in
+            self._range(index.init_keys, index.init, init)])
+
+    def find(self, init, lead):
+        """!Returns the path for an init time and lead, or None
+            @param init datetime or YYYYmmddHH[MMSS] string
+            @param lead lead time, as accepted by sts.to_seconds"""
+        init = sts.to_datetime(init)
+        lead = sts.to_seconds(None, lead)
+        return self._lookup(lambda index: self._find(index, init, lead))
+
+    def _find(self, index, init, lead):
+        for _, no_lead, entry_lead, path in self._range(
+                index.init_keys, index.init, init):
+            if not no_lead and entry_lead == lead:
+                return path
+        return None
+
+    def lowest_lead_at_valid(self, valid, leads=None):
+        """!Returns the path of the shortest forecast valid at a time, which
+            is the one with the latest init time, or None if there is none
+            @param valid datetime or YYYYmmddHH[MMSS] string
+            @param leads optional lead times, as accepted by
+            sts.to_seconds.  Forecasts with other leads are skipped."""
+        valid = sts.to_datetime(valid)
+        if leads is not None:
+            leads = set(sts.to_seconds(None, lead) for lead in leads)
+        return self._lookup(
+            lambda index: self._lowest_lead_at_valid(index, valid, leads))
+
+    def _lowest_lead_at_valid(self, index, valid, leads):
+        for _, no_lead, lead, path in self._range(index.valid_keys,
+                                                  index.valid, valid):
+            if no_lead:
+                break
+            if leads is None or lead in leads:
+                return path
+        return None
+
+    def closest_before(self, time, earliest=None):
+        """!Returns the path with the latest valid time before a time, or
+            None if there is none
+            @param time datetime or YYYYmmddHH[MMSS] string
+            @param earliest optional datetime or string; paths valid
+            before it are not returned"""
+        time = sts.to_datetime(time)
+        if earliest is not None:
+            earliest = sts.to_datetime(earliest)
+        return self._lookup(
+            lambda index: self._closest_before(index, time, earliest))
+
+    def _closest_before(self, index, time, earliest):
+        position = bisect.bisect_left(index.valid_keys, time)
+        if position == 0:
+            return None
+        valid = index.valid_keys[position - 1]
+        if earliest is not None and valid < earliest:
+            return None
+        # the last of the paths with that valid time, as a search of a
+        # sorted listing would find
+        return self._range(index.valid_keys, index.valid, valid)[-1][3]
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+'''
+Program Name: tracing.py
+Contact(s): George McCabe
+Abstract: Records timed spans for processes, init times and commands
+History Log:  Initial version
+Usage: Enabled with TRACE = True
+Parameters: None
+Input Files: N/A
+Output Files: TRACE_FILE (Chrome trace event JSON) and a CSV next to it
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import csv
+import glob
+import json
+import time
+import threading
+
+'''!@namespace tracing
+@brief Spans for master_metplus, each wrapper, each run_at_time call and
+each command, exported for a trace viewer.
+
+A span is opened with a "with tracing.span(name, **attributes)" block.
+Spans opened in the same thread nest, and each span inherits the
+attributes of the span it is nested in, so a command span carries the
+init time, lead, storm id or variable of the loop that ran it.  Work
+handed to another thread passes the parent span explicitly.
+
+When TRACE is True, master_metplus writes every span to TRACE_FILE in
+the Chrome trace event format, which chrome://tracing and Perfetto can
+open, and to a flat CSV with the same name and a .csv extension.  Worker
+processes of LOOP_METHOD = parallel_times write their spans to part
+files next to TRACE_FILE, which are merged into the export.
+
+When TRACE is False, span() returns a shared object that does nothing.
+'''
+
+CSV_FIELDS = ['span_id', 'parent_id', 'name', 'category', 'pid', 'tid',
+              'start', 'end', 'seconds', 'attributes']
+
+# the Tracer of this process, or None if TRACE is False
+_tracer = None
+
+# stack of open spans in the current thread
+_local = threading.local()
+
+
+def start_tracing(p, new=True):
+    """!Starts recording spans if TRACE is True
+        @param p the config instance
+        @param new True to start a new trace, False for a worker process
+        that adds to the trace its parent started
+        @returns the Tracer, or None"""
+    global _tracer
+    if not p.getbool('config', 'TRACE', False):
+        _tracer = None
+        return None
+    _tracer = Tracer(p.getstr('config', 'TRACE_FILE'))
+    if new:
+        _tracer.reset()
+    return _tracer
+
+
+def get_tracer():
+    """!Returns the Tracer of this process, or None"""
+    return _tracer
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current_span():
+    """!Returns the innermost open span of this thread, or None"""
+    stack = _stack()
+    if stack:
+        return stack[-1]
+    return None
+
+
+def span(name, category='metplus', parent=None, **attributes):
+    """!Returns a Span to use in a "with" block
+        @param name name shown in the trace viewer
+        @param category process, init_time, task or command
+        @param parent parent span, if the block runs in a different
+        thread than its parent.  Defaults to the current span.
+        @param attributes init_time, lead, storm_id, var, cmd, ..."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, category, parent, attributes)
+
+
+class _NullSpan(object):
+    """!Span returned when tracing is off"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    """!One timed block of work"""
+    def __init__(self, tracer, name, category, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.attributes = attributes
+        self.span_id = None
+        self.start = None
+        self.end = None
+        self.tid = None
+
+    def set(self, **attributes):
+        """!Adds attributes to the span"""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        if self.parent is None:
+            self.parent = current_span()
+        if self.parent is not None:
+            inherited = dict(self.parent.attributes)
+            inherited.pop('cmd', None)
+            inherited.update(self.attributes)
+            self.attributes = inherited
+        self.span_id = self.tracer.next_id()
+        self.tid = threading.current_thread().ident
+        _stack().append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.end = time.time()
+        if type is not None:
+            self.attributes['error'] = type.__name__
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.tracer.add(self)
+
+    def as_record(self):
+        return {'span_id': self.span_id,
+                'parent_id': self.parent.span_id if self.parent else '',
+                'name': self.name,
+                'category': self.category,
+                'pid': os.getpid(),
+                'tid': self.tid,
+                'start': self.start,
+                'end': self.end,
+                'attributes': self.attributes}
+
+
+class Tracer(object):
+    """!Collects the spans of this process"""
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._count = 0
+        self._records = []
+
+    def _part_file(self):
+        return '%s.%d.part' % (self.filename, os.getpid())
+
+    def reset(self):
+        """!Removes part files left by an earlier run"""
+        for part in glob.glob(self.filename + '.*.part'):
+            os.remove(part)
+
+    def next_id(self):
+        with self._lock:
+            self._count += 1
+            return '%d.%d' % (os.getpid(), self._count)
+
+    def add(self, finished):
+        """!Records a finished span"""
+        record = finished.as_record()
+        with self._lock:
+            self._records.append(record)
+
+    def save(self):
+        """!Appends the spans finished since the last save to this
+            process's part file"""
+        with self._lock:
+            records = self._records
+            self._records = []
+        if not records:
+            return
+        parent = os.path.dirname(self.filename)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with open(self._part_file(), 'a') as part_file:
+            for record in records:
+                part_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def read(self):
+        """!Returns every saved span of this run, from all processes"""
+        records = []
+        for part in sorted(glob.glob(self.filename + '.*.part')):
+            with open(part) as part_file:
+                records.extend(json.loads(line) for line in part_file)
+        records.sort(key=lambda record: record['start'])
+        return records
+
+    def export(self):
+        """!Saves this process's spans, then writes every span of the run
+            as Chrome trace events and as CSV and removes the part files
+            @returns the paths of the JSON and CSV files"""
+        self.save()
+        records = self.read()
+        events = []
+        for pid in sorted(set(record['pid'] for record in records)):
+            name = 'master_metplus' if pid == os.getpid() else 'worker'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                           'args': {'name': '%s (%d)' % (name, pid)}})
+        for record in records:
+            events.append({'name': record['name'],
+                           'cat': record['category'],
+                           'ph': 'X',
+                           'ts': int(record['start'] * 1e6),
+                           'dur': int((record['end'] - record['start']) *
+                                      1e6),
+                           'pid': record['pid'],
+                           'tid': record['tid'],
+                           'args': record['attributes']})
+        with open(self.filename, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      trace_file)
+
+        csv_filename = os.path.splitext(self.filename)[0] + '.csv'
+        with open(csv_filename, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(CSV_FIELDS)
+            for record in records:
+                attributes = ';'.join(
+                    '%s=%s' % (key, record['attributes'][key])
+                    for key in sorted(record['attributes']))
+                writer.writerow([record['span_id'], record['parent_id'],
+                                 record['name'], record['category'],
+                                 record['pid'], record['tid'],
+                                 '%.6f' % record['start'],
+                                 '%.6f' % record['end'],
+                                 '%.6f' % (record['end'] - record['start']),
+                                 attributes])
+        self.reset()
+        return self.filename, csv_filename
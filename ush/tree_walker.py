@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+'''
+Program Name: tree_walker.py
+Contact(s): George McCabe
+Abstract: Walks directory trees, reading directories in parallel threads
+History Log:  Initial version
+Usage: tree_walker.walk(top) in place of os.walk(top)
+Parameters: None
+Input Files: N/A
+Output Files: N/A
+'''
+
+from __future__ import (print_function, division)
+
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport of os.scandir for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+'''!@namespace tree_walker
+@brief os.walk with the directory reads spread over a pool of threads.
+
+On parallel file systems such as Lustre and GPFS each directory read
+waits several milliseconds for the metadata server, and os.walk reads one
+directory at a time.  walk() hands the directories to WALK_THREADS
+threads, so the subdirectories of a directory, such as the YYYYMMDD or
+storm directories of a tile tree, are read many at a time.  With scandir
+the file type comes from the directory entry (d_type), so files are not
+stat'ed; only links are, to see whether they point to a directory.
+
+By default walk() yields the same (dirpath, dirnames, filenames) tuples
+as os.walk, top down with the names sorted, and like os.walk it does not
+descend into directories the caller removes from dirnames.  The
+subdirectories are only queued for reading once the caller has seen,
+and possibly pruned, their parent, so pruned directories are never
+read.  With ordered=False every subdirectory is queued as soon as its
+parent has been read and the tuples are yielded as the reads finish,
+which starts sooner on large trees but cannot be pruned.  Directories
+that cannot be read are skipped, as os.walk does.
+
+configure() sets the number of threads from WALK_THREADS.  With one
+thread, the default, walk() reads the tree in the calling thread.
+FileCatalog walks with walk(), and prune_empty(full_scan=True) reverses
+it for its bottom-up pass.
+'''
+
+# number of threads walk() uses, set from WALK_THREADS by configure()
+_workers = 1
+
+
+def configure(p):
+    """!Sets the number of threads walk() uses from WALK_THREADS
+        @param p the config instance"""
+    global _workers
+    _workers = max(1, p.getint('config', 'WALK_THREADS', 1))
+
+
+def get_workers():
+    """!Returns the number of threads walk() uses by default"""
+    return _workers
+
+
+def scan_dir(path, followlinks=False):
+    """!Reads one directory
+        @param path the directory
+        @param followlinks True to walk into links to directories
+        @returns tuple of (sorted subdirectory names, sorted file names,
+        names of the subdirectories to walk into)"""
+    dirs = []
+    files = []
+    walk_dirs = []
+    if scandir is not None:
+        entries = [(entry.name, entry) for entry in scandir(path)]
+    else:
+        entries = [(name, None) for name in os.listdir(path)]
+    for name, entry in entries:
+        try:
+            if entry is not None:
+                is_dir = entry.is_dir()
+                is_link = is_dir and entry.is_symlink()
+            else:
+                full_path = os.path.join(path, name)
+                is_dir = os.path.isdir(full_path)
+                is_link = is_dir and os.path.islink(full_path)
+        except OSError:
+            is_dir = is_link = False
+        if not is_dir:
+            files.append(name)
+            continue
+        dirs.append(name)
+        if followlinks or not is_link:
+            walk_dirs.append(name)
+    dirs.sort()
+    files.sort()
+    walk_dirs.sort()
+    return dirs, files, walk_dirs
+
+
+def walk(top, workers=None, ordered=True, followlinks=False, scan=None):
+    """!Generates (dirpath, dirnames, filenames) for each directory in
+        the tree, like os.walk
+        @param top the topmost directory
+        @param workers number of threads, or None for WALK_THREADS
+        @param ordered True to yield top down in sorted order, False to
+        yield each directory as soon as it has been read
+        @param followlinks True to walk into links to directories
+        @param scan function that reads a directory, with the arguments
+        and return value of scan_dir, for callers that cache listings"""
+    if scan is None:
+        def scan(path):
+            return scan_dir(path, followlinks)
+    if workers is None:
+        workers = _workers
+    if workers <= 1:
+        for result in _serial_walk(top, scan):
+            yield result
+        return
+
+    walker = _ParallelWalk(top, workers, scan, eager=not ordered)
+    try:
+        if ordered:
+            results = walker.ordered(top)
+        else:
+            results = walker.unordered()
+        for result in results:
+            yield result
+    finally:
+        walker.stop()
+
+
+def _serial_walk(top, scan):
+    try:
+        dirs, files, walk_dirs = scan(top)
+    except OSError:
+        return
+    yield top, dirs, files
+    walk_dirs = set(walk_dirs)
+    for name in dirs:
+        if name in walk_dirs:
+            for result in _serial_walk(os.path.join(top, name), scan):
+                yield result
+
+
+class _Read(object):
+    """!One directory read, which the walk waits for"""
+    def __init__(self, path):
+        self.path = path
+        self.result = None
+        self.done = threading.Event()
+
+
+class _ParallelWalk(object):
+    """!Reads a tree with a pool of threads.  With eager set, each
+        subdirectory is queued as soon as its parent has been read;
+        otherwise ordered() queues them after yielding the parent."""
+    def __init__(self, top, workers, scan, eager):
+        self._scan = scan
+        self._eager = eager
+        self._todo = queue.Queue()
+        self._finished = queue.Queue()
+        self._lock = threading.Lock()
+        self._reads = {}
+        self._queued = 0
+        self._stopped = False
+        self._queue(top)
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _queue(self, path):
+        read = _Read(path)
+        with self._lock:
+            self._reads[path] = read
+            self._queued += 1
+        self._todo.put(read)
+
+    def _work(self):
+        while True:
+            read = self._todo.get()
+            if read is None or self._stopped:
+                return
+            try:
+                dirs, files, walk_dirs = self._scan(read.path)
+            except OSError:
+                pass
+            else:
+                # queue the subdirectories before the parent is reported
+                # finished, so unordered() knows there is more to come
+                if self._eager:
+                    for name in walk_dirs:
+                        self._queue(os.path.join(read.path, name))
+                read.result = (dirs, files, set(walk_dirs))
+            read.done.set()
+            self._finished.put(read)
+
+    def ordered(self, top):
+        with self._lock:
+            read = self._reads.pop(top)
+        read.done.wait()
+        if read.result is None:
+            return
+        dirs, files, walk_dirs = read.result
+        yield top, dirs, files
+        # the caller may have removed names from dirs, so the children
+        # are queued only now, all at once so they are read in parallel
+        children = [os.path.join(top, name) for name in dirs
+                    if name in walk_dirs]
+        for path in children:
+            self._queue(path)
+        for path in children:
+            for result in self.ordered(path):
+                yield result
+
+    def unordered(self):
+        reported = 0
+        while True:
+            with self._lock:
+                if reported == self._queued:
+                    return
+            read = self._finished.get()
+            reported += 1
+            if read.result is not None:
+                yield read.path, read.result[0], read.result[1]
+
+    def stop(self):
+        """!Ends the threads once they finish their current read"""
+        self._stopped = True
+        for _ in self._threads:
+            self._todo.put(None)